@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Benchmark of the deptool.py commands on synthetic workspaces.
+
+A DEPENDENCIES file is generated with local bare git repositories,
+tar.gz and zip archives and path trees of configurable sizes, then the
+extract, update, dump_actual and digest phases are timed end to end,
+each in a fresh workspace for the given number of iterations.
+The dump_actual and digest phases start without workspace state, thus
+collect the actual revisions, the dump_actual_state phase then answers
+from the state recorded by dump_actual.
+The results are output as json, for instance:
+  benchmark.py --git 20 --archives 4 --paths 4 --output bench.json
+
+The configurations of the generated DEPENDENCIES file are:
+  default: all the components
+  digest: the archives and paths components, for which dump_actual
+  computes the content digests
+"""
+
+import os, sys, time, shutil, tempfile, platform
+import argparse, json, tarfile, zipfile
+from subprocess import check_call, Popen, PIPE
+
+deptool = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deptool.py")
+
+class Generator:
+    """ Generates the synthetic components under the root directory. """
+    def __init__(self, root, opts):
+        self.root = root
+        self.opts = opts
+        self.devnull = open(os.devnull, "w")
+        self.serial = 0
+
+    def _git(self, cwd, args):
+        check_call(['git'] + args, cwd=cwd, stdout=self.devnull)
+
+    def _content(self, size):
+        self.serial += 1
+        line = "deptools benchmark content %d\n" % self.serial
+        return (line * (size / len(line) + 1))[:size]
+
+    def _tree(self, path, files, size):
+        """ Creates files spread over sub directories of 16 files. """
+        for i in range(files):
+            dirname = os.path.join(path, "d%03d" % (i / 16))
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            stream = open(os.path.join(dirname, "f%03d.txt" % i), "w")
+            try:
+                stream.write(self._content(size))
+            finally:
+                stream.close()
+
+    def git_repository(self, name):
+        work = os.path.join(self.root, "src", name)
+        bare = os.path.join(self.root, "repos", name + ".git")
+        self._tree(work, self.opts.git_files, self.opts.file_size)
+        self._git(work, ['init', '-q'])
+        self._git(work, ['add', '.'])
+        self._git(work, ['commit', '-q', '-m', 'Initial tree'])
+        self._git(work, ['clone', '-q', '--bare', '.', bare])
+        self._git(work, ['remote', 'add', 'origin', bare])
+        return { 'format': 'git', 'repos': bare, 'label': 'master' }
+
+    def git_commit(self, name):
+        """ Pushes a new commit to the repository, for the update phase. """
+        work = os.path.join(self.root, "src", name)
+        self._tree(os.path.join(work, "u%d" % self.serial), 1, self.opts.file_size)
+        self._git(work, ['add', '.'])
+        self._git(work, ['commit', '-q', '-m', 'Update'])
+        self._git(work, ['push', '-q', 'origin', 'HEAD:master'])
+
+    def archive(self, name, format):
+        tree = os.path.join(self.root, "src", name)
+        self._tree(os.path.join(tree, name), self.opts.archive_files,
+                   self.opts.file_size)
+        archive = os.path.join(self.root, "archives", name + "." + format)
+        if not os.path.isdir(os.path.dirname(archive)):
+            os.makedirs(os.path.dirname(archive))
+        if format == "zip":
+            output = zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED)
+            try:
+                for dirpath, dirnames, filenames in os.walk(tree):
+                    for filename in filenames:
+                        path = os.path.join(dirpath, filename)
+                        output.write(path, os.path.relpath(path, tree))
+            finally:
+                output.close()
+        else:
+            output = tarfile.open(archive, "w:gz")
+            try:
+                output.add(os.path.join(tree, name), name)
+            finally:
+                output.close()
+        return { 'format': 'tar', 'repos': archive, 'alias': name,
+                 'skip_dirs': 1 }
+
+    def path(self, name):
+        tree = os.path.join(self.root, "paths", name)
+        self._tree(tree, self.opts.path_files, self.opts.file_size)
+        return { 'format': 'path', 'repos': tree }
+
+    def dependencies(self):
+        repositories = {}
+        digest = []
+        for i in range(self.opts.git):
+            repositories["git%03d" % i] = self.git_repository("git%03d" % i)
+        formats = self.opts.archive_formats.split(",")
+        for i in range(self.opts.archives):
+            name = "archive%03d" % i
+            repositories[name] = self.archive(name, formats[i % len(formats)])
+            digest.append(name)
+        for i in range(self.opts.paths):
+            name = "path%03d" % i
+            repositories[name] = self.path(name)
+            digest.append(name)
+        return { 'configurations': { 'default': sorted(repositories.keys()),
+                                     'digest': digest },
+                 'repositories': repositories }
+
+
+class Benchmark:
+    phases_ = [ "extract", "update", "dump_actual", "dump_actual_state", "digest" ]
+
+    def __init__(self, root, opts):
+        self.root = root
+        self.opts = opts
+        self.generator = Generator(root, opts)
+        self.dep_file = os.path.join(root, "DEPENDENCIES")
+
+    def _deptool(self, workspace, args):
+        """ Runs deptool.py in workspace and returns the wall time. """
+        start = time.time()
+        proc = Popen([sys.executable, deptool, '-f', self.dep_file] + args,
+                     cwd=workspace, stdout=PIPE, stderr=PIPE)
+        output = proc.communicate()
+        elapsed = time.time() - start
+        if proc.returncode != 0:
+            raise Exception("deptool.py %s failed with status %d:\n%s" % \
+                                (" ".join(args), proc.returncode, output[1]))
+        return elapsed
+
+    def setup(self):
+        deps = self.generator.dependencies()
+        stream = open(self.dep_file, "w")
+        try:
+            # Json is a subset of yaml
+            json.dump(deps, stream, indent=2, sort_keys=True)
+        finally:
+            stream.close()
+        self.git_names = [name for name in deps['repositories'].keys()
+                          if name.startswith("git")]
+
+    @staticmethod
+    def _remove_state(workspace):
+        path = os.path.join(workspace, ".deptools", "state")
+        if os.path.exists(path):
+            os.remove(path)
+
+    def iteration(self, index):
+        workspace = os.path.join(self.root, "workspace%d" % index)
+        os.makedirs(workspace)
+        times = {}
+        times["extract"] = self._deptool(workspace, ['extract'])
+        for name in self.git_names:
+            self.generator.git_commit(name)
+        times["update"] = self._deptool(workspace, ['update'])
+        self._remove_state(workspace)
+        times["dump_actual"] = self._deptool(workspace, ['dump_actual'])
+        times["dump_actual_state"] = self._deptool(workspace, ['dump_actual'])
+        self._remove_state(workspace)
+        times["digest"] = self._deptool(workspace, ['-c', 'digest', 'dump_actual'])
+        if not self.opts.keep:
+            shutil.rmtree(workspace)
+        return times
+
+    def run(self):
+        start = time.time()
+        self.setup()
+        setup_time = time.time() - start
+        iterations = []
+        for index in range(self.opts.iterations):
+            iterations.append(self.iteration(index))
+        results = []
+        for phase in self.phases_:
+            times = sorted([x[phase] for x in iterations])
+            results.append({ 'phase': phase,
+                             'times': [round(x, 6) for x in times],
+                             'min': round(times[0], 6),
+                             'median': round(times[len(times) / 2], 6),
+                             'mean': round(sum(times) / len(times), 6) })
+        return { 'format': 'deptools-benchmark',
+                 'version': 1,
+                 'parameters': vars(self.opts),
+                 'environment': environment(),
+                 'setup_time': round(setup_time, 6),
+                 'results': results }
+
+
+def environment():
+    git_version = Popen(['git', '--version'], stdout=PIPE).communicate()[0]
+    return { 'python': platform.python_version(),
+             'platform': platform.platform(),
+             'git': git_version.strip() }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the deptool.py commands "
+                                     "on generated local components.")
+    parser.add_argument('--git', type=int, default=10,
+                        help="number of git repositories [10]")
+    parser.add_argument('--git-files', dest='git_files', type=int, default=100,
+                        help="number of files per git repository [100]")
+    parser.add_argument('--archives', type=int, default=2,
+                        help="number of archives [2]")
+    parser.add_argument('--archive-files', dest='archive_files', type=int, default=1000,
+                        help="number of files per archive [1000]")
+    parser.add_argument('--archive-formats', dest='archive_formats', default="tar.gz,zip",
+                        help="comma separated archive formats in turn [tar.gz,zip]")
+    parser.add_argument('--paths', type=int, default=2,
+                        help="number of path trees [2]")
+    parser.add_argument('--path-files', dest='path_files', type=int, default=5000,
+                        help="number of files per path tree [5000]")
+    parser.add_argument('--file-size', dest='file_size', type=int, default=4096,
+                        help="size in bytes of each generated file [4096]")
+    parser.add_argument('--iterations', type=int, default=3,
+                        help="number of timed iterations of each phase [3]")
+    parser.add_argument('--workdir', default=None,
+                        help="directory for the generated files, default to a temporary one")
+    parser.add_argument('--keep', action='store_true',
+                        help="keep the generated files")
+    parser.add_argument('-o', '--output', default="-",
+                        help="json results file, default to stdout")
+    opts = parser.parse_args()
+    for value in opts.archive_formats.split(","):
+        if value not in ("tar.gz", "zip"):
+            parser.error("unsupported archive format: %s" % value)
+    if opts.iterations < 1:
+        parser.error("at least one iteration is required")
+
+    if opts.workdir == None:
+        root = tempfile.mkdtemp(prefix="deptools-bench.")
+    else:
+        root = os.path.abspath(opts.workdir)
+        os.makedirs(root)
+    try:
+        results = Benchmark(root, opts).run()
+    finally:
+        if not opts.keep:
+            shutil.rmtree(root)
+    if opts.output == "-":
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print
+    else:
+        stream = open(opts.output, "w")
+        try:
+            json.dump(results, stream, indent=2, sort_keys=True)
+        finally:
+            stream.close()
+
+if __name__ == "__main__":
+    main()
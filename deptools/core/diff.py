@@ -0,0 +1,98 @@
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Differences between the components of a configuration in two
+dependency files.
+
+Each changed component is classified by the most significant change of
+its repository entry:
+- added: the component is only in the new configuration,
+- removed: the component is only in the old configuration,
+- format: the repository format changed,
+- url: the repository url changed,
+- alias: the directory of the component changed,
+- revision: the revision, label or other fields changed.
+The unchanged components are omitted.
+"""
+
+class Change:
+    def __init__(self, name, kind, old, new):
+        self.name = name
+        self.kind = kind
+        self.old = old
+        self.new = new
+
+    def fields(self):
+        """ Returns the sorted names of the fields that changed. """
+        if not isinstance(self.old, dict) or not isinstance(self.new, dict):
+            return []
+        return sorted([field for field in set(self.old.keys() + self.new.keys())
+                       if self.old.get(field) != self.new.get(field)])
+
+    def __str__(self):
+        details = ", ".join(["%s: %s -> %s" % (field, self.old.get(field),
+                                               self.new.get(field))
+                             for field in self.fields()])
+        if details == "":
+            return "%s: %s" % (self.kind, self.name)
+        return "%s: %s (%s)" % (self.kind, self.name, details)
+
+def classify(old, new):
+    """ Returns the kind of change between the old and new entries, or
+    None when they are equal. """
+    if old == new:
+        return None
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return "added"
+    if old.get("format") != new.get("format"):
+        return "format"
+    if old.get("repos") != new.get("repos"):
+        return "url"
+    if old.get("alias") != new.get("alias"):
+        return "alias"
+    return "revision"
+
+def diff(old_components, old_repositories, new_components, new_repositories):
+    """ Returns the list of changes from the old to the new components,
+    in the new components order followed by the removed ones. """
+    changes = []
+    old_names = set(old_components)
+    for name in new_components:
+        new = new_repositories[name]
+        if name not in old_names or name not in old_repositories:
+            changes.append(Change(name, "added", None, new))
+            continue
+        old = old_repositories[name]
+        kind = classify(old, new)
+        if kind != None:
+            changes.append(Change(name, kind, old, new))
+    new_names = set(new_components)
+    for name in old_components:
+        if name not in new_names:
+            changes.append(Change(name, "removed", old_repositories.get(name), None))
+    return changes
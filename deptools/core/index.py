@@ -0,0 +1,200 @@
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Index of the dependency files in a sqlite database.
+
+The components of the configurations and the fields of the repositories
+of the dependency files are stored in .deptools/index.db, by absolute
+path of the file. The index of a file is refreshed when the file stat
+changes: the file is parsed again, but only the configurations and
+repositories whose content changed are rewritten, as recorded by a
+digest of their content. Queries on an up to date file are then
+answered without parsing it.
+
+The tables are:
+  files(path, stamp)
+  configurations(path, name, digest, position, component)
+  repositories(path, name, digest, format, repos, label, revision,
+               alias, entry)
+where entry is the json dump of the repository entry.
+"""
+
+import os, json, hashlib
+import sqlite3
+from core import loader
+
+default_path = os.path.join(".deptools", "index.db")
+
+class Index:
+    version_ = 1
+    # Repositories fields stored as columns
+    fields_ = [ 'format', 'repos', 'label', 'revision', 'alias' ]
+
+    def __init__(self, path=default_path):
+        dirname = os.path.dirname(path)
+        if dirname != "" and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.db = sqlite3.connect(path)
+        self.create()
+
+    def close(self):
+        self.db.close()
+
+    def create(self):
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version == self.version_:
+            return
+        with self.db:
+            for table in [ 'files', 'configurations', 'repositories' ]:
+                self.db.execute("DROP TABLE IF EXISTS %s" % table)
+            self.db.execute("CREATE TABLE files (path TEXT PRIMARY KEY, stamp TEXT)")
+            self.db.execute("CREATE TABLE configurations (path TEXT, name TEXT, "
+                            "digest TEXT, position INTEGER, component TEXT)")
+            self.db.execute("CREATE TABLE repositories (path TEXT, name TEXT, "
+                            "digest TEXT, %s, entry TEXT)" %
+                            ", ".join(["%s TEXT" % field for field in self.fields_]))
+            self.db.execute("CREATE INDEX configurations_name ON configurations (path, name)")
+            self.db.execute("CREATE INDEX configurations_component "
+                            "ON configurations (path, component)")
+            self.db.execute("CREATE INDEX repositories_name ON repositories (path, name)")
+            self.db.execute("PRAGMA user_version = %d" % self.version_)
+
+    @staticmethod
+    def text(value):
+        if value == None:
+            return None
+        if isinstance(value, (str, unicode)):
+            return value
+        return "%s" % (value,)
+
+    @staticmethod
+    def digest(value):
+        return hashlib.sha1(json.dumps(value, sort_keys=True, default=str)).hexdigest()
+
+    def refresh(self, dep_file):
+        """ Updates the index of dep_file if it changed since the last
+        refresh. Returns the absolute path of the file in the index. """
+        path = os.path.abspath(dep_file)
+        st = os.stat(path)
+        stamp = "%d:%d:%r:%r" % (st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+        row = self.db.execute("SELECT stamp FROM files WHERE path = ?", (path,)).fetchone()
+        if row != None and row[0] == stamp:
+            return path
+        stream = open(path)
+        try:
+            content = loader.load(stream)
+        finally:
+            stream.close()
+        if not isinstance(content, dict):
+            content = {}
+        configurations = content.get("configurations")
+        if not isinstance(configurations, dict):
+            configurations = {}
+        repositories = content.get("repositories")
+        if not isinstance(repositories, (dict, loader.LazyDict)):
+            repositories = {}
+        with self.db:
+            self.update("configurations", path, self.configurations_rows(path, configurations))
+            self.update("repositories", path, self.repositories_rows(path, repositories))
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?)", (path, stamp))
+        return path
+
+    def configurations_rows(self, path, configurations):
+        items = {}
+        for name, components in configurations.items():
+            if not isinstance(components, list):
+                components = []
+            digest = self.digest(components)
+            name = self.text(name)
+            items[name] = (digest, [(path, name, digest, position, self.text(component))
+                                    for position, component in enumerate(components)])
+        return items
+
+    def repositories_rows(self, path, repositories):
+        items = {}
+        for name, entry in repositories.items():
+            digest = self.digest(entry)
+            if isinstance(entry, dict):
+                fields = [self.text(entry.get(field)) for field in self.fields_]
+            else:
+                fields = [None] * len(self.fields_)
+            name = self.text(name)
+            items[name] = (digest, [tuple([path, name, digest] + fields +
+                                          [json.dumps(entry, sort_keys=True, default=str)])])
+        return items
+
+    def update(self, table, path, items):
+        """ Replaces the rows of the named items whose digest changed and
+        removes the rows of the items that no more exist. """
+        indexed = dict(self.db.execute("SELECT DISTINCT name, digest FROM %s "
+                                       "WHERE path = ?" % table, (path,)))
+        for name, digest in indexed.items():
+            if name not in items or items[name][0] != digest:
+                self.db.execute("DELETE FROM %s WHERE path = ? AND name = ?" % table,
+                                (path, name))
+        for name, (digest, rows) in items.items():
+            if indexed.get(name) != digest and rows:
+                self.db.executemany("INSERT INTO %s VALUES (%s)" %
+                                    (table, ", ".join(["?"] * len(rows[0]))), rows)
+
+    def configurations_using(self, path, repository):
+        return [row[0] for row in self.db.execute(
+                "SELECT DISTINCT name FROM configurations WHERE path = ? "
+                "AND component = ? ORDER BY name", (path, repository))]
+
+    def components(self, path, configuration):
+        return [row[0] for row in self.db.execute(
+                "SELECT component FROM configurations WHERE path = ? "
+                "AND name = ? ORDER BY position", (path, configuration))]
+
+    def repositories(self, path, fields={}):
+        """ Returns the names of the repositories with the given fields
+        values. A HEAD revision also matches an unspecified revision. """
+        conditions = [ "path = ?" ]
+        values = [ path ]
+        for field in self.fields_:
+            value = fields.get(field)
+            if value == None:
+                continue
+            if field == "revision" and value == "HEAD":
+                conditions.append("(revision = ? OR revision IS NULL)")
+            else:
+                conditions.append("%s = ?" % field)
+            values.append(value)
+        return [row[0] for row in self.db.execute(
+                "SELECT name FROM repositories WHERE %s ORDER BY name" %
+                " AND ".join(conditions), values)]
+
+    def sql(self, statement):
+        """ Returns the rows of the statement, executed read-only such
+        that the index can't be modified. """
+        self.db.execute("PRAGMA query_only = ON")
+        try:
+            return self.db.execute(statement).fetchall()
+        finally:
+            self.db.execute("PRAGMA query_only = OFF")
@@ -0,0 +1,626 @@
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Fast loader for dependency files.
+
+Dependency files use a small subset of yaml: a top level block mapping
+of block mappings and sequences, flow sequences and mappings, single
+line plain and quoted scalars, comments and the !!null tag.
+The FastLoader parses this subset directly into python objects, the
+plain scalars being resolved and constructed as the yaml Loader does.
+Any other construct raises Unsupported and load() then falls back to
+the general yaml loader, which also reports the syntax errors.
+
+The entries of the top level repositories mapping are constructed on
+first access only, as a configuration generally uses a few of them.
+The fast loader skips their text and parses it on access, the general
+loader composes the whole node graph but constructs the entries from
+their nodes on access. Thus errors in an entry value are reported when
+the entry is accessed.
+"""
+
+import re, threading
+from UserDict import DictMixin
+import yaml
+from yaml.nodes import ScalarNode, MappingNode
+from yaml.representer import SafeRepresenter
+from yaml.resolver import Resolver
+from yaml.constructor import Constructor
+from yaml.reader import Reader
+
+class Unsupported(Exception):
+    pass
+
+class LazyDict(DictMixin, object):
+    """ A mapping whose values may be given as functions, called to
+    construct the value on first access.
+    As with the yaml loader, an overwritten value is still constructed,
+    for its errors.
+    """
+
+    def __init__(self):
+        self.values_ = {}
+        self.thunks_ = {}
+        self.lock_ = threading.Lock()
+
+    def set_lazy(self, key, thunk):
+        self.discard_thunk_(key)
+        self.values_.pop(key, None)
+        self.thunks_[key] = thunk
+
+    def discard_thunk_(self, key):
+        thunk = self.thunks_.pop(key, None)
+        if thunk != None:
+            thunk()
+
+    def __getitem__(self, key):
+        if key in self.thunks_:
+            with self.lock_:
+                thunk = self.thunks_.get(key)
+                if thunk != None:
+                    self.values_[key] = thunk()
+                    del self.thunks_[key]
+        return self.values_[key]
+
+    def __setitem__(self, key, value):
+        self.discard_thunk_(key)
+        self.values_[key] = value
+
+    def __delitem__(self, key):
+        if key in self.thunks_:
+            del self.thunks_[key]
+        else:
+            del self.values_[key]
+
+    def __contains__(self, key):
+        return key in self.values_ or key in self.thunks_
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.values_) + len(self.thunks_)
+
+    def keys(self):
+        return self.values_.keys() + self.thunks_.keys()
+
+yaml.add_representer(LazyDict, SafeRepresenter.represent_dict)
+
+class FastLoader:
+    # Tags of the scalars constructed by the fast loader
+    tags_ = [ u'tag:yaml.org,2002:null', u'tag:yaml.org,2002:bool',
+              u'tag:yaml.org,2002:int', u'tag:yaml.org,2002:float',
+              u'tag:yaml.org,2002:timestamp', u'tag:yaml.org,2002:str' ]
+    # Scalars of these types are shared between identical values
+    shared_types_ = (str, unicode, bool, int, float, type(None))
+    # Top level key of the mapping with lazily constructed values
+    lazy_key_ = u'repositories'
+
+    non_printable_ = Reader.NON_PRINTABLE
+    document_marker_ = re.compile(u'^(---|\\.\\.\\.|%)', re.M)
+    plain_start_ = re.compile(u'[^-?:,\\[\\]{}#&*!|>\'"%@`\\s]|-[^\\s]')
+    block_plain_ = re.compile(u'[^\\n]*?(?=[ ]#|:[ \\n]|:$|[ ]*$|[ ]*\\n)')
+    flow_plain_ = re.compile(u'[^\\n,\\[\\]{}:?]*?(?=[ ]*[\\n,\\[\\]{}:?]|[ ]+#|[ ]*$)')
+    # Values skipped for lazy construction, these characters excluded
+    lazy_flow_ = re.compile(u'[ ]*\\{(?:[^\\[\\]{}"\'#!&*|>?%@`]|\'(?:[^\'\\n]|\'\')*\')*\\}')
+    lazy_line_ = re.compile(u'(?:[^\\n\\[\\]{}"\'!&*|>?%@`]|\'(?:[^\'\\n]|\'\')*\')*(?=\\n|$)')
+
+    def __init__(self, data, name=None):
+        self.data = data
+        self.name = name
+        self.general = None
+        if isinstance(data, str):
+            if data.startswith('\xff\xfe') or data.startswith('\xfe\xff'):
+                raise Unsupported("utf-16 encoding")
+            try:
+                data = data.decode('utf-8')
+            except UnicodeDecodeError:
+                raise Unsupported("invalid utf-8 encoding")
+        if data.startswith(u'\uFEFF'):
+            data = data[1:]
+        if u'\t' in data or u'\uFEFF' in data or \
+                self.non_printable_.search(data):
+            raise Unsupported("special characters")
+        if u'\r' in data:
+            data = data.replace(u'\r\n', u'\n')
+            if u'\r' in data:
+                raise Unsupported("line breaks")
+        if self.document_marker_.search(data):
+            raise Unsupported("document markers or directives")
+        self.text = data
+        self.pos = 0
+        self.indent = None
+        self.resolver = Resolver()
+        self.constructor = Constructor()
+        self.scalars = {}
+
+    def unsupported(self, what):
+        raise Unsupported("%s at position %d" % (what, self.pos))
+
+    def load(self):
+        self.next_line()
+        if self.indent != 0:
+            self.unsupported("document start")
+        content = self.block_mapping(0, True)
+        if self.indent != None:
+            self.unsupported("document end")
+        return content
+
+    # Blocks
+
+    def next_line(self):
+        """ Skips empty and comment lines, sets the position on the next
+        content and self.indent to its column, or None at end. """
+        text = self.text
+        while True:
+            start = self.pos
+            pos = start
+            while text.startswith(u' ', pos):
+                pos += 1
+            if pos == len(text):
+                self.pos = pos
+                self.indent = None
+                return
+            if text[pos] == u'#' or text[pos] == u'\n':
+                end = text.find(u'\n', pos)
+                if end == -1:
+                    self.pos = len(text)
+                    self.indent = None
+                    return
+                self.pos = end + 1
+                continue
+            self.pos = pos
+            self.indent = pos - start
+            return
+
+    def end_line(self):
+        """ Skips the spaces and comment up to the next content line. """
+        text = self.text
+        pos = self.pos
+        while text.startswith(u' ', pos):
+            pos += 1
+        if text.startswith(u'#', pos):
+            end = text.find(u'\n', pos)
+            pos = len(text) if end == -1 else end
+        if pos < len(text):
+            if text[pos] != u'\n':
+                self.pos = pos
+                self.unsupported("content after value")
+            pos += 1
+        self.pos = pos
+        self.next_line()
+
+    def is_sequence_entry(self):
+        return self.text.startswith(u'-', self.pos) and \
+            self.text[self.pos+1:self.pos+2] in (u' ', u'\n', u'')
+
+    def block_mapping(self, indent, top=False):
+        mapping = {}
+        while True:
+            if self.is_sequence_entry():
+                self.unsupported("sequence entry in mapping")
+            key = self.block_key()
+            if top and isinstance(mapping.get(key), LazyDict):
+                # The overwritten lazy values are checked as the yaml
+                # loader would construct them
+                self.general_load()
+            if top and key == self.lazy_key_:
+                mapping[key] = self.lazy_block_value(indent)
+            else:
+                mapping[key] = self.block_value(indent)
+            if self.indent == None or self.indent < indent:
+                return mapping
+            if self.indent > indent:
+                self.unsupported("indentation")
+
+    def block_value(self, indent):
+        """ Returns the value following the key of a mapping at indent. """
+        text = self.text
+        pos = self.pos
+        while text.startswith(u' ', pos):
+            pos += 1
+        if pos == len(text) or text[pos] in u'#\n':
+            self.pos = pos
+            self.end_line()
+            if self.indent > indent:
+                return self.block_node(self.indent)
+            if self.indent == indent and self.is_sequence_entry():
+                return self.block_sequence(indent, True)
+            return None
+        self.pos = pos
+        value = self.inline_node()
+        self.end_line()
+        return value
+
+    # Lazy values
+
+    def lazy_block_value(self, indent):
+        start = self.pos
+        text = self.text
+        while text.startswith(u' ', self.pos):
+            self.pos += 1
+        if self.pos == len(text) or text[self.pos] in u'#\n':
+            self.end_line()
+            if self.indent > indent and not self.is_sequence_entry():
+                return self.lazy_mapping(self.indent)
+        self.pos = start
+        return self.block_value(indent)
+
+    def lazy_mapping(self, indent):
+        """ Returns a LazyDict for the block mapping at indent, the values
+        of simple syntax being skipped and parsed on access. """
+        mapping = LazyDict()
+        while True:
+            if self.is_sequence_entry():
+                self.unsupported("sequence entry in mapping")
+            key = self.block_key()
+            start = self.pos
+            if self.skip_value(indent):
+                mapping.set_lazy(key, self.lazy_value(key, start, self.pos, indent))
+            else:
+                self.pos = start
+                mapping[key] = self.block_value(indent)
+            if self.indent == None or self.indent < indent:
+                return mapping
+            if self.indent > indent:
+                self.unsupported("indentation")
+
+    def skip_value(self, indent):
+        """ Skips the value of a key at indent when it is a flow mapping
+        or a block whose extent is known without parsing it, i.e. with no
+        flow, quoted, block scalar or other special syntax. """
+        text = self.text
+        match = self.lazy_flow_.match(text, self.pos)
+        if match != None:
+            self.pos = match.end()
+            self.end_line()
+            return True
+        while text.startswith(u' ', self.pos):
+            self.pos += 1
+        if self.pos < len(text) and text[self.pos] not in u'#\n':
+            return False
+        self.next_line()
+        if self.indent == None or self.indent <= indent:
+            return False
+        while self.indent != None and self.indent > indent:
+            match = self.lazy_line_.match(text, self.pos)
+            if match == None:
+                return False
+            self.pos = match.end()
+            self.next_line()
+        return not (self.indent == indent and self.is_sequence_entry())
+
+    def lazy_value(self, key, start, end, indent):
+        def construct():
+            try:
+                self.pos = start
+                value = self.block_value(indent)
+                if self.pos != end:
+                    self.unsupported("lazy value extent")
+                return value
+            except Unsupported:
+                return self.general_load()[self.lazy_key_][key]
+        return construct
+
+    def general_load(self):
+        if self.general == None:
+            self.general = [load_general(self.data, self.name)]
+        return self.general[0]
+
+    def block_key(self):
+        text = self.text
+        if text[self.pos] in u'\'"':
+            key = self.quoted()
+            while text.startswith(u' ', self.pos):
+                self.pos += 1
+            if not text.startswith(u':', self.pos):
+                self.unsupported("missing ':' after key")
+        else:
+            if not self.plain_start_.match(text, self.pos):
+                self.unsupported("key")
+            match = self.block_plain_.match(text, self.pos)
+            end = match.end()
+            if end - match.start() > 1024:
+                self.unsupported("long key")
+            self.pos = end
+            while text.startswith(u' ', self.pos):
+                self.pos += 1
+            if not text.startswith(u':', self.pos):
+                self.unsupported("missing ':' after key")
+            key = self.plain(text[match.start():end].rstrip(u' '))
+        if not text[self.pos+1:self.pos+2] in (u' ', u'\n', u''):
+            self.unsupported("missing space after ':'")
+        self.pos += 1
+        return key
+
+    def block_node(self, indent):
+        if self.is_sequence_entry():
+            return self.block_sequence(indent, False)
+        return self.block_mapping(indent)
+
+    def block_sequence(self, indent, indentless):
+        sequence = []
+        while True:
+            self.pos += 1
+            while self.text.startswith(u' ', self.pos):
+                self.pos += 1
+            if self.pos == len(self.text) or self.text[self.pos] in u'#\n' or \
+                    self.is_sequence_entry():
+                self.unsupported("sequence entry")
+            sequence.append(self.inline_node())
+            self.end_line()
+            if self.indent == None or self.indent < indent:
+                return sequence
+            if self.indent > indent:
+                self.unsupported("indentation")
+            if not self.is_sequence_entry():
+                if indentless:
+                    return sequence
+                self.unsupported("mapping entry in sequence")
+
+    def inline_node(self):
+        """ Returns the value following a block key or sequence entry. """
+        text = self.text
+        ch = text[self.pos]
+        if ch == u'[':
+            return self.flow_sequence()
+        if ch == u'{':
+            return self.flow_mapping()
+        if ch in u'\'"':
+            return self.quoted()
+        if ch == u'!':
+            return self.null_tag(False)
+        if not self.plain_start_.match(text, self.pos):
+            self.unsupported("value")
+        match = self.block_plain_.match(text, self.pos)
+        self.pos = match.end()
+        if text.startswith(u':', self.pos):
+            self.unsupported("mapping value")
+        return self.plain(match.group().rstrip(u' '))
+
+    # Flows
+
+    def flow_space(self):
+        text = self.text
+        while True:
+            while self.pos < len(text) and text[self.pos] in u' \n':
+                self.pos += 1
+            if not text.startswith(u'#', self.pos):
+                return
+            end = text.find(u'\n', self.pos)
+            self.pos = len(text) if end == -1 else end
+
+    def flow_sequence(self):
+        sequence = []
+        self.pos += 1
+        while True:
+            self.flow_space()
+            if self.text.startswith(u']', self.pos):
+                self.pos += 1
+                return sequence
+            sequence.append(self.flow_node())
+            self.flow_space()
+            if self.text.startswith(u',', self.pos):
+                self.pos += 1
+            elif self.text.startswith(u']', self.pos):
+                self.pos += 1
+                return sequence
+            else:
+                self.unsupported("flow sequence")
+
+    def flow_mapping(self):
+        mapping = {}
+        self.pos += 1
+        while True:
+            self.flow_space()
+            if self.text.startswith(u'}', self.pos):
+                self.pos += 1
+                return mapping
+            if self.pos == len(self.text) or self.text[self.pos] in u'[{!':
+                self.unsupported("flow mapping key")
+            start = self.pos
+            key = self.flow_node()
+            end = self.pos
+            self.flow_space()
+            value = None
+            if self.text.startswith(u':', self.pos):
+                # Implicit keys are on a single line
+                if end - start > 1024 or u'\n' in self.text[start:self.pos]:
+                    self.unsupported("flow mapping key")
+                self.pos += 1
+                self.flow_space()
+                if self.pos == len(self.text) or self.text[self.pos] not in u',}':
+                    value = self.flow_node()
+                    self.flow_space()
+            mapping[key] = value
+            if self.text.startswith(u',', self.pos):
+                self.pos += 1
+            elif self.text.startswith(u'}', self.pos):
+                self.pos += 1
+                return mapping
+            else:
+                self.unsupported("flow mapping")
+
+    def flow_node(self):
+        text = self.text
+        if self.pos == len(text):
+            self.unsupported("end of flow")
+        ch = text[self.pos]
+        if ch == u'[':
+            return self.flow_sequence()
+        if ch == u'{':
+            return self.flow_mapping()
+        if ch in u'\'"':
+            return self.quoted()
+        if ch == u'!':
+            return self.null_tag(True)
+        if not self.plain_start_.match(text, self.pos):
+            self.unsupported("flow value")
+        match = self.flow_plain_.match(text, self.pos)
+        if match == None:
+            self.unsupported("flow scalar")
+        self.pos = match.end()
+        # A ':' not followed by a space or flow indicator, even after
+        # spaces, would continue the plain scalar
+        colon = self.pos
+        while text.startswith(u' ', colon) or text.startswith(u'\n', colon):
+            colon += 1
+        if text.startswith(u':', colon) and \
+                text[colon+1:colon+2] not in (u' ', u'\n', u',', u'[',
+                                               u']', u'{', u'}', u''):
+            self.unsupported("':' in flow scalar")
+        if text.startswith(u'?', self.pos):
+            self.unsupported("'?' in flow scalar")
+        return self.plain(match.group().rstrip(u' '))
+
+    # Scalars
+
+    def null_tag(self, flow):
+        """ Returns None for a !!null tagged scalar, whatever its value. """
+        text = self.text
+        if not text.startswith(u'!!null', self.pos) or \
+                text[self.pos+6:self.pos+7] not in (u' ', u'\n', u''):
+            self.unsupported("tag")
+        self.pos += 6
+        if not text.startswith(u' ', self.pos):
+            return None
+        while text.startswith(u' ', self.pos):
+            self.pos += 1
+        if self.pos < len(text) and text[self.pos] not in u'\n#,]}':
+            if flow:
+                self.flow_node()
+            else:
+                self.inline_node()
+        return None
+
+    def quoted(self):
+        text = self.text
+        quote = text[self.pos]
+        end = self.pos + 1
+        if quote == u"'":
+            while True:
+                end = text.find(u"'", end)
+                if end == -1:
+                    self.unsupported("unterminated quote")
+                if not text.startswith(u"''", end):
+                    break
+                end += 2
+            value = text[self.pos+1:end].replace(u"''", u"'")
+        else:
+            end = text.find(u'"', end)
+            if end == -1:
+                self.unsupported("unterminated quote")
+            value = text[self.pos+1:end]
+            if u'\\' in value:
+                self.unsupported("escape sequence")
+        if u'\n' in value:
+            self.unsupported("multi-line quoted scalar")
+        self.pos = end + 1
+        return self.scalar(u'tag:yaml.org,2002:str', value)
+
+    def plain(self, value):
+        if value == u'':
+            self.unsupported("empty scalar")
+        tag = self.resolver.resolve(ScalarNode, value, (True, False))
+        return self.scalar(tag, value)
+
+    def scalar(self, tag, value):
+        key = (tag, value)
+        if key in self.scalars:
+            return self.scalars[key]
+        if tag not in self.tags_:
+            self.unsupported("scalar tag %s" % tag)
+        node = ScalarNode(tag, value)
+        data = self.constructor.yaml_constructors[tag](self.constructor, node)
+        if isinstance(data, self.shared_types_):
+            self.scalars[key] = data
+        return data
+
+
+class LazyLoader(yaml.Loader):
+    """ The yaml loader, constructing the values of the top level
+    repositories mapping on first access. """
+
+    lazy_tag_ = u'tag:deptools,2017:lazy-map'
+
+    def construct_document(self, node):
+        if isinstance(node, MappingNode) and \
+                node.tag == u'tag:yaml.org,2002:map':
+            # Only the last of duplicated keys is kept, the others are
+            # constructed as usual
+            lazy_node = None
+            for key_node, value_node in node.value:
+                if isinstance(key_node, ScalarNode) and \
+                        key_node.tag == u'tag:yaml.org,2002:str' and \
+                        key_node.value == FastLoader.lazy_key_:
+                    lazy_node = value_node
+            if isinstance(lazy_node, MappingNode) and \
+                    lazy_node.tag == u'tag:yaml.org,2002:map':
+                lazy_node.tag = self.lazy_tag_
+        return yaml.Loader.construct_document(self, node)
+
+    def construct_lazy_mapping(self, node):
+        self.flatten_mapping(node)
+        mapping = LazyDict()
+        for key_node, value_node in node.value:
+            key = self.construct_object(key_node, deep=True)
+            try:
+                hash(key)
+            except TypeError, e:
+                raise yaml.constructor.ConstructorError(
+                    "while constructing a mapping", node.start_mark,
+                    "found unacceptable key (%s)" % e, key_node.start_mark)
+            mapping.set_lazy(key, self.lazy_value(value_node))
+        return mapping
+
+    def lazy_value(self, node):
+        def construct():
+            return self.construct_object(node, deep=True)
+        return construct
+
+LazyLoader.add_constructor(LazyLoader.lazy_tag_, LazyLoader.construct_lazy_mapping)
+
+def load_general(data, name=None):
+    """ Returns the content of a dependency file with the yaml loader. """
+    loader = LazyLoader(data)
+    if name != None:
+        loader.name = name
+    return loader.get_single_data()
+
+def load(stream):
+    """ Returns the content of a dependency file read from stream. """
+    if isinstance(stream, basestring):
+        data = stream
+        name = None
+    else:
+        data = stream.read()
+        name = getattr(stream, 'name', None)
+    try:
+        return FastLoader(data, name).load()
+    except Unsupported:
+        return load_general(data, name)
@@ -0,0 +1,174 @@
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Validation of the dependency files content against declared schemas.
+
+A schema is built from the types below, for instance the fields of a
+component:
+  Record({ 'repos': Scalar(), 'skip_dirs': Integer(0) }, required=['repos'])
+The Validator walks the content with an explicit stack, in a single
+pass, and collects all the errors with their location, as in:
+  repositories.a.skip_dirs: value must be an integer >= 0: -1
+"""
+
+from core.loader import LazyDict
+
+string_types_ = (str, unicode)
+scalar_types_ = (str, unicode, int, long, float, bool)
+mapping_types_ = (dict, LazyDict)
+
+class Type:
+    """ Base class of the schema types. The check() method reports the
+    errors of the value at path and pushes the values to check next on
+    the validator stack. """
+    def check(self, validator, path, value):
+        raise NotImplementedError
+
+class Any(Type):
+    def check(self, validator, path, value):
+        pass
+
+class String(Type):
+    def check(self, validator, path, value):
+        if not isinstance(value, string_types_):
+            validator.error(path, "value is not a string, please use quotes: %s" %
+                            (value,))
+
+class Scalar(Type):
+    """ A string or a value used as its string representation. """
+    def check(self, validator, path, value):
+        if not isinstance(value, scalar_types_):
+            validator.error(path, "value must be a scalar: %s" % (value,))
+
+class Boolean(Type):
+    def check(self, validator, path, value):
+        if not isinstance(value, bool):
+            validator.error(path, "value must be either 'true' or 'false': %s" %
+                            (value,))
+
+class Integer(Type):
+    def __init__(self, minimum=None):
+        self.minimum = minimum
+
+    def check(self, validator, path, value):
+        if not isinstance(value, (int, long)) or isinstance(value, bool) or \
+                (self.minimum != None and value < self.minimum):
+            if self.minimum != None:
+                validator.error(path, "value must be an integer >= %d: %s" %
+                                (self.minimum, value))
+            else:
+                validator.error(path, "value must be an integer: %s" % (value,))
+
+class Choice(Type):
+    def __init__(self, values):
+        self.values = values
+
+    def check(self, validator, path, value):
+        if value not in self.values:
+            validator.error(path, "value must be one of %s: %s" %
+                            (", ".join(self.values), value))
+
+class List(Type):
+    def __init__(self, items):
+        self.items = items
+
+    def check(self, validator, path, value):
+        if not isinstance(value, list):
+            validator.error(path, "value is not a list")
+            return
+        for index in reversed(xrange(len(value))):
+            validator.push("%s[%d]" % (path, index), value[index], self.items)
+
+class Mapping(Type):
+    """ A mapping with keys and values of the given types. When the
+    values type is None, the values are not accessed, thus the lazy
+    values are not constructed. """
+    def __init__(self, keys, values=None):
+        self.keys = keys
+        self.values = values
+
+    def check(self, validator, path, value):
+        if not isinstance(value, mapping_types_):
+            validator.error(path, "value is not a map")
+            return
+        keys = value.keys()
+        for key in keys:
+            self.keys.check(validator, path, key)
+        if self.values != None:
+            for key in reversed(keys):
+                validator.push(validator.join(path, key), value[key], self.values)
+
+class Record(Type):
+    """ A mapping of fields of the given types. Other fields are
+    allowed and optional fields may be null. """
+    def __init__(self, fields, required=[]):
+        self.fields = fields
+        self.required = required
+
+    def check(self, validator, path, value):
+        if not isinstance(value, mapping_types_):
+            validator.error(path, "value is not a map")
+            return
+        for name in self.required:
+            if value.get(name) == None:
+                validator.error(validator.join(path, name), "missing mandatory field")
+        for name, field_type in self.fields.items():
+            field = value.get(name)
+            if field != None:
+                validator.push(validator.join(path, name), field, field_type)
+
+class Validator:
+    def __init__(self):
+        self.errors = []
+        self.stack = []
+
+    def push(self, path, value, schema):
+        self.stack.append((path, value, schema))
+
+    def error(self, path, message):
+        self.errors.append((path, message))
+
+    @staticmethod
+    def join(path, name):
+        if path == "":
+            return "%s" % (name,)
+        return "%s.%s" % (path, name)
+
+    def validate(self, value, schema, path=""):
+        """ Checks value against schema, the errors are accumulated
+        with the previous ones. Returns self for chaining. """
+        stack = self.stack
+        stack.append((path, value, schema))
+        while stack:
+            path, value, schema = stack.pop()
+            schema.check(self, path, value)
+        return self
+
+    def messages(self):
+        return ["%s: %s" % (path, message) if path != "" else message
+                for path, message in self.errors]
@@ -0,0 +1,156 @@
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+"""
+State of the workspace, as last materialized by deptools.
+
+For each component, .deptools/state records the revision, the url and the
+digest of the repository entry it was extracted or updated from, the
+time of the extraction and a stamp of the component checkout. The stamp
+is computed by the plugins from the stat of a few files, for instance
+the git HEAD and its reflog, thus without subprocess. A component whose
+entry digest and stamp match its record is known to be at the recorded
+revision.
+
+The file is a json dump, written atomically by renaming a temporary
+file, thus concurrent commands may lose records but never corrupt it.
+"""
+
+import os, json, hashlib, tempfile, time
+import threading
+
+default_path = os.path.join(".deptools", "state")
+
+def digest(entry):
+    """ Returns the digest of a repository entry. """
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, default=str)).hexdigest()
+
+def stat_stamp(paths):
+    """ Returns a stamp of the stat of the given files, or None if one
+    of them does not exist. """
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamps.append("%d:%d:%r:%r" % (st.st_ino, st.st_size, st.st_mtime, st.st_ctime))
+    return ",".join(stamps)
+
+def from_json(value):
+    """ Returns value with the json unicode strings restored as str
+    when ascii, as loaded from yaml, thus dumped without python tags. """
+    if isinstance(value, unicode):
+        try:
+            return value.encode("ascii")
+        except UnicodeEncodeError:
+            return value
+    if isinstance(value, list):
+        return [from_json(x) for x in value]
+    if isinstance(value, dict):
+        return dict([(from_json(k), from_json(v)) for k, v in value.items()])
+    return value
+
+class State:
+    version_ = 1
+
+    def __init__(self, path=default_path):
+        self.path = path
+        self.records = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        try:
+            stream = open(path)
+            try:
+                content = json.load(stream)
+            finally:
+                stream.close()
+        except (IOError, OSError, ValueError):
+            # A missing or unreadable state is an empty state
+            return
+        if isinstance(content, dict) and content.get("version") == self.version_ and \
+                isinstance(content.get("components"), dict):
+            self.records = from_json(content["components"])
+
+    def lookup(self, name, entry, stamp):
+        """ Returns the record of the component if it matches the entry
+        and the stamp of its checkout, or None. """
+        if stamp == None:
+            return None
+        with self.lock:
+            record = self.records.get(name)
+        if not isinstance(record, dict) or record.get("stamp") != stamp or \
+                record.get("digest") != digest(entry):
+            return None
+        return record
+
+    def record(self, name, entry, revision, stamp):
+        if stamp == None:
+            self.discard(name)
+            return
+        record = { "revision": revision,
+                   "repos": entry.get("repos"),
+                   "digest": digest(entry),
+                   "time": time.time(),
+                   "stamp": stamp }
+        with self.lock:
+            self.records[name] = record
+            self.dirty = True
+
+    def discard(self, name):
+        with self.lock:
+            if name in self.records:
+                del self.records[name]
+                self.dirty = True
+
+    def save(self):
+        """ Writes the state if it changed, atomically. """
+        with self.lock:
+            if not self.dirty:
+                return
+            dirname = os.path.dirname(self.path)
+            if dirname != "" and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpname = tempfile.mkstemp(dir=dirname or ".",
+                                           prefix=os.path.basename(self.path) + ".")
+            try:
+                stream = os.fdopen(fd, "w")
+                try:
+                    json.dump({ "version": self.version_,
+                                "components": self.records },
+                              stream, sort_keys=True, indent=1)
+                    stream.flush()
+                    os.fsync(stream.fileno())
+                finally:
+                    stream.close()
+                os.rename(tmpname, self.path)
+            except:
+                if os.path.exists(tmpname):
+                    os.remove(tmpname)
+                raise
+            self.dirty = False
@@ -0,0 +1,176 @@
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Timing instrumentation of the deptools steps.
+
+Steps are recorded with:
+  with trace.span(name, category, key=value...) as span:
+      ...
+      span.set(status=status)
+when the tracer is enabled, otherwise spans are no-ops.
+Each span records the wall time, the CPU time and the block I/O bytes
+of the process and of its terminated children, the exit status and the
+given arguments. Note that CPU and I/O are process wide measures, thus
+they include the concurrent steps when run in parallel.
+
+The recorded spans are exported as a Chrome trace event file, viewable
+in chrome://tracing, and summarized as a table sorted by cost.
+"""
+
+import os, sys, time, threading
+import json
+
+try:
+    import resource
+except ImportError: # not available on all platforms
+    resource = None
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def set(self, **kwargs):
+        pass
+
+_null_span = _NullSpan()
+
+def _usage():
+    times = os.times()
+    cpu = times[0] + times[1] + times[2] + times[3]
+    if resource == None:
+        return (cpu, 0, 0)
+    blocks_in = 0
+    blocks_out = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        blocks_in += usage.ru_inblock
+        blocks_out += usage.ru_oublock
+    return (cpu, blocks_in * 512, blocks_out * 512)
+
+class Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.thread = threading.currentThread().getName()
+
+    def __enter__(self):
+        self.start = time.time()
+        self.usage = _usage()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.end = time.time()
+        usage = _usage()
+        self.cpu = usage[0] - self.usage[0]
+        self.args['io_read_bytes'] = usage[1] - self.usage[1]
+        self.args['io_write_bytes'] = usage[2] - self.usage[2]
+        if exc_type != None:
+            self.args['status'] = getattr(exc_value, 'returncode', 'error')
+        self.tracer._record(self)
+        return False
+
+    def set(self, **kwargs):
+        """ Adds arguments to the span, for instance the exit status. """
+        self.args.update(kwargs)
+
+    def wall(self):
+        return self.end - self.start
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.spans = []
+        self.origin = time.time()
+
+    def reset(self, enabled = False):
+        self.lock.acquire()
+        try:
+            self.enabled = enabled
+            self.spans = []
+            self.origin = time.time()
+        finally:
+            self.lock.release()
+
+    def span(self, name, category, **kwargs):
+        if not self.enabled:
+            return _null_span
+        return Span(self, name, category, kwargs)
+
+    def _record(self, span):
+        self.lock.acquire()
+        try:
+            self.spans.append(span)
+        finally:
+            self.lock.release()
+
+    def export(self, ostream):
+        """ Writes the spans as Chrome trace events to ostream. """
+        pid = os.getpid()
+        tids = {}
+        events = []
+        for span in sorted(self.spans, key=lambda x: x.start):
+            tid = tids.setdefault(span.thread, len(tids) + 1)
+            args = dict(span.args)
+            args['cpu_s'] = round(span.cpu, 6)
+            events.append({ 'name': span.name,
+                            'cat': span.category,
+                            'ph': 'X',
+                            'ts': int((span.start - self.origin) * 1e6),
+                            'dur': int(span.wall() * 1e6),
+                            'pid': pid,
+                            'tid': tid,
+                            'args': args })
+        for thread, tid in tids.items():
+            events.append({ 'name': 'thread_name', 'ph': 'M', 'pid': pid,
+                            'tid': tid, 'args': { 'name': thread } })
+        json.dump({ 'traceEvents': events, 'displayTimeUnit': 'ms' }, ostream)
+
+    def summary(self, ostream = sys.stderr, limit = 30):
+        """ Prints the most costly spans by wall time to ostream. """
+        spans = sorted(self.spans, key=lambda x: x.wall(), reverse=True)
+        print >>ostream, "%10s %10s %12s %12s %8s  %s" % \
+            ("wall(s)", "cpu(s)", "read(B)", "write(B)", "status", "step")
+        for span in spans[:limit]:
+            print >>ostream, "%10.3f %10.3f %12d %12d %8s  %s: %s" % \
+                (span.wall(), span.cpu, span.args['io_read_bytes'],
+                 span.args['io_write_bytes'], span.args.get('status', ''),
+                 span.category, span.name)
+        if len(spans) > limit:
+            print >>ostream, "... %d more steps in trace" % (len(spans) - limit)
+
+tracer = Tracer()
+
+def span(name, category, **kwargs):
+    """ Returns a context manager recording a step when tracing is enabled. """
+    return tracer.span(name, category, **kwargs)
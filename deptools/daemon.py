@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+"""
+Local daemon mode for deptools.
+
+The daemon is started with 'deptool.py --daemon' and serves the
+deptool.py commands over a Unix socket, keeping the loaded plugins,
+the parsed dependency files and the git helper processes in memory.
+
+This module is also the thin client forwarding a command to the daemon:
+  daemon.py [--socket <path>] [options...] command...
+  daemon.py [--socket <path>] --stop
+The default socket is $DEPTOOLS_SOCKET or .deptools/daemon.sock.
+When no daemon is listening, the client executes deptool.py directly,
+as well as when an argument is '-', the daemon not forwarding the
+client input: the commands served by the daemon read /dev/null.
+
+The protocol is a single json request line from the client:
+  {"argv": [...], "cwd": "...", "env": {...}} or {"stop": true}
+answered by frames from the daemon:
+  "O <size>\n<data>" for stdout data, "E <size>\n<data>" for stderr data,
+  and finally "X <status>\n" for the command exit status.
+"""
+
+import os, sys, socket, select, threading, traceback
+import json
+
+default_socket = os.path.join(".deptools", "daemon.sock")
+
+def socket_path(path = None):
+    """ Returns the absolute socket path for the given or default path. """
+    if path == None:
+        path = os.environ.get("DEPTOOLS_SOCKET", default_socket)
+    return os.path.abspath(path)
+
+def _to_str(value):
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    if isinstance(value, list):
+        return [_to_str(x) for x in value]
+    if isinstance(value, dict):
+        return dict([(_to_str(k), _to_str(v)) for k, v in value.items()])
+    return value
+
+
+class Server:
+    """ Serves the requests sequentially, the handler is called with the
+    command line arguments in the client working directory and
+    environment and returns the exit status.
+    The process file descriptors 1 and 2 are redirected to the client
+    while the handler runs, thus also the output of the subprocesses.
+    The reset function, if any, is called before each request for
+    clearing the caches only valid during a single run.
+    """
+    def __init__(self, path, handler, reset=None):
+        self.path = socket_path(path)
+        self.handler = handler
+        self.reset = reset
+
+    def serve(self):
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        sock.listen(16)
+        print "%s: serving on %s" % (os.path.basename(sys.argv[0]), self.path)
+        sys.stdout.flush()
+        # Subprocesses must not read the daemon input
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+        try:
+            running = True
+            while running:
+                conn, addr = sock.accept()
+                try:
+                    running = self._serve_request(conn)
+                finally:
+                    conn.close()
+        finally:
+            sock.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _serve_request(self, conn):
+        stream = conn.makefile("rb")
+        try:
+            request = _to_str(json.loads(stream.readline()))
+        except ValueError:
+            return True
+        if request.get("stop"):
+            conn.sendall("X 0\n")
+            return False
+        status = self._run(conn, request)
+        conn.sendall("X %d\n" % status)
+        return True
+
+    def _run(self, conn, request):
+        cwd = os.getcwd()
+        environ = dict(os.environ)
+        argv0 = sys.argv[0]
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_fds = (os.dup(1), os.dup(2))
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        relay = _Relay(conn, [(out_r, "O"), (err_r, "E")])
+        relay.start()
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.close(out_w)
+        os.close(err_w)
+        status = 1
+        try:
+            try:
+                os.environ.clear()
+                os.environ.update(request.get("env", environ))
+                os.chdir(request["cwd"])
+                if self.reset != None:
+                    self.reset()
+                status = self.handler(request["argv"])
+                if status == None: status = 0
+            except SystemExit, e:
+                if e.code == None:
+                    status = 0
+                elif isinstance(e.code, int):
+                    status = e.code
+                else:
+                    print >>sys.stderr, e.code
+                    status = 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            os.close(saved_fds[0])
+            os.close(saved_fds[1])
+            relay.stop()
+            os.close(out_r)
+            os.close(err_r)
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+            sys.argv[0] = argv0
+        return status
+
+
+class _Relay(threading.Thread):
+    """ Forwards the data available on the pipes to the client as frames.
+    Once stopped, the pipes are drained before returning, subprocesses
+    of the command having terminated.
+    """
+    def __init__(self, conn, pipes):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.conn = conn
+        self.channels = dict(pipes)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while True:
+            stopping = self.stopped.isSet()
+            ready = select.select(self.channels.keys(), [], [], 0.05)[0]
+            for fd in ready:
+                data = os.read(fd, 65536)
+                if not data:
+                    del self.channels[fd]
+                    continue
+                try:
+                    self.conn.sendall("%s %d\n%s" % (self.channels[fd], len(data), data))
+                except socket.error:
+                    pass
+            if stopping and not ready:
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Client:
+    """ Forwards a command to the daemon and outputs its result. """
+    def __init__(self, path = None):
+        self.path = socket_path(path)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except socket.error:
+            sock.close()
+            return None
+        return sock
+
+    def _request(self, sock, request):
+        sock.sendall(json.dumps(request) + "\n")
+        stream = sock.makefile("rb")
+        outputs = { "O": sys.stdout, "E": sys.stderr }
+        while True:
+            header = stream.readline()
+            if header == "":
+                print >>sys.stderr, "%s: error: connection to daemon lost" % \
+                    os.path.basename(sys.argv[0])
+                return 1
+            kind, value = header.split(" ", 1)
+            if kind == "X":
+                return int(value)
+            outputs[kind].write(stream.read(int(value)))
+            outputs[kind].flush()
+
+    def stop(self):
+        sock = self._connect()
+        if sock == None:
+            return 0
+        try:
+            return self._request(sock, { "stop": True })
+        finally:
+            sock.close()
+
+    @staticmethod
+    def reads_stdin(argv):
+        """ Returns whether the arguments refer to the standard input. """
+        for arg in argv:
+            if arg == "-" or arg.endswith("=-") or arg == "-f-":
+                return True
+        return False
+
+    def run(self, argv):
+        sock = None
+        if not self.reads_stdin(argv):
+            sock = self._connect()
+        if sock == None:
+            # No daemon or input needed, run the command directly
+            deptool = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deptool.py")
+            sys.stdout.flush()
+            os.execv(sys.executable, [sys.executable, deptool] + argv)
+        try:
+            return self._request(sock, { "argv": argv,
+                                         "cwd": os.getcwd(),
+                                         "env": dict(os.environ) })
+        finally:
+            sock.close()
+
+
+def main():
+    args = sys.argv[1:]
+    path = None
+    if len(args) >= 2 and args[0] == "--socket":
+        path = args[1]
+        args = args[2:]
+    client = Client(path)
+    if args == ["--stop"]:
+        return client.stop()
+    return client.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
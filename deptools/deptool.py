@@ -26,14 +26,27 @@
 # OTHER DEALINGS IN THE SOFTWARE.
 #
 
-import os, sys
-import argparse, copy
+import os, sys, time, shutil
+import argparse
+import fnmatch
+import sqlite3
+import threading
+from multiprocessing.pool import ThreadPool
+from subprocess import Popen, PIPE
 
 # non standard package, use local version
 import yaml
 
+import daemon
+
 # SourceManagers
 from core import UserException
+from core import trace
+from core import loader
+from core import schema
+from core import index
+from core import diff
+from core import state
 from plugins import SourceManager
 from plugins import PluginLoader
 
@@ -43,144 +56,738 @@ class DefaultConfig:
     def __init__(self):
         self.dep_file = "DEPENDENCIES"
         self.configuration = "default"
+        self.jobs = 8
+        self.select = []
+        self.select_formats = []
+        self.select_labels = []
+        self.changed_since = None
 
 class Config:
     def __init__(self, params):
         self.dep_file = params.dep_file
         self.configuration = params.configuration
+        self.jobs = params.jobs
+        self.select = params.select
+        self.select_formats = params.select_formats
+        self.select_labels = params.select_labels
+        self.changed_since = params.changed_since
 
     def handle_options(self, opts, args):
         self.dep_file = opts.dep_file
         self.configuration = opts.configuration
+        self.jobs = opts.jobs
+        self.select = opts.select
+        self.select_formats = opts.select_formats
+        self.select_labels = opts.select_labels
+        self.changed_since = opts.changed_since
 
     def check(self):
+        if self.jobs < 1:
+            print_error("number of jobs must be at least 1: %d" % self.jobs)
+            return False
         return True
 
 
-class Check:
-    @staticmethod
-    def check(v, check_function):
-        if isinstance(v, list):
-            Check.check_list(v, check_function)
-        elif isinstance(v, dict):
-            Check.check_dict(v, check_function)
-        else:
-            check_function(v)
-
-    @staticmethod
-    def check_dict(d, check_function):
-        for k, v in d.items():
-            Check.check(v, check_function)
-
-    @staticmethod
-    def check_dict_values(d, check_function):
-        for _, v in d.items():
-            check_function(k)
-            Check.check(v, check_function)
-
-    @staticmethod
-    def check_dict_keys(d, check_function):
-        for k in d:
-            check_function(k)
-
-    @staticmethod
-    def check_list(l, check_function):
-        for v in l:
-            Check.check(v, check_function)
+class Repository(schema.Type):
+    """ A repository entry, checked against the schema of its format
+    plugin. """
+    def check(self, validator, path, value):
+        if not isinstance(value, dict):
+            validator.error(path, "value is not a map")
+            return
+        format = value.get("format")
+        if not isinstance(format, (str, unicode)):
+            validator.error(validator.join(path, "format"),
+                            "missing format specification")
+            return
+        try:
+            plugin = SourceManager.get_plugin(format)
+        except Exception:
+            validator.error(validator.join(path, "format"),
+                            "unknown format: %s" % format)
+            return
+        validator.push(path, value, getattr(plugin, "schema_", schema.Any()))
 
 class DependencyFile:
+    # Parsed dependency files by absolute path, with the file stat
+    # at the time of parsing, for long-running processes
+    cache_ = {}
+
     def __init__(self, content = None):
         self.content = content
 
+    @classmethod
+    def load_file(cls, path):
+        """ Returns the parsed content of the file at path, parsing it
+        only when it changed since the last call.
+        The returned content is shared and must not be modified.
+        """
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        stamp = (st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+        cached = cls.cache_.get(key)
+        if cached != None and cached[0] == stamp:
+            return cached[1]
+        stream = file(path)
+        try:
+            deps = cls()
+            deps.load(stream)
+        finally:
+            stream.close()
+        cls.cache_[key] = (stamp, deps.content)
+        return deps.content
+
     def dump(self, ostream = sys.stdout):
-        print >>ostream, yaml.dump(self.content)
+        # The document is streamed, followed by an empty line as before
+        yaml.dump(self.content, ostream)
+        ostream.write("\n")
 
     def load(self, istream = sys.stdin):
-        self.content = yaml.load(istream)
+        self.content = loader.load(istream)
 
 class Dependency:
-    def __init__(self, config):
+    # Content of the dependency files, the repositories entries are
+    # checked by validate()
+    schema_ = schema.Record({ 'configurations':
+                                  schema.Mapping(schema.String(),
+                                                 schema.List(schema.String())),
+                              'repositories': schema.Mapping(schema.String()) },
+                            required=['configurations', 'repositories'])
+
+    # Commands after which the state of the components is recorded
+    state_commands_ = [ 'extract', 'extract_or_updt', 'update', 'rebase', 'commit' ]
+
+    def __init__(self, config, prepare=True):
         self.config = config
         self.deps = None
         self.components = []
-        self.load()
-        self.prepare()
+        self.state_ = None
+        with trace.span("load " + self.config.dep_file, "deptools"):
+            self.load()
+        if prepare:
+            with trace.span("prepare " + self.config.configuration, "deptools"):
+                self.prepare()
 
     def load(self):
         if self.config.dep_file == "-":
-            stream = sys.stdin
-        else:
-            try:
-                stream = file(self.config.dep_file)
-            except IOError, e:
-                raise UserException("cannot access dependencies file %s: %s" % \
-                                        (self.config.dep_file, e.strerror))
-        deps =  DependencyFile()
-        deps.load(stream)
-        self.deps = deps.content
+            deps =  DependencyFile()
+            deps.load(sys.stdin)
+            self.deps = deps.content
+            return
+        try:
+            self.deps = DependencyFile.load_file(self.config.dep_file)
+        except (IOError, OSError), e:
+            raise UserException("cannot access dependencies file %s: %s" % \
+                                    (self.config.dep_file, e.strerror))
 
     def dump(self, component_names=[]):
         DependencyFile(self.deps).dump()
 
+    def concurrent_map(self, function, items, jobs=None):
+        """ Returns the list of function results for items, computed
+        concurrently on up to jobs threads, default to config.jobs. """
+        if jobs == None:
+            jobs = self.config.jobs
+        if jobs == 1 or len(items) <= 1:
+            return map(function, items)
+        pool = ThreadPool(min(jobs, len(items)))
+        try:
+            return pool.map(function, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def collect_revisions(self, method, component_names):
+        """ Returns the list of (name, revision) for the selected
+        components, the revisions being queried concurrently.
+        The list is in components order and the error raised is the one of
+        the first failing component, whatever the completion order.
+        """
+        components = [component for component in self.components
+                      if component.name() in component_names]
+        heads = {}
+        if method == "get_head_revision":
+            heads = self.batched_head_revisions(components)
+        def get_revision(component):
+            name = component.name()
+            if name in heads:
+                return (name, heads[name], None)
+            if method == "get_actual_revision":
+                record = self.recorded_state(component)
+                if record != None:
+                    return (name, record["revision"], None)
+            try:
+                with trace.span(method + " " + name, "component", component=name):
+                    revision = getattr(component, method)()
+                if method == "get_actual_revision":
+                    self.record_state(component, revision)
+                return (name, revision, None)
+            except Exception, e:
+                return (name, None, sys.exc_info())
+        results = self.concurrent_map(get_revision, components)
+        revisions = []
+        for name, revision, exc_info in results:
+            if exc_info != None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            revisions.append((name, revision))
+        return revisions
+
+    def batched_head_revisions(self, components):
+        """ Returns a map from component name to the head revision of the
+        components whose plugin queries them in batch, with a single
+        request per plugin. The components missing from the map are
+        queried one by one, which reports their errors.
+        """
+        batches = {}
+        for component in components:
+            if hasattr(component, "get_head_revisions"):
+                batches.setdefault(component.__class__, []).append(component)
+        heads = {}
+        for plugin, managers in batches.items():
+            try:
+                heads.update(plugin.get_head_revisions(managers))
+            except Exception:
+                pass
+        return heads
+
+    def dump_revisions(self, revisions):
+        """ Dumps the dependencies with the given (name, revision) overrides.
+        The overridden repository entries are swapped in place for the
+        dump and restored after, thus the dependencies are not copied.
+        """
+        repositories = self.deps['repositories']
+        saved = []
+        try:
+            for name, revision in revisions:
+                saved.append((name, repositories[name]))
+                entry = dict(repositories[name])
+                entry['revision'] = revision
+                repositories[name] = entry
+            DependencyFile(self.deps).dump()
+        finally:
+            for name, entry in reversed(saved):
+                repositories[name] = entry
+
     def dump_actual(self, component_names=[]):
         if component_names == []:
             component_names = self.deps['configurations'][self.config.configuration]
-        deps_actual = copy.deepcopy(self.deps)
-        for component in self.components:
-            name = component.name()
-            if name in component_names:
-                actual = component.get_actual_revision()
-                deps_actual['repositories'][name]['revision'] = actual
-        DependencyFile(deps_actual).dump()
+        self.dump_revisions(self.collect_revisions("get_actual_revision", component_names))
 
     def dump_head(self, component_names=[]):
         if component_names == []:
             component_names = self.deps['configurations'][self.config.configuration]
-        deps_head = copy.deepcopy(self.deps)
-        for component in self.components:
-            name = component.name()
-            if name in component_names:
-                head = component.get_head_revision()
-                deps_head['repositories'][name]['revision'] = head
-        DependencyFile(deps_head).dump()
-
-    def prepare(self):
-        def assert_string(v, msg=""):
-            if not isinstance(v, (str, unicode)):
-                raise UserException(
-                    "%svalue is not a string, please use quotes: %s" % (msg, str(v)))
+        self.dump_revisions(self.collect_revisions("get_head_revision", component_names))
+
+    def validate(self, component_names=None):
+        """ Returns the validator with the errors of the dependencies and
+        of the repositories of the given components, or of all the
+        configurations components and repositories when None.
+        """
+        validator = schema.Validator()
+        validator.validate(self.deps, self.schema_)
+        if not isinstance(self.deps, dict):
+            return validator
         configurations = self.deps.get("configurations")
-        if configurations == None or type(configurations) != type({}):
-            raise Exception, "Missing configurations map in dependency file: " + self.config.dep_file
-        Check.check(configurations, lambda x: assert_string(x, "in configurations: "))
-        components = configurations.get(self.config.configuration)
-        if components == None or type(components) != type([]):
-            raise Exception, "Missing components list specification for configuration: " + self.config.configuration
         repositories = self.deps.get("repositories")
-        if repositories == None or type(repositories) != type({}):
-            raise Exception, "Missing repositories map in dependency file: " + self.config.dep_file
-        Check.check_dict_keys(repositories, lambda x: assert_string(x, "in repositories names: "))
+        if not isinstance(repositories, schema.mapping_types_):
+            return validator
+        if component_names == None:
+            if isinstance(configurations, dict):
+                for configuration, components in configurations.items():
+                    if not isinstance(components, list):
+                        continue
+                    for name in components:
+                        if isinstance(name, (str, unicode)) and name not in repositories:
+                            validator.error("configurations.%s" % configuration,
+                                            "missing repository for component: %s" % name)
+            validator.validate(repositories, schema.Mapping(schema.Any(), Repository()),
+                               "repositories")
+        else:
+            for name in component_names:
+                if not isinstance(name, (str, unicode)):
+                    continue
+                if name not in repositories:
+                    validator.error("repositories",
+                                    "missing repository for component: %s" % name)
+                else:
+                    validator.validate(repositories[name], Repository(),
+                                       validator.join("repositories", name))
+        return validator
+
+    def check_errors(self, validator):
+        if validator.errors:
+            raise UserException("invalid dependencies file %s:\n  %s" %
+                                (self.config.dep_file,
+                                 "\n  ".join(validator.messages())))
+
+    def selected_components(self):
+        """ Returns the selected components of the configuration, after
+        the check of the dependencies and of their repositories. """
+        components = None
+        configurations = self.deps.get("configurations") \
+            if isinstance(self.deps, dict) else None
+        if isinstance(configurations, dict):
+            components = configurations.get(self.config.configuration)
+        if not isinstance(components, list):
+            validator = self.validate([])
+            validator.error("configurations",
+                            "missing components list for configuration: %s" %
+                            self.config.configuration)
+            self.check_errors(validator)
+        # Only the selected components are checked and instantiated
+        components = [component for component in components
+                      if not isinstance(component, (str, unicode)) or
+                      self.selected_name(component)]
+        self.check_errors(self.validate(components))
+        repositories = self.deps["repositories"]
+        return [component for component in components
+                if self.selected_repository(repositories[component])]
+
+    def prepare(self):
+        components = self.selected_components()
+        repositories = self.deps["repositories"]
+        previous = self.previous_repositories()
         self.components = []
         for component in components:
-            repository = repositories.get(component)
-            if repository == None or type(repository) != type({}):
-                raise Exception, "Missing repository map for component: " + component
-            format = repository.get("format")
-            if format == None or type(format) != type(""):
-                raise Exception, "Missing format specification for component: " + component
-            self.components.append(SourceManager.get_plugin(format)(component, repository))
+            repository = repositories[component]
+            if previous != None and previous.get(component) == repository:
+                continue
+            self.components.append(
+                SourceManager.get_plugin(repository["format"])(component, repository))
+
+    def selected_name(self, name):
+        if self.config.select == []:
+            return True
+        for pattern in self.config.select:
+            if fnmatch.fnmatchcase(name, pattern):
+                return True
+        return False
+
+    def selected_repository(self, repository):
+        if self.config.select_formats != [] and \
+                repository["format"] not in self.config.select_formats:
+            return False
+        if self.config.select_labels != []:
+            label = repository.get("label")
+            label = "" if label == None else "%s" % (label,)
+            for pattern in self.config.select_labels:
+                if fnmatch.fnmatchcase(label, pattern):
+                    return True
+            return False
+        return True
+
+    def previous_repositories(self):
+        """ Returns the repositories of the --changed-since manifest. """
+        if self.config.changed_since == None:
+            return None
+        try:
+            deps = DependencyFile.load_file(self.config.changed_since)
+        except (IOError, OSError), e:
+            raise UserException("cannot access dependencies file %s: %s" % \
+                                    (self.config.changed_since, e.strerror))
+        repositories = deps.get("repositories") if isinstance(deps, dict) else None
+        if not isinstance(repositories, schema.mapping_types_):
+            return {}
+        return repositories
+
+    def check(self, args=[]):
+        self.check_errors(self.validate())
+
+    def sync(self, previous_file, dry_run=False):
+        """ Moves the workspace extracted from the previous dependency
+        file to the current one: the changed components are switched to
+        their new repository entry and the added ones are extracted, in
+        parallel. The components changing of directory are moved first.
+        The removed components are only reported. """
+        try:
+            previous = DependencyFile.load_file(previous_file)
+        except (IOError, OSError), e:
+            raise UserException("cannot access dependencies file %s: %s" % \
+                                    (previous_file, e.strerror))
+        old_components = []
+        old_repositories = {}
+        if isinstance(previous, dict):
+            configurations = previous.get("configurations")
+            if isinstance(configurations, dict) and \
+                    isinstance(configurations.get(self.config.configuration), list):
+                old_components = [name for name in
+                                  configurations[self.config.configuration]
+                                  if isinstance(name, (str, unicode)) and
+                                  self.selected_name(name)]
+            if isinstance(previous.get("repositories"), schema.mapping_types_):
+                old_repositories = previous["repositories"]
+        # The selection applies to the previous repository entries too
+        old_components = [name for name in old_components
+                          if not isinstance(old_repositories.get(name), dict) or
+                          self.selected_repository(old_repositories[name])]
+        changes = diff.diff(old_components, old_repositories,
+                            self.selected_components(), self.deps["repositories"])
+        actions = []
+        for change in changes:
+            print change
+            if change.kind == "removed":
+                continue
+            manager = SourceManager.get_plugin(change.new["format"])(change.name,
+                                                                     change.new)
+            previous_entry = None
+            replaced = None
+            moved = None
+            if change.kind != "added":
+                old_manager = SourceManager.get_plugin(change.old["format"])(
+                    change.name, change.old)
+                basename = getattr(manager, "basename", None)
+                old_basename = getattr(old_manager, "basename", None)
+                if basename != None and old_basename != None:
+                    if old_basename != basename:
+                        moved = old_manager
+                    if change.kind == "format":
+                        replaced = basename
+                    else:
+                        previous_entry = change.old
+            actions.append((manager, previous_entry, replaced, moved))
+        if dry_run:
+            return
+        # The actions on the same repository, for instance the fetch of
+        # its cache, are serialized
+        locks = dict([("%s" % (manager.component.get("repos"),), threading.Lock())
+                      for manager, previous_entry, replaced, moved in actions])
+        def apply_action(action):
+            manager, previous_entry, replaced, moved = action
+            name = manager.name()
+            try:
+                with locks["%s" % (manager.component.get("repos"),)]:
+                    if moved != None:
+                        with trace.span("move " + name, "component", component=name):
+                            self.move_component(moved, manager.basename)
+                    if replaced != None:
+                        with trace.span("replace " + name, "component", component=name):
+                            self.replace_component(manager, replaced)
+                    elif previous_entry == None:
+                        with trace.span("extract " + name, "component", component=name):
+                            manager.extract()
+                    elif not hasattr(manager, "switch"):
+                        raise Exception, "format does not support sync: " + \
+                            manager.component["format"]
+                    else:
+                        with trace.span("switch " + name, "component", component=name):
+                            manager.switch(previous_entry)
+                self.record_state(manager)
+                return None
+            except Exception, e:
+                return (name, e)
+        results = self.concurrent_map(apply_action, actions)
+        self.save_state()
+        failed = [result for result in results if result != None]
+        for name, e in failed:
+            print_error("cannot sync component %s: %s" % (name, e))
+        if failed:
+            raise UserException("cannot sync components: %s" %
+                                ", ".join([name for name, e in failed]))
+
+    def move_component(self, old_manager, directory):
+        """ Moves the directory of the component extracted with the
+        previous repository entry to the directory of the current one. """
+        if not os.path.exists(old_manager.basename):
+            return
+        if os.path.exists(directory):
+            raise Exception, "cannot move component, path exists: " + directory
+        dirname = os.path.dirname(directory)
+        if dirname != "" and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        if hasattr(old_manager, "move"):
+            old_manager.move(directory)
+        else:
+            print "Moving component from '%s' to '%s'" % (old_manager.basename,
+                                                          directory)
+            os.rename(old_manager.basename, directory)
+
+    def replace_component(self, manager, directory):
+        """ Extracts the component in place of the directory extracted
+        with another format. The previous directory is restored if the
+        extraction fails. """
+        if not os.path.exists(directory):
+            manager.extract()
+            return
+        print "Replacing component in '" + directory + "'"
+        saved = directory + ".deptools-sync"
+        os.rename(directory, saved)
+        try:
+            manager.extract()
+            if not os.path.exists(directory):
+                raise Exception, "component not extracted in: " + directory
+        except:
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.rename(saved, directory)
+            raise
+        shutil.rmtree(saved)
+
+    def status(self, args=[]):
+        """ Prints a table of the status of the components, queried
+        concurrently: the actual revision, whether it matches the pinned
+        revision of the dependency file, whether the checkout has local
+        changes and the number of commits ahead and behind the label. """
+        def get_status(component):
+            name = component.name()
+            if not hasattr(component, "get_status"):
+                return (component, "unsupported", None)
+            try:
+                with trace.span("status " + name, "component", component=name):
+                    status = component.get_status()
+                    if status != None and status.get("revision") == None:
+                        # Costly revisions are taken from the state
+                        record = self.recorded_state(component)
+                        status["revision"] = (record["revision"] if record != None
+                                              else component.get_actual_revision())
+                return (component, status, None)
+            except Exception, e:
+                return (component, None, e)
+        results = self.concurrent_map(get_status, self.components)
+        rows = [ ("component", "format", "revision", "manifest", "changes", "upstream") ]
+        failed = []
+        for component, status, e in results:
+            name = component.name()
+            format = component.component["format"]
+            pinned = "%s" % (component.component.get("revision", "HEAD"),)
+            if e != None:
+                failed.append((name, e))
+                rows.append((name, format, "error", "-", "-", "-"))
+                continue
+            if status == "unsupported" and not os.path.exists(component.get_workdir()):
+                status = None
+            if status == None or status == "unsupported":
+                rows.append((name, format, status or "missing", "-", "-", "-"))
+                continue
+            revision = status.get("revision")
+            if pinned == "HEAD" or revision == None:
+                manifest = "-"
+            elif "pinned" in status:
+                # The plugin resolved the pinned revision to a commit
+                manifest = "ok" if status["pinned"] == revision else "mismatch"
+            elif revision.startswith(pinned):
+                manifest = "ok"
+            else:
+                manifest = "mismatch"
+            dirty = status.get("dirty")
+            changes = "-" if dirty == None else "dirty" if dirty else "clean"
+            ahead, behind = status.get("ahead"), status.get("behind")
+            upstream = "-" if ahead == None else "+%d -%d" % (ahead, behind)
+            rows.append((name, format, revision[:12] if revision != None else "-",
+                         manifest, changes, upstream))
+        widths = [max([len(row[column]) for row in rows]) for column in range(5)]
+        for row in rows:
+            print " ".join(["%-*s" % (width, value)
+                            for width, value in zip(widths, row)] + [row[5]])
+        for name, e in failed:
+            print_error("cannot get status of component %s: %s" % (name, e))
+        if failed:
+            raise UserException("cannot get status of components: %s" %
+                                ", ".join([name for name, e in failed]))
+
+    def execute(self, args=[]):
+        """ Executes the command in the directory of each component, on
+        up to -j concurrent jobs. The output of the commands is either
+        direct, prefixed by the component name on each line, or grouped
+        by component. The exit status and time of the command in each
+        component are summarized at the end. """
+        parser = argparse.ArgumentParser(prog="%s execute" % os.path.basename(sys.argv[0]))
+        parser.add_argument('-j', dest='jobs', type=int, default=1,
+                            help="number of concurrent commands, default to 1")
+        parser.add_argument('--keep-going', dest='keep_going', action='store_true',
+                            help="execute the command in all the components")
+        parser.add_argument('--fail-fast', dest='keep_going', action='store_false',
+                            help="do not start the command in other components "
+                            "after a failure, the default")
+        parser.add_argument('--output', dest='output', default=None,
+                            choices=['direct', 'prefix', 'group'],
+                            help="output of the commands, default to direct "
+                            "with one job and prefix otherwise")
+        parser.add_argument('command', nargs=argparse.REMAINDER)
+        opts = parser.parse_args(args)
+        # The command options may be protected from the global options by --
+        if opts.command[:1] == [ "--" ]:
+            opts.command = opts.command[1:]
+        if opts.jobs < 1:
+            raise UserException("number of jobs must be at least 1: %d" % opts.jobs)
+        if opts.command == []:
+            raise UserException("missing command to execute")
+        output = opts.output
+        if output == None:
+            output = "direct" if opts.jobs == 1 else "prefix"
+        output_lock = threading.Lock()
+        failed = threading.Event()
+
+        def write(stream, data):
+            with output_lock:
+                stream.write(data)
+                stream.flush()
+
+        def forward(pipe, stream, prefix):
+            for line in iter(pipe.readline, ""):
+                if not line.endswith("\n"):
+                    line += "\n"
+                write(stream, prefix + line)
+
+        def run(component):
+            """ Returns the exit status of the command, run in the same
+            way whatever the output for all the formats. """
+            workdir = component.get_workdir()
+            if not os.path.isdir(workdir):
+                raise Exception, "path does not exist: " + workdir
+            if output == "direct":
+                write(sys.stdout, "Executing command for component in '%s'\n" % workdir)
+                pipe = None
+            else:
+                pipe = PIPE
+            try:
+                proc = Popen(opts.command, cwd=workdir,
+                             stdout=pipe, stderr=pipe, close_fds=True)
+            except OSError, e:
+                raise Exception, "cannot execute %s: %s" % (opts.command[0], e.strerror)
+            if output == "direct":
+                proc.wait()
+            elif output == "group":
+                out, err = proc.communicate()
+                header = "==> %s <==\n" % component.name()
+                with output_lock:
+                    for stream, data in [ (sys.stdout, out), (sys.stderr, err) ]:
+                        if data != "":
+                            stream.write(header + data)
+                            if not data.endswith("\n"):
+                                stream.write("\n")
+                            stream.flush()
+            else:
+                prefix = component.name() + ": "
+                thread = threading.Thread(target=forward,
+                                          args=(proc.stderr, sys.stderr, prefix))
+                thread.start()
+                forward(proc.stdout, sys.stdout, prefix)
+                thread.join()
+                proc.wait()
+            return proc.returncode
+
+        def execute_component(component):
+            """ Returns (name, status, time, error), the time is None when
+            the component is skipped after a failure. """
+            name = component.name()
+            if failed.is_set() and not opts.keep_going:
+                return (name, None, None, None)
+            start = time.time()
+            status, error = None, None
+            try:
+                with trace.span("execute " + name, "component", component=name):
+                    status = run(component)
+            except Exception, e:
+                error = str(e)
+            if status != 0:
+                failed.set()
+            return (name, status, time.time() - start, error)
+
+        sys.stdout.flush()
+        results = self.concurrent_map(execute_component, self.components, opts.jobs)
+        print >>sys.stderr, "Execution summary:"
+        for name, status, elapsed, error in results:
+            if elapsed == None:
+                print >>sys.stderr, "  %s: skipped" % name
+            elif error != None:
+                print >>sys.stderr, "  %s: error, %.2fs: %s" % (name, elapsed, error)
+            else:
+                print >>sys.stderr, "  %s: exit %d, %.2fs" % (name, status, elapsed)
+        failures = [name for name, status, elapsed, error in results
+                    if elapsed != None and status != 0]
+        if failures:
+            raise UserException("command failed in components: %s" % ", ".join(failures))
+
+    def cache(self, args=[]):
+        parser = argparse.ArgumentParser(prog="%s cache" % os.path.basename(sys.argv[0]))
+        parser.add_argument('action', choices=['maintain', 'gc', 'evict'])
+        parser.add_argument('--max-age', dest='max_age', type=float, default=None,
+                            help="evict cached repositories not accessed for DAYS")
+        parser.add_argument('--max-size', dest='max_size', type=parse_size, default=None,
+                            help="evict least recently accessed repositories "
+                            "down to SIZE bytes, K, M, G suffixes allowed")
+        opts = parser.parse_args(args)
+        if opts.max_age != None:
+            opts.max_age = opts.max_age * 24 * 3600
+        repositories = self.deps.get("repositories")
+        for plugin in SourceManager.plugins:
+            if not hasattr(plugin, "cache"):
+                continue
+            managers = []
+            for name, repository in repositories.items():
+                if not isinstance(repository, dict) or \
+                        repository.get("format") != plugin.plugin_name_:
+                    continue
+                try:
+                    managers.append(plugin(name, repository))
+                except Exception, e:
+                    print_error("skipping invalid repository %s: %s" % (name, e))
+            plugin.cache(opts.action, opts, managers)
+
+    def workspace_state(self):
+        if self.state_ == None:
+            self.state_ = state.State()
+        return self.state_
+
+    def recorded_state(self, component):
+        """ Returns the state record of the component if its checkout is
+        known to be unchanged since, or None. """
+        if not hasattr(component, "state_stamp"):
+            return None
+        return self.workspace_state().lookup(component.name(), component.component,
+                                             component.state_stamp())
+
+    def record_state(self, component, revision=None):
+        """ Records the state of the component, the actual revision is
+        queried when not given. """
+        if not hasattr(component, "state_stamp"):
+            return
+        try:
+            if revision == None:
+                revision = component.get_actual_revision()
+        except Exception:
+            self.workspace_state().discard(component.name())
+            return
+        self.workspace_state().record(component.name(), component.component,
+                                      revision, component.state_stamp())
+
+    def up_to_date(self, component):
+        """ Returns whether the component is recorded at the pinned
+        revision of its repository entry. """
+        revision = "%s" % (component.component.get("revision", "HEAD"),)
+        if revision == "HEAD":
+            return False
+        record = self.recorded_state(component)
+        return record != None and record["revision"] == revision
+
+    def save_state(self):
+        if self.state_ == None:
+            return
+        try:
+            self.state_.save()
+        except (IOError, OSError), e:
+            print_error("cannot write workspace state %s: %s" %
+                        (self.state_.path, e.strerror))
 
     def foreach(self, command, args=[]):
         for component in self.components:
+            if command == "extract_or_updt" and self.up_to_date(component):
+                print "Skipping up to date component " + component.name()
+                continue
             method = None
             try:
                 method = eval("component." + command)
             except AttributeError:
                 print("Skipped component " + component.name() + ": does not implement " + command)
-            if method != None: method(args)
+            if method != None:
+                with trace.span(command + " " + component.name(), "component",
+                                component=component.name()):
+                    method(args)
+                if command in self.state_commands_:
+                    self.record_state(component)
 
     def exec_cmd(self, command, args=[]):
-        command_list = [ 'execute', 'extract', 'extract_or_updt',
+        command_list = [ 'extract', 'extract_or_updt',
                          'update', 'commit', 'rebase', 'deliver',
                          'dump', 'dump_actual', 'dump_head', 'list' ]
         if command == "dump":
@@ -189,11 +796,107 @@ class Dependency:
             self.dump_actual(args)
         elif command == "dump_head":
             self.dump_head(args)
+        elif command == "cache":
+            self.cache(args)
+        elif command == "check":
+            self.check(args)
+        elif command == "status":
+            self.status(args)
+        elif command == "execute":
+            self.execute(args)
         elif command in command_list:
             self.foreach(command, args)
         else:
             raise UserException("unexpected command: %s" % command)
 
+def sync(config, args=[]):
+    parser = argparse.ArgumentParser(prog="%s sync" % os.path.basename(sys.argv[0]))
+    parser.add_argument('--from', dest='previous', required=True,
+                        help="dependency file the workspace was extracted from")
+    parser.add_argument('--to', dest='target', default=None,
+                        help="dependency file to move the workspace to, "
+                        "default to the dependency file option")
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help="only output the changes")
+    opts = parser.parse_args(args)
+    if opts.target != None:
+        config.dep_file = opts.target
+    Dependency(config, prepare=False).sync(opts.previous, opts.dry_run)
+
+def query(config, args=[]):
+    """ Answers the query from the index of the dependency file,
+    refreshed first if the file changed. """
+    parser = argparse.ArgumentParser(prog="%s query" % os.path.basename(sys.argv[0]))
+    subparsers = parser.add_subparsers(dest='query')
+    subparser = subparsers.add_parser('configurations',
+                                      help="configurations using the repository")
+    subparser.add_argument('repository')
+    subparser = subparsers.add_parser('components',
+                                      help="components of the configuration")
+    subparser.add_argument('configuration', nargs='?', default=config.configuration)
+    subparser = subparsers.add_parser('repositories',
+                                      help="repositories with the given fields, "
+                                      "a HEAD revision also matches an unspecified one")
+    for field in index.Index.fields_:
+        subparser.add_argument('--' + field, dest=field, default=None)
+    subparser = subparsers.add_parser('sql', help="sql query on the index tables")
+    subparser.add_argument('statement')
+    opts = parser.parse_args(args)
+    if config.dep_file == "-":
+        raise UserException("cannot index the dependencies from standard input")
+    try:
+        deps_index = index.Index()
+    except (OSError, sqlite3.Error), e:
+        raise UserException("cannot open dependencies index %s: %s" %
+                            (index.default_path, e))
+    try:
+        try:
+            path = deps_index.refresh(config.dep_file)
+        except (IOError, OSError), e:
+            raise UserException("cannot access dependencies file %s: %s" % \
+                                    (config.dep_file, e.strerror))
+        if opts.query == "configurations":
+            results = deps_index.configurations_using(path, opts.repository)
+        elif opts.query == "components":
+            results = deps_index.components(path, opts.configuration)
+        elif opts.query == "repositories":
+            results = deps_index.repositories(path, vars(opts))
+        else:
+            try:
+                results = ["\t".join(["%s" % (value,) for value in row])
+                           for row in deps_index.sql(opts.statement)]
+            except sqlite3.Error, e:
+                raise UserException("invalid query: %s" % e)
+    finally:
+        deps_index.close()
+    for result in results:
+        print result
+
+def parse_size(value):
+    units = { 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4 }
+    value = value.strip().lower()
+    scale = 1
+    if value and value[-1] in units:
+        scale = units[value[-1]]
+        value = value[:-1]
+    try:
+        return int(float(value) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid size: %s" % value)
+
+def write_trace(path):
+    try:
+        ostream = open(path, "w")
+        try:
+            trace.tracer.export(ostream)
+        finally:
+            ostream.close()
+    except IOError, e:
+        print_error("cannot write trace file %s: %s" % (path, e.strerror))
+    sys.stdout.flush()
+    trace.tracer.summary(sys.stderr)
+    trace.tracer.reset()
+
 def print_error(msg):
   print >>sys.stderr, "%s: error: %s" % (os.path.basename(sys.argv[0]), msg)
 
@@ -206,16 +909,21 @@ def usage(config):
   print
   print "where command is one of:"
   print " list: list all dependencies"
+  print " status: prints the revision, manifest match, local changes and upstream distance of all dependencies"
   print " extract: extract all dependencies"
   print " update: update all dependencies"
   print " extract_or_updt: extract all dependencies or update if already existing"
   print " commit: commit all dependencies"
   print " rebase: rebase changes on top of upstream"
   print " deliver: push changes upstream"
-  print " execute: execute command for all dependencies"
+  print " execute [-j <n>] [--keep-going|--fail-fast] [--output direct|prefix|group] <command...>: execute command for all dependencies"
   print " dump: dumps to stdout the dependencies"
   print " dump_actual: dumps to stdout the dependencies with actual revisions"
   print " dump_head: dumps to stdout the dependencies at head revisions"
+  print " check: checks all the configurations and repositories of the dependencies"
+  print " query configurations|components|repositories|sql ...: queries the dependencies index"
+  print " sync --from <dep_file> [--to <dep_file>] [--dry-run]: moves the workspace from a dependency file to another"
+  print " cache maintain|gc|evict [--max-age <days>] [--max-size <size>]: maintain the repositories cache"
   print ""
   print "where options are:"
   print " -f|--file <dep_file> : dependency file. Default [" + config.dep_file + "]"
@@ -223,8 +931,18 @@ def usage(config):
   print " -q|--quiet : quiet mode"
   print " -v|--version : output this script version"
   print " -h[--help : this help page"
-
-def main():
+  print " --daemon : serve the commands forwarded by the daemon.py client"
+  print " --socket <path> : daemon socket path. Default [$DEPTOOLS_SOCKET or " + daemon.default_socket + "]"
+  print " --jobs <n> : number of concurrent revision queries. Default [" + str(config.jobs) + "]"
+  print " --trace <file> : output a Chrome trace of the command steps to file and a summary of the most costly steps"
+  print " --select <pattern> : only process the components with a name matching the glob pattern, may be repeated"
+  print " --select-format <format> : only process the components of the given format, may be repeated"
+  print " --select-label <pattern> : only process the components with a label matching the glob pattern, may be repeated"
+  print " --changed-since <dep_file> : only process the components whose repository changed since, or is not in, the given dependency file"
+
+def main(argv=None):
+    if argv == None:
+        argv = sys.argv[1:]
     pdir = os.path.dirname(sys.argv[0])
     pdir = os.path.abspath(pdir)
     def_config = DefaultConfig()
@@ -236,25 +954,54 @@ def main():
     parser.add_argument('-q', '--quiet', action='store_true')
     parser.add_argument('-v', '--version', action='store_true')
     parser.add_argument('-h', '--help', action='store_true')
-
-    opts, args = parser.parse_known_args()
+    parser.add_argument('--daemon', action='store_true')
+    parser.add_argument('--socket', dest='socket', default=None)
+    parser.add_argument('--trace', dest='trace', default=None)
+    parser.add_argument('--jobs', dest='jobs', type=int, default=def_config.jobs)
+    parser.add_argument('--select', dest='select', action='append',
+                        default=def_config.select)
+    parser.add_argument('--select-format', dest='select_formats', action='append',
+                        default=def_config.select_formats)
+    parser.add_argument('--select-label', dest='select_labels', action='append',
+                        default=def_config.select_labels)
+    parser.add_argument('--changed-since', dest='changed_since',
+                        default=def_config.changed_since)
+
+    opts, args = parser.parse_known_args(argv)
     if opts.help:
         usage(def_config)
         sys.exit(0)
     if opts.version:
         print "%s version %s" % (os.path.basename(sys.argv[0]), version)
         sys.exit(0)
+    if opts.daemon:
+        daemon.Server(opts.socket, main, reset=SourceManager.new_run).serve()
+        sys.exit(0)
     config.handle_options(opts, args)
 
     if not config.check():
         sys.exit(2)
     if len(args) == 0:
         error("missing command, try --help for usage")
+    trace.tracer.reset(enabled=opts.trace != None)
     try:
-        dependency = Dependency(config)
-        dependency.exec_cmd(args[0], args[1:])
-    except UserException, e:
-        error(str(e))
+        try:
+            with trace.span(" ".join(args), "command"):
+                if args[0] == "query":
+                    query(config, args[1:])
+                elif args[0] == "sync":
+                    sync(config, args[1:])
+                else:
+                    dependency = Dependency(config, prepare=args[0] != "check")
+                    try:
+                        dependency.exec_cmd(args[0], args[1:])
+                    finally:
+                        dependency.save_state()
+        except UserException, e:
+            error(str(e))
+    finally:
+        if opts.trace != None:
+            write_trace(opts.trace)
 
 if __name__ == "__main__":
   main()
@@ -39,7 +39,8 @@ class digester:
                  'stdout': sys.stdout,
                  'stderr': sys.stderr,
                  'digest_content': False,
-                 'ignore_errors': False
+                 'ignore_errors': False,
+                 'root': None
                  }
         for key, value in kwargs.items():
             if key not in args:
@@ -50,6 +51,14 @@ class digester:
         self.stderr_ = args['stderr']
         self.digest_content_ = args['digest_content']
         self.ignore_errors_ = args['ignore_errors']
+        self.root_ = args['root']
+
+    def fs_path_(self, path):
+        # Paths are relative to the root directory when given,
+        # allowing concurrent digests without changing directory
+        if self.root_ == None:
+            return path
+        return os.path.join(self.root_, path)
 
     def digest_file_content_(self, infile):
         if self.block_size_ == 0:
@@ -65,10 +74,10 @@ class digester:
     def digest_file_(self, path):
         try:
             if self.digest_content_:
-                with open(path) as f:
+                with open(self.fs_path_(path)) as f:
                     print >>self.output_, "F %s %s" % (self.digest_file_content_(f), path)
             else:
-                print >>self.output_, "F %d %s" % (os.path.getsize(path), path)
+                print >>self.output_, "F %d %s" % (os.path.getsize(self.fs_path_(path)), path)
         except IOError, e:
             e.filename = path
             return self.report_exc_(e, "can't read file")
@@ -79,7 +88,7 @@ class digester:
 
     def digest_link_(self, path):
         try:
-            link = os.readlink(path)
+            link = os.readlink(self.fs_path_(path))
             if self.digest_content_:
                 print >>self.output_, "L %s %s" % (hashlib.sha1(link).hexdigest(), path)
             else:
@@ -111,9 +120,10 @@ class digester:
     def digest_not_dir_(self, path):
         # Must check link first,
         # a link can be reported as a file in some cases
-        if os.path.islink(path):
+        fs_path = self.fs_path_(path)
+        if os.path.islink(fs_path):
             retcode = self.digest_link_(path)
-        elif os.path.isfile(path):
+        elif os.path.isfile(fs_path):
             retcode = self.digest_file_(path)
         else:
             retcode = self.digest_special_(path)
@@ -125,14 +135,16 @@ class digester:
             self.report_exc_(exc, "can't access path")
             self.retcode_ = 1
 
-        for dirname, dirnames, filenames in os.walk(root, onerror=report_error):
+        fs_root = self.fs_path_(root)
+        for fs_dirname, dirnames, filenames in os.walk(fs_root, onerror=report_error):
+            dirname = root + fs_dirname[len(fs_root):]
             for filename in sorted(filenames):
                 path = os.path.join(dirname, filename)
                 if self.digest_not_dir_(path) != 0:
                     self.retcode_ = 1
             for subdirname in sorted(dirnames):
                 path = os.path.join(dirname, subdirname)
-                if os.path.islink(path):
+                if os.path.islink(self.fs_path_(path)):
                     if self.digest_link_(path) != 0:
                         self.retcode_ = 1
         return self.retcode_
@@ -142,11 +154,12 @@ class digester:
             paths = [paths]
         sorted_paths = sorted(paths)
         for path in sorted_paths:
-            if not os.path.exists(path):
+            if not os.path.exists(self.fs_path_(path)):
                 return self.error_("path does not exist: %s" % path)
         retcode = 0
         for path in sorted_paths:
-            if os.path.isdir(path) and not os.path.islink(path):
+            fs_path = self.fs_path_(path)
+            if os.path.isdir(fs_path) and not os.path.islink(fs_path):
                 if self.digest_dir_(path) != 0:
                     retcode = 1
             else:
@@ -160,7 +173,8 @@ class digester:
                            ignore_errors = self.ignore_errors_,
                            digest_content = self.digest_content_,
                            stdout = list_file,
-                           stderr = self.stderr_).digest_list(paths)
+                           stderr = self.stderr_,
+                           root = self.root_).digest_list(paths)
         if retcode != 0 and not self.ignore_errors_:
             self.report_error_("error when computing digest list, the final digest will be inaccurate")
         list_file.seek(0)
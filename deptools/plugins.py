@@ -29,9 +29,12 @@
 # Simple base class for plugins implementation
 # Ref to http://martyalchin.com/2008/jan/10/simple-plugin-framework/
 #
-__all__ = ['PluginMount', 'PluginLoader', 'SourceManager']
+__all__ = ['PluginMount', 'PluginLoader', 'SourceManager', 'SourceManagerCmdLine']
 
 import os, sys
+import json
+import yaml
+from core import UserException
 
 verbose = 0
 
@@ -51,6 +54,13 @@ class PluginMount(type):
             cls.plugins.append(cls)
             
 
+    def new_run(cls):
+        """ Resets the caches of the plugins which are only valid during
+        a single run, as in the daemon before each request. """
+        for p in cls.plugins:
+            if hasattr(p, "reset_run_cache"):
+                p.reset_run_cache()
+
     def get_plugin(cls, name):
         try:
             p = cls.plugin_map[name]
@@ -95,4 +105,129 @@ class SourceManager:
     __metaclass__ = PluginMount
 
 
+class SourceManagerCmdLine:
+    """ This is a command line class proxy for SourceManager plugins.
+    The principle is to maintain a session file for a manager object
+    and apply the manager method for the command to the restored object,
+    then store the session back to file.
+    The special command new starts a new session by creating an object
+    from a yaml dump of the constructors arguments, i.e. a name and a
+    component map.
+    The session file is a json map which stores only the constructor
+    arguments and the state of the manager, the manager is thus
+    constructed again when the session is restored.
+    Plugins derive from this class and define the manager_class_
+    attribute. Refer to test_git_01.sh for example of usage.
+    """
+    manager_class_ = None
+    session_format_ = "deptools-session"
+    session_version_ = 1
+    commands_ = [ 'execute', 'extract', 'extract_or_updt', 'update',
+                  'commit', 'rebase', 'deliver', 'dump', 'dump_actual',
+                  'dump_head', 'list' ]
+
+    def __init__(self, args):
+        if len(args) < 2:
+            self.error("missing arguments. Usage: %s serial cmd ..." %
+                       os.path.basename(sys.argv[0]))
+        self._serial = args[0]
+        self._manager = None
+        self._cmd_name = args[1]
+        self._cmd_args = args[2:]
+
+    @staticmethod
+    def error(msg):
+        print >>sys.stderr, sys.argv[0] + ": error: "+ msg
+        sys.exit(1)
+
+    @classmethod
+    def main(cls, args):
+        try:
+            cls(args).run()
+        except UserException, e:
+            cls.error(str(e))
+
+    @staticmethod
+    def _from_json(value):
+        # Restore the strings types as loaded from yaml
+        if isinstance(value, unicode):
+            try:
+                return value.encode("ascii")
+            except UnicodeEncodeError:
+                return value
+        if isinstance(value, list):
+            return [SourceManagerCmdLine._from_json(x) for x in value]
+        if isinstance(value, dict):
+            return dict([(SourceManagerCmdLine._from_json(k),
+                          SourceManagerCmdLine._from_json(v))
+                         for k, v in value.items()])
+        return value
+
+    def _get_state(self):
+        return { 'cwd': self._manager.cwd }
+
+    def _set_state(self, state):
+        self._manager.cwd = state['cwd']
+
+    def _new_session(self, args_serials):
+        if len(args_serials) < 1:
+            self.error("missing parameters file for new session")
+        try:
+            params_stream = open(args_serials[0], "r")
+        except IOError, e:
+            self.error("can't open serial: " + str(e))
+        with params_stream:
+            params = yaml.load(params_stream)
+        self._manager = self.manager_class_(params['name'], params['component'])
+
+    def _store_session(self):
+        session = { 'format': self.session_format_,
+                    'version': self.session_version_,
+                    'plugin': self.manager_class_.plugin_name_,
+                    'name': self._manager.name(),
+                    'component': self._manager.component,
+                    'state': self._get_state() }
+        try:
+            ofile = open(self._serial, "w")
+        except IOError, e:
+            self.error("can't write serial: " + str(e))
+        with ofile:
+            json.dump(session, ofile, separators=(',', ':'))
+
+    def _restore_session(self):
+        try:
+            ifile = open(self._serial, "r")
+        except IOError, e:
+            self.error("can't open serial: " + str(e))
+        with ifile:
+            try:
+                session = self._from_json(json.load(ifile))
+            except ValueError:
+                session = None
+        if (not isinstance(session, dict) or
+            session.get('format') != self.session_format_):
+            self.error("unsupported serial format: " + self._serial)
+        if session.get('version') != self.session_version_:
+            self.error("unsupported serial version: %s: %s" %
+                       (self._serial, session.get('version')))
+        if session.get('plugin') != self.manager_class_.plugin_name_:
+            self.error("serial for another plugin: %s: %s" %
+                       (self._serial, session.get('plugin')))
+        self._manager = self.manager_class_(session['name'], session['component'])
+        self._set_state(session['state'])
+
+    def run(self):
+        if self._cmd_name == "new":
+            self._new_session(self._cmd_args)
+        else:
+            self._restore_session()
+            if (self._cmd_name in self.commands_ and
+                hasattr(self._manager, self._cmd_name)):
+                getattr(self._manager, self._cmd_name)(self._cmd_args)
+            else:
+                print >>sys.stderr, "unexpected command, ignored: %s %s" % \
+                    (self._cmd_name, " ".join(self._cmd_args))
+        self._store_session()
+
+
 loader = PluginLoader()
@@ -26,8 +26,11 @@
 #
 
 from subprocess import call, check_call, Popen, PIPE
-from plugins import SourceManager
-import os, sys, hashlib, shutil
+from plugins import SourceManager, SourceManagerCmdLine
+from core import trace
+from core import schema
+from core import state
+import os, sys, hashlib, shutil, threading, atexit, time
 import yaml
 
 verbose = 0
@@ -37,6 +40,366 @@ class GitConfig:
         self.git = 'git'
         self.verbose = 0
 
+class GitCatFile:
+    """ This class implements a pool of long-lived git cat-file processes.
+    One instance per repository is obtained with GitCatFile.get(path),
+    where path is either a worktree or a bare repository.
+    Object and ref queries are answered over the pipes of
+    'git cat-file --batch-check' and 'git cat-file --batch' processes
+    started on first use, which avoids spawning a git process per query.
+    Queries accept any git revision expression, for instance
+    'HEAD', 'master', 'v1.0^{commit}' or an abbreviated sha1.
+    """
+    pool_ = {}
+    pool_lock_ = threading.Lock()
+
+    def __init__(self, path, git = 'git'):
+        self.path = path
+        self.git = git
+        self.lock = threading.Lock()
+        self.procs_ = {}
+        self.stamp_ = self._stamp()
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def valid(self):
+        """ Returns whether the repository path is still the same. """
+        return self.stamp_ != None and self.stamp_ == self._stamp()
+
+    @classmethod
+    def get(cls, path, git = 'git'):
+        """ Returns the pooled instance for the repository at path. """
+        key = os.path.abspath(path)
+        cls.pool_lock_.acquire()
+        try:
+            instance = cls.pool_.get(key)
+            if instance != None and not instance.valid():
+                # The repository was replaced, for instance on re-extraction
+                del cls.pool_[key]
+                instance.close()
+                instance = None
+            if instance == None:
+                instance = cls.pool_[key] = cls(key, git)
+            return instance
+        finally:
+            cls.pool_lock_.release()
+
+    @classmethod
+    def release(cls, path):
+        """ Terminates the processes for the repository at path.
+        Must be called when the repository is modified outside of git
+        normal operations, for instance after a fetch.
+        """
+        key = os.path.abspath(path)
+        cls.pool_lock_.acquire()
+        try:
+            instance = cls.pool_.pop(key, None)
+        finally:
+            cls.pool_lock_.release()
+        if instance != None:
+            instance.close()
+
+    @classmethod
+    def release_all(cls):
+        """ Terminates all the pooled processes. """
+        cls.pool_lock_.acquire()
+        try:
+            instances = cls.pool_.values()
+            cls.pool_ = {}
+        finally:
+            cls.pool_lock_.release()
+        for instance in instances:
+            instance.close()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            for proc in self.procs_.values():
+                proc.stdin.close()
+                proc.wait()
+            self.procs_ = {}
+        finally:
+            self.lock.release()
+
+    def _proc(self, option):
+        if option not in self.procs_:
+            if not os.path.exists(self.path):
+                raise Exception, "path does not exist: " + self.path
+            # Errors are reported as missing objects, the processes
+            # do not hold the standard error which may be transient
+            devnull = open(os.devnull, "w")
+            try:
+                self.procs_[option] = Popen([self.git, 'cat-file', option],
+                                            cwd=self.path, stdin=PIPE, stdout=PIPE,
+                                            stderr=devnull, close_fds=True)
+            finally:
+                devnull.close()
+        return self.procs_[option]
+
+    def _query(self, option, obj):
+        if obj == "" or "\n" in obj:
+            return (None, None)
+        proc = self._proc(option)
+        proc.stdin.write(obj + "\n")
+        proc.stdin.flush()
+        line = proc.stdout.readline()
+        if line == "":
+            del self.procs_[option]
+            raise Exception, "git cat-file terminated in: " + self.path
+        fields = line.split()
+        if len(fields) != 3 or fields[-1] in ("missing", "ambiguous"):
+            return (None, None)
+        return (fields, proc)
+
+    def info(self, obj):
+        """ Returns the tuple (sha1, type, size) for obj or None. """
+        self.lock.acquire()
+        try:
+            fields, proc = self._query('--batch-check', obj)
+        finally:
+            self.lock.release()
+        if fields == None:
+            return None
+        return (fields[0], fields[1], int(fields[2]))
+
+    def exists(self, obj):
+        """ Returns whether obj names an existing object. """
+        return self.info(obj) != None
+
+    def resolve(self, obj):
+        """ Returns the sha1 of the object named by obj or None. """
+        info = self.info(obj)
+        if info == None:
+            return None
+        return info[0]
+
+    def contents(self, obj):
+        """ Returns the tuple (type, data) for obj or None. """
+        self.lock.acquire()
+        try:
+            fields, proc = self._query('--batch', obj)
+            if fields == None:
+                return None
+            size = int(fields[2])
+            data = proc.stdout.read(size)
+            proc.stdout.read(1)
+        finally:
+            self.lock.release()
+        return (fields[1], data)
+
+atexit.register(GitCatFile.release_all)
+
+class GitCache:
+    """ This class implements the maintenance of the bare repositories
+    cache of the git plugin.
+    Cached repositories are stored under cachedir/xx/yyy.../name.git and
+    are stamped with an access file each time they are fetched.
+    Note that the actions never prune unreachable objects as extracted
+    components borrow objects from the cached repositories.
+    The git dirs of the clones borrowing objects through their alternates
+    are recorded in a clones file, such clones are dissociated before
+    the eviction of the cached repository.
+    """
+    access_file_ = "deptools-access"
+    clones_file_ = "deptools-clones"
+
+    # Versions of the git commands, as tuples of integers
+    versions_ = {}
+
+    def __init__(self, cachedir, config = GitConfig()):
+        self.cachedir = cachedir
+        self.config = config
+
+    @staticmethod
+    def touch(cached_repo):
+        """ Records an access to the cached repository. """
+        stamp = open(os.path.join(cached_repo, GitCache.access_file_), "w")
+        stamp.close()
+
+    @staticmethod
+    def register_clone(cached_repo, git_dir):
+        """ Records a clone borrowing objects from the cached repository. """
+        clones = open(os.path.join(cached_repo, GitCache.clones_file_), "a")
+        try:
+            clones.write(os.path.abspath(git_dir) + "\n")
+        finally:
+            clones.close()
+
+    @staticmethod
+    def _alternates(git_dir):
+        return os.path.join(git_dir, "objects", "info", "alternates")
+
+    def dependent_clones(self, cached_repo):
+        """ Returns the git dirs of the recorded clones whose alternates
+        still reference the cached repository objects. """
+        try:
+            recorded = open(os.path.join(cached_repo, self.clones_file_)).read().split("\n")
+        except IOError:
+            return []
+        objects = os.path.realpath(os.path.join(cached_repo, "objects"))
+        clones = []
+        for git_dir in recorded:
+            if git_dir == "" or git_dir in clones:
+                continue
+            try:
+                lines = open(self._alternates(git_dir)).read().split("\n")
+            except IOError:
+                continue
+            if objects in [os.path.realpath(os.path.join(git_dir, "objects", line.strip()))
+                           for line in lines if line.strip() != ""]:
+                clones.append(git_dir)
+        return clones
+
+    def dissociate(self, cached_repo, git_dir):
+        """ Copies the objects borrowed by the clone from the cached
+        repository into the clone, as git clone --dissociate does, and
+        removes the cached repository from its alternates. """
+        print "Dissociating clone '" + git_dir + "' from cached repository"
+        self._cmd(git_dir, ['repack', '-a', '-d'])
+        objects = os.path.realpath(os.path.join(cached_repo, "objects"))
+        alternates = self._alternates(git_dir)
+        lines = [line for line in open(alternates).read().split("\n")
+                 if line.strip() != "" and
+                 os.path.realpath(os.path.join(git_dir, "objects", line.strip())) != objects]
+        if lines == []:
+            os.remove(alternates)
+        else:
+            stream = open(alternates, "w")
+            try:
+                stream.write("\n".join(lines) + "\n")
+            finally:
+                stream.close()
+
+    def _cmd(self, cached_repo, args):
+        args = [self.config.git, '--git-dir=%s' % cached_repo] + args
+        if self.config.verbose:
+            print " ".join(args)
+        with trace.span(" ".join(args), "subprocess", cwd=os.getcwd()) as span:
+            check_call(args)
+            span.set(status=0)
+
+    def repositories(self):
+        """ Returns the list of cached repositories paths. """
+        repos = []
+        if not os.path.isdir(self.cachedir):
+            return repos
+        for prefix in sorted(os.listdir(self.cachedir)):
+            prefix_dir = os.path.join(self.cachedir, prefix)
+            if not os.path.isdir(prefix_dir): continue
+            for suffix in sorted(os.listdir(prefix_dir)):
+                suffix_dir = os.path.join(prefix_dir, suffix)
+                if not os.path.isdir(suffix_dir): continue
+                for name in sorted(os.listdir(suffix_dir)):
+                    if name.endswith(".git"):
+                        repos.append(os.path.join(suffix_dir, name))
+        return repos
+
+    def last_access(self, cached_repo):
+        """ Returns the last access time of the cached repository. """
+        stamp = os.path.join(cached_repo, self.access_file_)
+        if os.path.exists(stamp):
+            return os.path.getmtime(stamp)
+        return os.path.getmtime(cached_repo)
+
+    def size(self, cached_repo):
+        """ Returns the disk usage in bytes of the cached repository. """
+        size = 0
+        for dirname, dirnames, filenames in os.walk(cached_repo):
+            for filename in filenames:
+                path = os.path.join(dirname, filename)
+                if not os.path.islink(path):
+                    size += os.path.getsize(path)
+        return size
+
+    def has_worktrees(self, cached_repo):
+        """ Returns whether extracted worktrees depend on the cached repository. """
+        self._cmd(cached_repo, ['worktree', 'prune'])
+        worktrees = os.path.join(cached_repo, "worktrees")
+        return os.path.isdir(worktrees) and len(os.listdir(worktrees)) > 0
+
+    def git_version(self):
+        """ Returns the version of git as a tuple of integers. """
+        if self.config.git not in self.versions_:
+            # As in: git version 2.39.5 (Apple Git-143)
+            output = Popen([self.config.git, '--version'], stdout=PIPE).communicate()[0]
+            words = output.split()
+            version = []
+            for field in (words[2] if len(words) > 2 else "").split("."):
+                if not field.isdigit(): break
+                version.append(int(field))
+            self.versions_[self.config.git] = tuple(version)
+        return self.versions_[self.config.git]
+
+    def maintain(self, cached_repo):
+        """ Incremental maintenance: geometric repack of the packs and
+        loose objects, multi-pack-index and split commit-graph update.
+        The geometric repack needs git 2.32, older versions only pack
+        the loose objects and write the commit-graph.
+        """
+        print "Maintaining cached repository '" + cached_repo + "'"
+        self._cmd(cached_repo, ['pack-refs', '--all'])
+        if self.git_version() < (2, 32):
+            self._cmd(cached_repo, ['repack', '-d', '-l'])
+            self._cmd(cached_repo, ['commit-graph', 'write', '--reachable'])
+            return
+        self._cmd(cached_repo, ['repack', '-d', '-l', '--geometric=2'])
+        self._cmd(cached_repo, ['multi-pack-index', 'write'])
+        self._cmd(cached_repo, ['commit-graph', 'write', '--reachable', '--split'])
+
+    def gc(self, cached_repo):
+        """ Full maintenance: repack of all objects into a single pack,
+        keeping unreachable objects, and commit-graph update.
+        """
+        print "Collecting cached repository '" + cached_repo + "'"
+        self._cmd(cached_repo, ['worktree', 'prune'])
+        self._cmd(cached_repo, ['gc', '--prune=never'])
+        self._cmd(cached_repo, ['commit-graph', 'write', '--reachable'])
+
+    def remove(self, cached_repo):
+        print "Evicting cached repository '" + cached_repo + "'"
+        GitCatFile.release(cached_repo)
+        shutil.rmtree(cached_repo)
+        for parent in [os.path.dirname(cached_repo),
+                       os.path.dirname(os.path.dirname(cached_repo))]:
+            if len(os.listdir(parent)) > 0: break
+            os.rmdir(parent)
+
+    def evict(self, max_age = None, max_size = None, keep = []):
+        """ Removes the cached repositories not accessed for more than
+        max_age seconds, then the least recently accessed ones until the
+        cache size fits into max_size bytes.
+        Cached repositories in keep or with extracted worktrees
+        are never removed, the clones borrowing objects from a removed
+        repository are dissociated first.
+        """
+        keep = [os.path.abspath(x) for x in keep]
+        entries = []
+        for cached_repo in self.repositories():
+            entries.append((self.last_access(cached_repo),
+                            self.size(cached_repo), cached_repo))
+        entries.sort()
+        total_size = sum([entry[1] for entry in entries])
+        now = time.time()
+        for access, size, cached_repo in entries:
+            expired = max_age != None and now - access > max_age
+            oversized = max_size != None and total_size > max_size
+            if not expired and not oversized:
+                continue
+            if cached_repo in keep or self.has_worktrees(cached_repo):
+                continue
+            for git_dir in self.dependent_clones(cached_repo):
+                self.dissociate(cached_repo, git_dir)
+            self.remove(cached_repo)
+            total_size -= size
+        if max_size != None and total_size > max_size:
+            print ("Cache size %d exceeds maximum size %d, "
+                   "remaining repositories are in use" % (total_size, max_size))
+
 class GitManager(SourceManager):
     """ This class implements the git format manager plugin.
     The tests for this class are in test_git_*.sh.
@@ -46,6 +409,21 @@ class GitManager(SourceManager):
     """
     plugin_name_ = "git"
     plugin_description_ = "git repository manager"
+
+    # Extraction modes, all of them use the bare repository cache:
+    # - reference: clone from the remote, borrowing objects from the cache,
+    # - shared: clone locally from the cache, sharing its objects,
+    # - worktree: add a detached worktree of the cache, nothing is copied.
+    clone_modes_ = [ "reference", "shared", "worktree" ]
+
+    # Fields of the component
+    schema_ = schema.Record({ 'repos': schema.Scalar(),
+                              'alias': schema.Scalar(),
+                              'label': schema.Scalar(),
+                              'revision': schema.Scalar(),
+                              'clone_mode': schema.Choice(clone_modes_),
+                              'sparse': schema.List(schema.String()) },
+                            required=['repos'])
     
     def __init__(self, name, component, config = GitConfig()):
         self.name_ = name
@@ -73,33 +451,50 @@ class GitManager(SourceManager):
             self.revision = str(component['revision'])
         else:
             self.revision = "HEAD"
+        if 'clone_mode' in component and component['clone_mode'] != None:
+            self.clone_mode = str(component['clone_mode'])
+        else:
+            self.clone_mode = "reference"
+        if self.clone_mode not in self.clone_modes_:
+            raise Exception, ("clone_mode field must be one of: " +
+                              ", ".join(self.clone_modes_))
+        if 'sparse' in component and component['sparse'] != None:
+            if (type(component['sparse']) != type([]) or
+                [x for x in component['sparse'] if not isinstance(x, (str, unicode))]):
+                raise Exception, "sparse field must be a list of paths"
+            self.sparse = [str(x) for x in component['sparse']]
+        else:
+            self.sparse = []
 
         self.cwd = os.getcwd()
 
-    def _cmd(self, args):
+    def _cmd(self, args, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        check_call(args)
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            check_call(args, cwd=cwd)
+            span.set(status=0)
 
-    def _cmd_output(self, args):
+    def _cmd_output(self, args, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        return Popen(args, stdout=PIPE).communicate()[0]
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            proc = Popen(args, stdout=PIPE, cwd=cwd)
+            output = proc.communicate()[0]
+            span.set(status=proc.returncode, output_bytes=len(output))
+        return output
     
     def _subcmd(self, args):
         if not os.path.exists(self.basename):
             raise Exception, "path does not exist: " + self.basename
-        os.chdir(self.basename)
-        self._cmd(args)
-        os.chdir(self.cwd)
+        self._cmd(args, cwd=self.basename)
 
     def _subcmd_output(self, args):
         if not os.path.exists(self.basename):
             raise Exception, "path does not exist: " + self.basename
-        os.chdir(self.basename)
-        output = self._cmd_output(args)
-        os.chdir(self.cwd)
-        return output
+        return self._cmd_output(args, cwd=self.basename)
 
     def _get_cachedir(self):
         dir = os.path.abspath(os.path.join(self.cwd,
@@ -122,8 +517,7 @@ class GitManager(SourceManager):
     def _fetch_cached_repo(self):
         cached_repo = self._get_cached_repo()
         def _git_cached(args):
-            self._cmd(['env', 'GIT_DIR=%s' % cached_repo,
-                       self.config.git] + args)
+            self._cmd(self._git_cached_cmd(args))
         if not os.path.exists(cached_repo):
             os.makedirs(cached_repo)
             _git_cached(['init', '--bare'])
@@ -134,10 +528,87 @@ class GitManager(SourceManager):
             _git_cached(['config', '--add', 'remote.origin.fetch',
                          '+refs/tags/*:refs/tags/*'])
         _git_cached(['fetch', 'origin', '--prune'])
+        GitCache.touch(cached_repo)
+        GitCatFile.release(cached_repo)
+
+    def _check_cached_refs(self):
+        cached = GitCatFile.get(self._get_cached_repo(), self.config.git)
+        if not cached.exists(self.label):
+            raise Exception, "unknown label in repository: " + self.label
+        if (self.revision != "HEAD" and
+            not cached.exists(self.revision + "^{commit}")):
+            raise Exception, "unknown revision in repository: " + self.revision
+
+    def _git_cached_cmd(self, args):
+        return [self.config.git, '--git-dir=%s' % self._get_cached_repo()] + args
+
+    def _checkout_revision(self):
+        if self.revision == "HEAD":
+            return self.label
+        return self.revision
+
+    def _apply_sparse(self):
+        if self.sparse:
+            self._subcmd([self.config.git, 'sparse-checkout', 'set', '--cone'] +
+                         self.sparse)
+
+    def _clone(self):
+        cached_repo = self._get_cached_repo()
+        if self.clone_mode == "worktree":
+            # The worktree is directly checked out at the target revision,
+            # except when sparse where it is populated once the
+            # sparse-checkout patterns are set
+            no_checkout = self.sparse and ['--no-checkout'] or []
+            self._cmd(self._git_cached_cmd(['worktree', 'prune']))
+            self._cmd(self._git_cached_cmd(['worktree', 'add', '--detach'] +
+                                           no_checkout +
+                                           [os.path.abspath(self.basename),
+                                            self._checkout_revision()]))
+            if self.sparse:
+                self._apply_sparse()
+                self._subcmd([self.config.git, 'reset', '--hard'])
+            return
+        # Clone without checkout of the label tip, the local label branch
+        # is then reset to the target revision with a single checkout
+        if self.clone_mode == "shared":
+            self._cmd([self.config.git, 'clone', '--shared', '--no-checkout',
+                       '-b', self.label, cached_repo, self.basename])
+            self._subcmd([self.config.git, 'remote', 'set-url', 'origin', self.repos])
+        else:
+            self._cmd([self.config.git, 'clone', '--reference', cached_repo,
+                       '--no-checkout', '-b', self.label, self.repos, self.basename])
+        GitCache.register_clone(cached_repo, os.path.join(self.basename, ".git"))
+        self._apply_sparse()
+        self._subcmd([self.config.git, 'reset', '--hard', self.revision])
+
+    @classmethod
+    def cache(cls, action, options, managers):
+        """ Executes the cache maintenance action on the cached repositories.
+        The managers are the ones of the components of the plugin format
+        in the dependency file, their cached repositories are never
+        evicted.
+        """
+        cache = GitCache(os.path.abspath(os.path.join(".deptools", "cache",
+                                                      "plugins", cls.plugin_name_)))
+        if action == "maintain":
+            for cached_repo in cache.repositories():
+                cache.maintain(cached_repo)
+        elif action == "gc":
+            for cached_repo in cache.repositories():
+                cache.gc(cached_repo)
+        elif action == "evict":
+            keep = [manager._get_cached_repo() for manager in managers]
+            cache.evict(options.max_age, options.max_size, keep)
+        else:
+            raise Exception, "unexpected cache action: " + action
 
     def name(self):
         return self.name_
 
+    def get_workdir(self):
+        """ Returns the directory where the commands are executed. """
+        return self.basename
+
     def execute(self, args):
         print "Executing command for component in '" + self.basename + "'"
         self._subcmd(args)
@@ -150,9 +621,8 @@ class GitManager(SourceManager):
             print "Extracting component in '" + self.basename + "'"
             try:
                 self._fetch_cached_repo()
-                self._cmd([self.config.git, 'clone', '--reference', self._get_cached_repo(),
-                           '-b', self.label, self.repos, self.basename])
-                self._subcmd([self.config.git, 'reset', '--hard', self.revision])
+                self._check_cached_refs()
+                self._clone()
             except Exception, e:
                 raise Exception, "cannot clone component: " + str(e)
         else:
@@ -162,10 +632,70 @@ class GitManager(SourceManager):
         print "Updating component in '" + self.basename + "'"
         try:
             self._fetch_cached_repo()
-            self._subcmd([self.config.git, 'pull', '--ff-only'])
+            self._apply_sparse()
+            if self.clone_mode == "worktree":
+                self._subcmd([self.config.git, 'merge', '--ff-only', self.label])
+            else:
+                self._subcmd([self.config.git, 'pull', '--ff-only'])
         except Exception, e:
             raise Exception, "cannot update component: " + str(e)
 
+    def switch(self, previous):
+        """ Switches the component extracted from the previous repository
+        entry to the current one, reusing the existing checkout. """
+        if not os.path.exists(self.basename):
+            self.extract()
+            return
+        print "Switching component in '" + self.basename + "'"
+        try:
+            self._fetch_cached_repo()
+            self._check_cached_refs()
+            cached_repo = self._get_cached_repo()
+            if str(previous.get('repos')) != self.repos:
+                if self.clone_mode == "worktree":
+                    raise Exception, "worktree of another repository: " + \
+                        str(previous.get('repos'))
+                self._subcmd([self.config.git, 'remote', 'set-url', 'origin',
+                              self.repos])
+                alternates = os.path.join(self.basename, ".git", "objects",
+                                          "info", "alternates")
+                with open(alternates, "a") as f:
+                    f.write(os.path.join(cached_repo, "objects") + "\n")
+                GitCache.register_clone(cached_repo, os.path.join(self.basename, ".git"))
+            if self.sparse:
+                self._apply_sparse()
+            elif previous.get('sparse'):
+                self._subcmd([self.config.git, 'sparse-checkout', 'disable'])
+            if self.clone_mode == "worktree":
+                self._subcmd([self.config.git, 'checkout', '--detach',
+                              self._checkout_revision()])
+                return
+            # The label branch of the clone is reset to the target revision
+            # from the cached repository, without access to the remote
+            sha = GitCatFile.get(cached_repo, self.config.git).resolve(
+                self._checkout_revision() + "^{commit}")
+            self._subcmd([self.config.git, 'fetch', cached_repo,
+                          '+refs/heads/%s:refs/remotes/origin/%s' %
+                          (self.label, self.label)])
+            self._subcmd([self.config.git, 'checkout', '-B', self.label, sha])
+            self._subcmd([self.config.git, 'branch', '--set-upstream-to',
+                          'origin/' + self.label])
+        except Exception, e:
+            raise Exception, "cannot switch component: " + str(e)
+
+    def move(self, directory):
+        """ Moves the checkout to directory, the cached repository keeping
+        track of its worktrees and of the clones borrowing its objects. """
+        print "Moving component from '%s' to '%s'" % (self.basename, directory)
+        if self.clone_mode == "worktree":
+            self._cmd(self._git_cached_cmd(['worktree', 'move', self.basename,
+                                            directory]))
+            return
+        os.rename(self.basename, directory)
+        git_dir = os.path.join(directory, ".git")
+        if os.path.exists(GitCache._alternates(git_dir)):
+            GitCache.register_clone(self._get_cached_repo(), git_dir)
+
     def extract_or_updt(self, args = []):
         if not os.path.exists(self.basename):
             self.extract(args)
@@ -183,7 +713,10 @@ class GitManager(SourceManager):
         print "Rebasing component in '" + self.basename + "'"
         try:
             self._fetch_cached_repo()
-            self._subcmd([self.config.git, 'pull', '--rebase'])
+            if self.clone_mode == "worktree":
+                self._subcmd([self.config.git, 'rebase', self.label])
+            else:
+                self._subcmd([self.config.git, 'pull', '--rebase'])
         except Exception, e:
             raise Exception, "cannot rebase component: " + str(e)
 
@@ -191,7 +724,11 @@ class GitManager(SourceManager):
         print "Delivering component in '" + self.basename + "'"
         try:
             self._fetch_cached_repo()
-            self._subcmd([self.config.git, '-c', 'push.default=upstream', 'push'])
+            if self.clone_mode == "worktree":
+                self._subcmd([self.config.git, 'push', 'origin',
+                              'HEAD:refs/heads/' + self.label])
+            else:
+                self._subcmd([self.config.git, '-c', 'push.default=upstream', 'push'])
         except Exception, e:
             raise Exception, "cannot deliver component: " + str(e)
 
@@ -202,14 +739,89 @@ class GitManager(SourceManager):
 
     def get_actual_revision(self):
         try:
-            revision = self._subcmd_output([self.config.git, 'rev-parse', 'HEAD']).strip()
+            revision = GitCatFile.get(self.basename, self.config.git).resolve('HEAD')
         except Exception, e:
             raise Exception, "cannot get actual revision: " + str(e)
+        if revision == None:
+            raise Exception, "cannot get actual revision: no HEAD commit in " + self.basename
         return revision
 
     def get_head_revision(self):
         return "HEAD"
 
+    def _resolve_commit(self, revision):
+        """ Returns the sha1 of the commit named by revision in the cached
+        repository, or else in the checkout, or None. """
+        for path in [ self._get_cached_repo(), self.basename ]:
+            if os.path.exists(path):
+                sha = GitCatFile.get(path, self.config.git).resolve(
+                    revision + "^{commit}")
+                if sha != None:
+                    return sha
+        return None
+
+    def get_status(self):
+        """ Returns the status of the checkout, as a dict with the actual
+        revision, the commit of the pinned revision, whether tracked files
+        are modified and the number of commits ahead and behind the label,
+        or None if not extracted.
+        For clones, the label is the upstream as of the last fetch. """
+        if not os.path.exists(self.basename):
+            return None
+        output = self._subcmd_output([self.config.git, 'status', '--porcelain=v2',
+                                      '--branch', '--untracked-files=no'])
+        status = { 'revision': None, 'dirty': False, 'ahead': None, 'behind': None }
+        for line in output.splitlines():
+            if line.startswith("# branch.oid "):
+                status['revision'] = line.split()[2]
+            elif line.startswith("# branch.ab "):
+                fields = line.split()
+                status['ahead'] = int(fields[2][1:])
+                status['behind'] = int(fields[3][1:])
+            elif not line.startswith("#"):
+                status['dirty'] = True
+        if status['revision'] == None or status['revision'] == "(initial)":
+            raise Exception, "cannot get status in: " + self.basename
+        if self.revision != "HEAD":
+            # The pinned revision may be a tag or a branch name
+            status['pinned'] = self._resolve_commit(self.revision)
+        if status['ahead'] == None and self.clone_mode == "worktree":
+            # Worktrees are detached, the label is the cached branch
+            label = GitCatFile.get(self._get_cached_repo(), self.config.git).resolve(
+                'refs/heads/' + self.label)
+            if label == status['revision']:
+                status['ahead'], status['behind'] = 0, 0
+                return status
+            output = self._subcmd_output([self.config.git, 'rev-list', '--left-right',
+                                          '--count', 'HEAD...refs/heads/' + self.label])
+            fields = output.split()
+            if len(fields) == 2:
+                status['ahead'], status['behind'] = int(fields[0]), int(fields[1])
+        return status
+
+    def _git_dir(self):
+        """ Returns the git dir of the checkout, as given by the .git
+        file of worktrees, or None. """
+        dotgit = os.path.join(self.basename, ".git")
+        if os.path.isdir(dotgit):
+            return dotgit
+        try:
+            content = open(dotgit).read()
+        except IOError:
+            return None
+        if not content.startswith("gitdir:"):
+            return None
+        return os.path.join(self.basename, content[len("gitdir:"):].strip())
+
+    def state_stamp(self):
+        """ Returns the stamp of the checkout HEAD, the reflog of HEAD
+        being appended on each move, or None without reflog. """
+        git_dir = self._git_dir()
+        if git_dir == None:
+            return None
+        return state.stat_stamp([os.path.join(git_dir, "HEAD"),
+                                 os.path.join(git_dir, "logs", "HEAD")])
+
     def dump_actual(self, args = []):
         if self.config.verbose:
             print "Dump_actual " + self.basename
@@ -230,86 +842,14 @@ class GitManager(SourceManager):
         print self.name_ + "," + self.label + "@" + self.revision +  "," + self.repos + "," + self.alias
 
 
-class GitManagerCmdLine:
-    """ This is a comand line class proxy for the GitManager class.
-    The principle is to maintain a serial file for the GitManager object
-    and apply internal method to the deserialized file, then serialize
-    the object back to file.
-    The special command new starts a new session by creating an object
-    from a yaml dump of the constructors arguments.
-    There is probably a much better way to implement the exec_cmd function
-    by invoking directly the method name.
-    Also the serialization of the GitManager class may be refactored into
-    a generic support, perhaps in a metaclass.
+class GitManagerCmdLine(SourceManagerCmdLine):
+    """ This is the command line class proxy for the GitManager class.
     Refer to test_git_01.sh for example of usage.
     """
-    def __init__(self, args):
-        self._serial = args[0]
-        self._manager = None
-        self._exec_cmd(args[1], args[2:])
-
-    @staticmethod
-    def error(msg):
-        print >>sys.stderr, sys.argv[0] + ": error: "+ msg
-        sys.exit(1)
-
-    def _serialize_manager(self, manager, ostream = sys.stdout):
-        print >> ostream, yaml.dump(manager)
-
-    def _deserialize_manager(self, istream = sys.stdin):
-        return yaml.load(istream)
-
-    def _new_session(self, args_serials):
-        try:
-            params_stream = open(args_serials[0], "r")
-        except IOError, e:
-            self.error("can't open serial: " + str(e))
-        with params_stream:
-            params = yaml.load(params_stream)
-        self._manager = GitManager(params['name'], params['component'])
-
-    def _store_session(self):
-        try:
-            ofile = open(self._serial, "w")
-        except IOError, e:
-            self.error("can't write serial: " + str(e))
-        with ofile:
-            self._serialize_manager(self._manager, ofile)
-
-    def _restore_session(self):
-        try:
-            ifile = open(self._serial, "r")
-        except IOError, e:
-            self.error("can't open serial: " + str(e))
-        with ifile:
-            self._manager = self._deserialize_manager(ifile)
-
-    def _exec_cmd(self, cmd_name, args):
-        if cmd_name == "new":
-            self._new_session(args)
-        else:
-            self._restore_session()
-            dispatch = { 'execute': self._manager.execute,
-                         'extract': self._manager.extract,
-                         'extract_or_updt': self._manager.extract_or_updt,
-                         'update': self._manager.update,
-                         'commit': self._manager.commit,
-                         'rebase': self._manager.rebase,
-                         'deliver': self._manager.deliver,
-                         'dump': self._manager.dump,
-                         'dump_actual': self._manager.dump_actual,
-                         'dump_head': self._manager.dump_head,
-                         'list': self._manager.list }
-            if cmd_name in dispatch:
-                dispatch[cmd_name](args)
-            else:
-                print "unexpected command, ignored: " + cmd_name + " ".join(args)
-        self._store_session()
+    manager_class_ = GitManager
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        GitManagerCmdLine._error("missing arguments. Usage: git.py serial cmd ...")
-    GitManagerCmdLine(sys.argv[1:])
+    GitManagerCmdLine.main(sys.argv[1:])
 else:
     if verbose == 1:
         print "Loading " + __name__         
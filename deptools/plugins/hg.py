@@ -27,8 +27,10 @@
 
 from subprocess import call
 from subprocess import check_call
-from plugins import SourceManager
-import os, sys
+from plugins import SourceManager, SourceManagerCmdLine
+from core import trace
+from core import schema
+import os, sys, hashlib, shutil, tempfile
 import yaml
 
 verbose = 0
@@ -47,36 +49,112 @@ class HgManager(SourceManager):
     """
     plugin_name_ = "hg"
     plugin_description_ = "mercurial repository manager"
+
+    # Fields of the component
+    schema_ = schema.Record({ 'repos': schema.String(),
+                              'label': schema.Scalar(),
+                              'alias': schema.String(),
+                              'revision': schema.Scalar() },
+                            required=['repos'])
+
+    # Cached repositories already pulled during this run
+    pulled_ = set()
+
+    @classmethod
+    def reset_run_cache(cls):
+        cls.pulled_ = set()
     
     def __init__(self, name, component, config = HgConfig()):
         self.name_ = name
         self.component = component
         self.config = config
-        if component['alias'] != None:
+        if component.get('alias') != None:
             self.basename = component['alias']
         else:
             self.basename = os.path.basename(self.component['repos'])
-        if component['revision'] != None and component['revision'] != "HEAD":
-            self.id = component['revision']
+        if component.get('label') != None:
+            self.label = str(component['label'])
+        else:
+            self.label = "default"
+        if component.get('revision') != None:
+            self.revision = str(component['revision'])
+        else:
+            self.revision = "HEAD"
+        if self.revision != "HEAD":
+            self.id = self.revision
         else:
-            self.id = component['label']
+            self.id = self.label
         self.cwd = os.getcwd()
 
-    def _cmd(self, args):
+    def _cmd(self, args, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        check_call(args)
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            check_call(args, cwd=cwd)
+            span.set(status=0)
     
     def _subcmd(self, args):
         if not os.path.exists(self.basename):
             raise Exception, "path does not exist: " + self.basename
-        os.chdir(self.basename)
-        self._cmd(args)
-        os.chdir(self.cwd)
+        self._cmd(args, cwd=self.basename)
         
+    def _get_cachedir(self):
+        dir = os.path.abspath(os.path.join(self.cwd,
+                                           ".deptools",
+                                           "cache",
+                                           "plugins",
+                                           self.plugin_name_))
+        return dir
+
+    def _get_cached_repo(self):
+        repo_sha1sum = hashlib.sha1(self.component['repos']).hexdigest()
+        return os.path.join(self._get_cachedir(),
+                            repo_sha1sum[:2],
+                            repo_sha1sum[2:],
+                            os.path.basename(self.component['repos'].rstrip("/")))
+
+    def _fetch_cached_repo(self):
+        """ Clones or pulls the pooled store of the remote repository,
+        at most once per run for each remote.
+        """
+        cached_repo = self._get_cached_repo()
+        if cached_repo in self.pulled_:
+            return
+        if not os.path.exists(cached_repo):
+            if not os.path.isdir(os.path.dirname(cached_repo)):
+                os.makedirs(os.path.dirname(cached_repo))
+            # Cloned aside and moved in place once complete, such that a
+            # failed clone does not leave a broken store in the cache
+            tmpdir = tempfile.mkdtemp(dir=os.path.dirname(cached_repo),
+                                      prefix=".tmp-" + os.path.basename(cached_repo))
+            try:
+                tmp_repo = os.path.join(tmpdir, "repos")
+                self._cmd([self.config.hg, 'clone', '--noupdate',
+                           self.component['repos'], tmp_repo])
+                os.rename(tmp_repo, cached_repo)
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+        else:
+            self._cmd([self.config.hg, '--repository', cached_repo, 'pull'])
+        self.pulled_.add(cached_repo)
+
+    def _share(self):
+        self._cmd([self.config.hg, '--config', 'extensions.share=', 'share',
+                   '--noupdate', self._get_cached_repo(), self.basename])
+        # Paths of the working copy refer to the remote repository
+        hgrc = open(os.path.join(self.basename, ".hg", "hgrc"), "w")
+        hgrc.write("[paths]\ndefault = %s\n" % self.component['repos'])
+        hgrc.close()
+        self._subcmd([self.config.hg, 'update', '--rev', str(self.id)])
+
     def name(self):
         return self.name_
 
+    def get_workdir(self):
+        """ Returns the directory where the commands are executed. """
+        return self.basename
+
     def execute(self, args):
         if self.config.verbose:
             print "Execute " + self.basename
@@ -89,7 +167,8 @@ class HgManager(SourceManager):
             if os.path.exists(self.basename):
                 print "Cannot extract component " +  self.name_ + ", path exists: " + self.basename + ". Skipped."
                 return
-            self._cmd([self.config.hg, 'clone', self.component['repos']])
+            self._fetch_cached_repo()
+            self._share()
         except Exception, e:
             raise Exception, "cannot clone component: " + str(e)
         
@@ -97,7 +176,9 @@ class HgManager(SourceManager):
         if self.config.verbose:
             print "Update " + self.basename
         try:
-            self._subcmd([self.config.hg, 'pull'])
+            # The store is shared, pulling it updates the working copy
+            # repository
+            self._fetch_cached_repo()
             self._subcmd([self.config.hg, 'update'])
         except Exception, e:
             raise Exception, "cannot update component: " + str(e)
@@ -148,79 +229,21 @@ class HgManager(SourceManager):
     def list(self, args = []):
         if self.config.verbose:
             print "List " + self.basename
-        if self.component['alias'] != None:
+        if self.component.get('alias') != None:
             alias_str = "," + self.component['alias']
         else:
             alias_str = ""
-        print self.name_ + "," + self.component['label'] + "@" + self.component['revision'] +  "," + self.component['repos'] + alias_str
-
-
-class HgManagerCmdLine:
-    """ This is a comand line class proxy for the HgManager class.
-    The principle is to maintain a serial file for the HgManager object
-    and apply internal method to the deserialized file, then serialize
-    the object back to file.
-    The special command new starts a new session by creating an object
-    from a yaml dump of the constructors arguments.
-    There is probably a much better way to implement the exec_cmd function
-    by invoking directly the method name.
-    Also the serialization of the HgManager class may be refactored into
-    a generic support, perhaps in a metaclass.
-    Refer to test_git_01.sh for example of usage.
-    """
-    def __init__(self, args):
-        self._serial = args[0]
-        self._manager = None
-        self._exec_cmd(args[1], args[2:])
-
-    def _serialize_manager(self, manager, ostream = sys.stdout):
-        print >> ostream, yaml.dump(manager)
-
-    def _deserialize_manager(self, istream = sys.stdin):
-        return yaml.load(istream)
-
-    def _new_session(self, args_serials):
-        params_stream = open(args_serials[0], "r")
-        params = yaml.load(params_stream)
-        self._manager = HgManager(params['name'], params['component'])
+        print self.name_ + "," + self.label + "@" + self.revision +  "," + self.component['repos'] + alias_str
 
-    def _store_session(self):
-        ofile = open(self._serial, "w")
-        self._serialize_manager(self._manager, ofile)
 
-    def _restore_session(self):
-        ifile = open(self._serial, "r")
-        self._manager = self._deserialize_manager(ifile)
-
-    def _exec_cmd(self, cmd_name, args):
-        if cmd_name == "new":
-            self._new_session(args)
-        else:
-            self._restore_session()
-            if cmd_name == "execute":
-                self._manager.execute(args)
-            elif cmd_name == "extract":
-                self._manager.extract(args)
-            elif cmd_name == "update":
-                self._manager.update(args)
-            elif cmd_name == "commit":
-                self._manager.commit(args)
-            elif cmd_name == "rebase":
-                self._manager.rebase(args)
-            elif cmd_name == "deliver":
-                self._manager.deliver(args)
-            elif cmd_name == "dump":
-                self._manager.dump(args)
-            elif cmd_name == "dump_actual":
-                self._manager.dump_actual(args)
-            elif cmd_name == "list":
-                self._manager.list(args)
-            else:
-                print "unexpected command: ignored: " + " ".join(args)
-        self._store_session()
+class HgManagerCmdLine(SourceManagerCmdLine):
+    """ This is the command line class proxy for the HgManager class.
+    Refer to test_git_01.sh for example of usage.
+    """
+    manager_class_ = HgManager
 
 if __name__ == "__main__":
-    HgManagerCmdLine(sys.argv[1:])
+    HgManagerCmdLine.main(sys.argv[1:])
 else:
     if verbose == 1:
         print "Loading " + __name__         
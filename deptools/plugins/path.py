@@ -52,9 +52,11 @@
 #
 
 from subprocess import call
-from plugins import SourceManager
+from plugins import SourceManager, SourceManagerCmdLine
 from digester import digester
 from core import UserException
+from core import trace
+from core import schema
 import os, sys
 import yaml
 import tempfile
@@ -75,6 +77,13 @@ class PathManager(SourceManager):
     plugin_name_ = "path"
     plugin_description_ = "path reference manager"
 
+    # Fields of the component
+    schema_ = schema.Record({ 'repos': schema.Scalar(),
+                              'revision': schema.Scalar(),
+                              'digest_content': schema.Boolean(),
+                              'ignore_status': schema.Boolean() },
+                            required=['repos'])
+
     def __init__(self, name, component, config = PathConfig()):
         self.name_ = name
         self.config = config
@@ -86,11 +95,18 @@ class PathManager(SourceManager):
 
         # Initialise plugin from available fields
         self.repos = str(component.get('repos'))
-        self.revision = str(component.get('revision', "HEAD"))
-        self.digest_content = component.get('digest_content', False)
+        self.revision = component.get('revision')
+        if self.revision == None:
+            self.revision = "HEAD"
+        self.revision = str(self.revision)
+        self.digest_content = component.get('digest_content')
+        if self.digest_content == None:
+            self.digest_content = False
         if type(self.digest_content) != type(True):
             raise UserException("field 'digest_content' must be either 'true' or 'false'")
-        self.ignore_status = component.get("ignore_status", False)
+        self.ignore_status = component.get("ignore_status")
+        if self.ignore_status == None:
+            self.ignore_status = False
         if type(self.ignore_status) != type(True):
             raise UserException("field 'ignore_status' must be either 'true' or 'false'")
         if self.repos.find("/") == 0:
@@ -99,10 +115,13 @@ class PathManager(SourceManager):
             self.path = self.repos[len("file://"):]
         self.cwd = os.getcwd()
 
-    def _cmd(self, args):
+    def _cmd(self, args, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        status = call(args)
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            status = call(args, cwd=cwd)
+            span.set(status=status)
         if status != 0:
             raise UserException("command returned non-zero status: %d: %s" %
                                 (status, " ".join(["'"+x+"'" for x in args])))
@@ -110,9 +129,7 @@ class PathManager(SourceManager):
     def _subcmd(self, args):
         if not os.path.exists(self.path):
             raise UserException("component path does not exist: " + self.path)
-        os.chdir(self._dirname())
-        self._cmd(args)
-        os.chdir(self.cwd)
+        self._cmd(args, cwd=self._dirname())
 
     def _dirname(self):
         if os.path.isdir(self.path):
@@ -135,20 +152,26 @@ class PathManager(SourceManager):
             digest_path = "."
         else:
             digest_path = os.path.basename(self.path)
-        os.chdir(self._dirname())
         digest = digester(ignore_errors = self.ignore_status,
                           digest_content = self.digest_content,
-                          stdout = list_file)
-        retcode = digest.digest_list(digest_path)
-        os.chdir(self.cwd)
+                          stdout = list_file,
+                          root = self._dirname())
+        with trace.span("digest " + self.path, "digest",
+                        component=self.name_) as span:
+            retcode = digest.digest_list(digest_path)
+            span.set(status=retcode)
         if retcode != 0:
-            raise UserException("cannot compute digest for component path: " % self.path)
+            raise UserException("cannot compute digest for component path: %s" % self.path)
         list_file.seek(0)
         return digest.digest_file_content_(list_file)
 
     def name(self):
         return self.name_
 
+    def get_workdir(self):
+        """ Returns the directory where the commands are executed. """
+        return self._dirname()
+
     def execute(self, args):
         if self.config.verbose:
             print "Execute " + self.path
@@ -168,6 +191,9 @@ class PathManager(SourceManager):
             print "Update " + self.path
         print "Update " + self.path + ": nothing to do for path"
 
+    def switch(self, previous):
+        self.extract()
+
     def extract_or_updt(self, args = []):
         if self.config.verbose:
             print "Extract or update " + self.path
@@ -203,6 +229,14 @@ class PathManager(SourceManager):
     def get_head_revision(self):
         return "HEAD"
 
+    def get_status(self):
+        """ Returns the status of the path, or None if the path does not
+        exist. The revision, the digest of its content, is left to the
+        caller which may get it from the workspace state. """
+        if not os.path.exists(self.path):
+            return None
+        return { 'revision': None }
+
     def dump_actual(self, args = []):
         if self.config.verbose:
             print "Dump_actual " + self.path
@@ -223,92 +257,14 @@ class PathManager(SourceManager):
         print self.name_ + "," + self.revision +  "," + self.repos
 
 
-class PathManagerCmdLine:
-    """ This is a comand line class proxy for the PathManager class.
-    The principle is to maintain a serial file for the PathManager object
-    and apply internal method to the deserialized file, then serialize
-    the object back to file.
-    The special command new starts a new session by creating an object
-    from a yaml dump of the constructors arguments.
-    There is probably a much better way to implement the exec_cmd function
-    by invoking directly the method name.
-    Also the serialization of the PathManager class may be refactored into
-    a generic support, perhaps in a metaclass.
+class PathManagerCmdLine(SourceManagerCmdLine):
+    """ This is the command line class proxy for the PathManager class.
     Refer to test_path_01.sh for example of usage.
     """
-    def __init__(self, args):
-        self._serial = args[0]
-        self._manager = None
-        self._cmd_name = args[1]
-        self._cmd_args = args[2:]
-
-    @staticmethod
-    def error(msg):
-        print >>sys.stderr, sys.argv[0] + ": error: "+ msg
-        sys.exit(1)
-
-    def _serialize_manager(self, manager, ostream = sys.stdout):
-        print >> ostream, yaml.dump(manager)
-
-    def _deserialize_manager(self, istream = sys.stdin):
-        return yaml.load(istream)
-
-    def _new_session(self, args_serials):
-        try:
-            params_stream = open(args_serials[0], "r")
-        except IOError, e:
-            self.error("can't open serial: " + str(e))
-        with params_stream:
-            params = yaml.load(params_stream)
-        self._manager = PathManager(params['name'], params['component'])
-
-    def _store_session(self):
-        try:
-            ofile = open(self._serial, "w")
-        except IOError, e:
-            self.error("can't write serial: " + str(e))
-        with ofile:
-            self._serialize_manager(self._manager, ofile)
-
-    def _restore_session(self):
-        try:
-            ifile = open(self._serial, "r")
-        except IOError, e:
-            self.error("can't open serial: " + str(e))
-        with ifile:
-            self._manager = self._deserialize_manager(ifile)
-
-    def run(self):
-        if self._cmd_name == "new":
-            self._new_session(self._cmd_args)
-        else:
-            self._restore_session()
-            dispatch = { 'execute': self._manager.execute,
-                         'extract': self._manager.extract,
-                         'extract_or_updt': self._manager.extract_or_updt,
-                         'update': self._manager.update,
-                         'commit': self._manager.commit,
-                         'rebase': self._manager.rebase,
-                         'deliver': self._manager.deliver,
-                         'dump': self._manager.dump,
-                         'dump_actual': self._manager.dump_actual,
-                         'dump_head': self._manager.dump_head,
-                         'list': self._manager.list }
-            if self._cmd_name in dispatch:
-                dispatch[self._cmd_name](self._cmd_args)
-            else:
-                print >>sys.stderr, "unexpected command, ignored: %s %s" % \
-                    (self._cmd_name, " ".join(self._cmd_args))
-        self._store_session()
+    manager_class_ = PathManager
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        PathManagerCmdLine._error("missing arguments. Usage: path.py serial cmd ...")
-    try:
-        PathManagerCmdLine(sys.argv[1:]).run()
-    except UserException, e:
-        print >>sys.stderr, "error: %s" % str(e)
-        sys.exit(1)
+    PathManagerCmdLine.main(sys.argv[1:])
 else:
     if verbose == 1:
         print "Loading " + __name__
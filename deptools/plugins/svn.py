@@ -28,8 +28,11 @@
 from subprocess import call
 from subprocess import check_call
 from subprocess import Popen, PIPE
-from plugins import SourceManager
-import os, sys, re
+from plugins import SourceManager, SourceManagerCmdLine
+from core import trace
+from core import schema
+from xml.etree import ElementTree
+import os, sys, urllib, hashlib, stat, shutil, tempfile
 import yaml
 
 verbose = 0
@@ -37,6 +40,8 @@ verbose = 0
 class SvnConfig:
     def __init__(self):
         self.svn = 'svn'
+        self.svnadmin = 'svnadmin'
+        self.svnsync = 'svnsync'
         self.verbose = 0
 
 class SvnManager(SourceManager):
@@ -48,50 +53,199 @@ class SvnManager(SourceManager):
     """
     plugin_name_ = "svn"
     plugin_description_ = "svn repository manager"
+
+    # Fields of the component
+    schema_ = schema.Record({ 'repos': schema.String(),
+                              'label': schema.String(),
+                              'alias': schema.String(),
+                              'revision': schema.Scalar(),
+                              'mirror': schema.Boolean() },
+                            required=['repos', 'label'])
     
     def __init__(self, name, component, config = SvnConfig()):
         self.name_ = name
         self.component = component
         self.config = config
-        if component['alias'] != None:
+        if component.get('alias') != None:
             self.basename = component['alias']
         else:
             self.basename = os.path.basename(self.component['repos'])
+        if component.get('revision') != None:
+            self.revision = str(component['revision'])
+        else:
+            self.revision = "HEAD"
         self.branch = component['label']
         if self.branch != "trunk":
             if not self.branch.startswith("tags/"):
                 if not self.branch.startswith("branches/"):
                     self.branch = "branches/" + self.branch
+        self.mirror = component.get('mirror')
+        if self.mirror == None:
+            self.mirror = False
+        if type(self.mirror) != type(True):
+            raise Exception, "mirror field must be either 'true' or 'false'"
         self.cwd = os.getcwd()
 
-    def _cmd(self, args):
+    def _cmd(self, args, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        check_call(args)
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            check_call(args, cwd=cwd)
+            span.set(status=0)
 
-    def _cmd_output(self, args):
+    def _cmd_output(self, args, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        return Popen(args, stdout=PIPE).communicate()[0]
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            proc = Popen(args, stdout=PIPE, cwd=cwd)
+            output = proc.communicate()[0]
+            span.set(status=proc.returncode, output_bytes=len(output))
+        return output
 
     def _subcmd(self, args):
         if not os.path.exists(self.basename):
             raise Exception, "path does not exist: " + self.basename
-        os.chdir(self.basename)
-        self._cmd(args)
-        os.chdir(self.cwd)
+        self._cmd(args, cwd=self.basename)
 
     def _subcmd_output(self, args):
         if not os.path.exists(self.basename):
             raise Exception, "path does not exist: " + self.basename
-        os.chdir(self.basename)
-        output = self._cmd_output(args)
-        os.chdir(self.cwd)
-        return output
+        return self._cmd_output(args, cwd=self.basename)
+
+    def _branch_url(self):
+        return self.component['repos'] + "/" + self.branch
+
+    def _get_cachedir(self):
+        dir = os.path.abspath(os.path.join(self.cwd,
+                                           ".deptools",
+                                           "cache",
+                                           "plugins",
+                                           self.plugin_name_))
+        return dir
+
+    def _get_mirror(self, root):
+        root_sha1sum = hashlib.sha1(root.encode("utf-8")).hexdigest()
+        return os.path.join(self._get_cachedir(),
+                            root_sha1sum[:2],
+                            root_sha1sum[2:],
+                            os.path.basename(root.rstrip("/")) or "repos")
+
+    def _create_mirror(self, mirror, root, uuid):
+        """ Creates and initializes the local mirror of the remote
+        repository root. The mirror is prepared in a temporary directory
+        and moved in place once initialized, such that an interrupted or
+        failed creation does not leave an uninitialized mirror behind.
+        """
+        if not os.path.isdir(os.path.dirname(mirror)):
+            os.makedirs(os.path.dirname(mirror))
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(mirror),
+                                  prefix=".tmp-" + os.path.basename(mirror))
+        try:
+            tmp_mirror = os.path.join(tmpdir, "repos")
+            self._cmd([self.config.svnadmin, 'create', tmp_mirror])
+            # svnsync requires revision properties changes on the mirror
+            hook = os.path.join(tmp_mirror, "hooks", "pre-revprop-change")
+            hook_file = open(hook, "w")
+            hook_file.write("#!/bin/sh\nexit 0\n")
+            hook_file.close()
+            os.chmod(hook, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP |
+                     stat.S_IROTH | stat.S_IXOTH)
+            # Same uuid such that the working copies can be relocated
+            self._cmd([self.config.svnadmin, 'setuuid', tmp_mirror, uuid])
+            self._cmd([self.config.svnsync, 'initialize',
+                       "file://" + urllib.pathname2url(tmp_mirror), root])
+            os.rename(tmp_mirror, mirror)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _sync_mirror(self):
+        """ Creates or incrementally synchronizes the local mirror of the
+        remote repository and returns the tuple (root, mirror_url), where
+        root is the remote repository root and mirror_url the URL of the
+        local mirror.
+        """
+        entries = self._parse_info(self._cmd_output(
+                [self.config.svn, 'info', '--xml', self.component['repos']]))
+        if len(entries) == 0:
+            raise Exception, "cannot access repository: " + self.component['repos']
+        root = entries[0].findtext('repository/root')
+        uuid = entries[0].findtext('repository/uuid')
+        if root == None or uuid == None:
+            raise Exception, "cannot get repository root: " + self.component['repos']
+        mirror = self._get_mirror(root)
+        mirror_url = "file://" + urllib.pathname2url(mirror)
+        if not os.path.exists(mirror):
+            self._create_mirror(mirror, root, uuid)
+        self._cmd([self.config.svnsync, 'synchronize', mirror_url])
+        return (root, mirror_url)
+
+    def _checkout(self):
+        revision = self.revision
+        if not self.mirror:
+            self._cmd([self.config.svn, 'checkout',
+                       self._branch_url() + "@" + revision, self.basename])
+            return
+        root, mirror_url = self._sync_mirror()
+        branch_path = self._normalize_url(self._branch_url())
+        root_path = self._normalize_url(root)
+        if not branch_path.startswith(root_path):
+            raise Exception, "repository not under its root: " + self._branch_url()
+        self._cmd([self.config.svn, 'checkout',
+                   mirror_url + urllib.quote(branch_path[len(root_path):]) +
+                   "@" + revision, self.basename])
+        self._subcmd([self.config.svn, 'relocate', mirror_url, root])
+
+    @staticmethod
+    def _parse_info(output):
+        """ Returns the list of entry elements from a svn info --xml output. """
+        try:
+            return ElementTree.fromstring(output).findall('entry')
+        except Exception, e:
+            raise Exception, "unexpected svn info output: " + str(e)
+
+    @staticmethod
+    def _normalize_url(url):
+        return urllib.unquote(url.strip()).rstrip("/")
+
+    @classmethod
+    def get_head_revisions(cls, managers):
+        """ Returns a map from component name to the HEAD revision of the
+        component branch on the remote server for all the given managers.
+        This is a single 'svn info' network request for all the managers.
+        Components whose branch can't be accessed are absent from the map.
+        """
+        if len(managers) == 0:
+            return {}
+        config = managers[0].config
+        args = [config.svn, 'info', '--xml', '-r', 'HEAD'] + \
+            [manager._branch_url() for manager in managers]
+        if config.verbose:
+            print " ".join(args)
+        with trace.span(" ".join(args), "subprocess", cwd=os.getcwd()) as span:
+            proc = Popen(args, stdout=PIPE)
+            output = proc.communicate()[0]
+            span.set(status=proc.returncode, output_bytes=len(output))
+        revisions = {}
+        for entry in cls._parse_info(output):
+            url = entry.findtext('url')
+            if url == None: continue
+            revisions[cls._normalize_url(url)] = entry.get('revision')
+        heads = {}
+        for manager in managers:
+            url = cls._normalize_url(manager._branch_url())
+            if url in revisions:
+                heads[manager.name()] = revisions[url]
+        return heads
 
     def name(self):
         return self.name_
 
+    def get_workdir(self):
+        """ Returns the directory where the commands are executed. """
+        return self.basename
+
     def execute(self, args):
         if self.config.verbose:
             print "Execute " + self.basename
@@ -104,7 +258,7 @@ class SvnManager(SourceManager):
             if os.path.exists(self.basename):
                 print "Cannot extract component " +  self.name_ + ", path exists: " + self.basename + ". Skipped."
                 return
-            self._cmd([self.config.svn, 'checkout', self.component['repos'] + "/" + self.branch + "@" + str(self.component['revision']), self.basename])
+            self._checkout()
         except Exception, e:
             raise Exception, "cannot clone component: " + str(e)
         
@@ -113,9 +267,9 @@ class SvnManager(SourceManager):
             print "Clone " + self.basename
         try:
             if os.path.exists(self.basename):
-                self._subcmd([self.config.svn, 'update', '-r', str(self.component['revision'])])
+                self._subcmd([self.config.svn, 'update', '-r', self.revision])
                 return
-            self._cmd([self.config.svn, 'checkout', self.component['repos'] + "/" + self.branch + "@" + str(self.component['revision']), self.basename])
+            self._checkout()
         except Exception, e:
             raise Exception, "cannot clone component: " + str(e)
         
@@ -123,7 +277,7 @@ class SvnManager(SourceManager):
         if self.config.verbose:
             print "Update " + self.basename
         try:
-            self._subcmd([self.config.svn, 'update', '-r', str(self.component['revision'])])
+            self._subcmd([self.config.svn, 'update', '-r', self.revision])
         except Exception, e:
             raise Exception, "cannot update component: " + str(e)
 
@@ -151,19 +305,24 @@ class SvnManager(SourceManager):
         print yaml.dump(self.component)
 
     def get_actual_revision(self):
+        # The working copy revision is read from the local metadata,
+        # without network access nor update of the working copy
         try:
-            self._subcmd_output([self.config.svn, 'update'])
-            revision_str = self._subcmd_output(
-                [self.config.svn, 'info', '-r', 'HEAD'])
-            revision_obj = re.search(
-                '^Revision: ([0-9]*)$', revision_str, re.MULTILINE)
-            revision = revision_obj.group(1)
+            entries = self._parse_info(self._subcmd_output(
+                    [self.config.svn, 'info', '--xml']))
+            if len(entries) == 0 or entries[0].get('revision') == None:
+                raise Exception, "missing working copy revision"
+            revision = entries[0].get('revision')
         except Exception, e:
             raise Exception, "cannot get actual revision: " + str(e)
         return revision
 
     def get_head_revision(self):
-        return "HEAD"
+        """ Returns the HEAD revision of the component branch on the server. """
+        heads = self.get_head_revisions([self])
+        if self.name_ not in heads:
+            raise Exception, "cannot get head revision: " + self._branch_url()
+        return heads[self.name_]
 
     def dump_actual(self, args = []):
         if self.config.verbose:
@@ -182,83 +341,21 @@ class SvnManager(SourceManager):
     def list(self, args = []):
         if self.config.verbose:
             print "List " + self.basename
-        if self.component['alias'] != None:
+        if self.component.get('alias') != None:
             alias_str = "," + self.component['alias']
         else:
             alias_str = ""
-        print self.name_ + "," + self.component['label'] + "@" + str(self.component['revision']) +  "," + self.component['repos'] + alias_str
-
-
-class SvnManagerCmdLine:
-    """ This is a comand line class proxy for the SvnManager class.
-    The principle is to maintain a serial file for the SvnManager object
-    and apply internal method to the deserialized file, then serialize
-    the object back to file.
-    The special command new starts a new session by creating an object
-    from a yaml dump of the constructors arguments.
-    There is probably a much better way to implement the exec_cmd function
-    by invoking directly the method name.
-    Also the serialization of the SvnManager class may be refactored into
-    a generic support, perhaps in a metaclass.
-    Refer to test_svn_01.sh for example of usage.
-    """
-    def __init__(self, args):
-        self._serial = args[0]
-        self._manager = None
-        self._exec_cmd(args[1], args[2:])
-
-    def _serialize_manager(self, manager, ostream = sys.stdout):
-        print >> ostream, yaml.dump(manager)
+        print self.name_ + "," + self.component['label'] + "@" + self.revision +  "," + self.component['repos'] + alias_str
 
-    def _deserialize_manager(self, istream = sys.stdin):
-        return yaml.load(istream)
 
-    def _new_session(self, args_serials):
-        params_stream = open(args_serials[0], "r")
-        params = yaml.load(params_stream)
-        self._manager = SvnManager(params['name'], params['component'])
-
-    def _store_session(self):
-        ofile = open(self._serial, "w")
-        self._serialize_manager(self._manager, ofile)
-
-    def _restore_session(self):
-        ifile = open(self._serial, "r")
-        self._manager = self._deserialize_manager(ifile)
-
-    def _exec_cmd(self, cmd_name, args):
-        if cmd_name == "new":
-            self._new_session(args)
-        else:
-            self._restore_session()
-            if cmd_name == "execute":
-                self._manager.execute(args)
-            elif cmd_name == "extract":
-                self._manager.extract(args)
-            elif cmd_name == "extract_or_updt":
-                self._manager.extract_or_updt(args)
-            elif cmd_name == "update":
-                self._manager.update(args)
-            elif cmd_name == "commit":
-                self._manager.commit(args)
-            elif cmd_name == "rebase":
-                self._manager.rebase(args)
-            elif cmd_name == "deliver":
-                self._manager.deliver(args)
-            elif cmd_name == "dump":
-                self._manager.dump(args)
-            elif cmd_name == "dump_actual":
-                self._manager.dump_actual(args)
-            elif cmd_name == "dump_head":
-                self._manager.dump_head(args)
-            elif cmd_name == "list":
-                self._manager.list(args)
-            else:
-                print "unexpected command: ignored: " + " ".join(args)
-        self._store_session()
+class SvnManagerCmdLine(SourceManagerCmdLine):
+    """ This is the command line class proxy for the SvnManager class.
+    Refer to test_svn_01.sh for example of usage.
+    """
+    manager_class_ = SvnManager
 
 if __name__ == "__main__":
-    SvnManagerCmdLine(sys.argv[1:])
+    SvnManagerCmdLine.main(sys.argv[1:])
 else:
     if verbose == 1:
         print "Loading " + __name__         
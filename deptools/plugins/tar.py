@@ -55,7 +55,10 @@
 #
  
 from subprocess import call, check_call, Popen, PIPE
-from plugins import SourceManager
+from plugins import SourceManager, SourceManagerCmdLine
+from core import trace
+from core import schema
+from core import state
 import os, sys
 import yaml
 import tempfile, shutil, hashlib
@@ -215,6 +218,18 @@ class TarManager(SourceManager):
     plugin_name_ = "tar"
     plugin_description_ = "tar archive manager"
 
+    # Fields of the component
+    schema_ = schema.Record({ 'repos': schema.Scalar(),
+                              'revision': schema.Scalar(),
+                              'alias': schema.Scalar(),
+                              'ignore_status': schema.Boolean(),
+                              'skip_dirs': schema.Integer(0) },
+                            required=['repos'])
+
+    # Digests of the cached archives by path, with the archive stat
+    # at the time of the digest, for long-running processes
+    digests_ = {}
+
     def __init__(self, name, component, config = TarConfig()):
         self.name_ = name
         self.config = config
@@ -226,50 +241,63 @@ class TarManager(SourceManager):
 
         # Initialise plugin from available fields
         self.repos = str(component.get('repos'))
-        self.revision = str(component.get('revision', "HEAD"))
+        self.revision = component.get('revision')
+        if self.revision == None:
+            self.revision = "HEAD"
+        self.revision = str(self.revision)
         uri = URI(self.repos)
-        self.alias = str(component.get('alias', uri.basename()))
+        self.alias = component.get('alias')
+        if self.alias == None:
+            self.alias = uri.basename()
+        self.alias = str(self.alias)
         self.basename = self.alias
         self.type = uri.type()
         self.scheme = uri.scheme()
         self.uri = uri.uri()
         self.remote = uri.remote()
         self.path = uri.path()
-        self.ignore_status = component.get("ignore_status", False)
+        self.ignore_status = component.get("ignore_status")
+        if self.ignore_status == None:
+            self.ignore_status = False
         if type(self.ignore_status) != type(True):
             raise Exception, "ignore_status field must be either 'true' or 'false'"
-        self.skip_dirs = component.get("skip_dirs", 0)
+        self.skip_dirs = component.get("skip_dirs")
+        if self.skip_dirs == None:
+            self.skip_dirs = 0
         if type(self.skip_dirs) != type(0) or self.skip_dirs < 0:
             raise Exception, "skip_dirs field must be a positive integer"
         self.cwd = os.getcwd()
 
-    def _cmd(self, args, ignore_status=False):
+    def _cmd(self, args, ignore_status=False, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        status = call(args)
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            status = call(args, cwd=cwd)
+            span.set(status=status)
         if not ignore_status and status != 0:
             raise Exception, ("command returned non-zero status " + str(status) +
                               ": " + " ".join(["'"+x+"'" for x in args]))
 
-    def _cmd_output(self, args):
+    def _cmd_output(self, args, cwd=None):
         if self.config.verbose:
             print " ".join(args)
-        return Popen(args, stdout=PIPE).communicate()[0]
+        with trace.span(" ".join(args), "subprocess", component=self.name_,
+                        cwd=os.path.abspath(cwd or os.curdir)) as span:
+            proc = Popen(args, stdout=PIPE, cwd=cwd)
+            output = proc.communicate()[0]
+            span.set(status=proc.returncode, output_bytes=len(output))
+        return output
     
     def _subcmd(self, args, ignore_status=True):
         if not os.path.exists(self.basename):
             raise Exception("path does not exist: " + self.basename)
-        os.chdir(self.basename)
-        self._cmd(args, ignore_status)
-        os.chdir(self.cwd)
+        self._cmd(args, ignore_status, cwd=self.basename)
 
     def _subcmd_output(self, args):
         if not os.path.exists(self.basename):
             raise Exception("path does not exist: " + self.basename)
-        os.chdir(self.basename)
-        output = self._cmd_output(args)
-        os.chdir(self.cwd)
-        return output
+        return self._cmd_output(args, cwd=self.basename)
 
     def _get_cachedir(self):
         dir = os.path.abspath(os.path.join(self.cwd,
@@ -352,6 +380,10 @@ class TarManager(SourceManager):
     def name(self):
         return self.name_
 
+    def get_workdir(self):
+        """ Returns the directory where the commands are executed. """
+        return self.basename
+
     def execute(self, args):
         if self.config.verbose:
             print "Execute " + self.basename
@@ -375,6 +407,30 @@ class TarManager(SourceManager):
             print "Update " + self.basename
         print "Update " + self.basename + ": nothing to do for archive"
 
+    def switch(self, previous):
+        if self.config.verbose:
+            print "Switch " + self.basename
+        if not os.path.exists(self.basename):
+            self.extract()
+            return
+        print "Switching component in '" + self.basename + "'"
+        # The previous extraction is restored if the new one fails
+        saved = self.basename + ".deptools-switch"
+        try:
+            self._fetch_archive()
+            self._check_revision()
+            os.rename(self.basename, saved)
+            try:
+                self._extract_archive()
+            except:
+                if os.path.exists(self.basename):
+                    shutil.rmtree(self.basename)
+                os.rename(saved, self.basename)
+                raise
+            shutil.rmtree(saved)
+        except Exception, e:
+            raise Exception("cannot switch component: " + str(e))
+
     def extract_or_updt(self, args = []):
         if self.config.verbose:
             print "Extract or update " + self.basename
@@ -404,15 +460,40 @@ class TarManager(SourceManager):
         print yaml.dump(self.component)
 
     def get_actual_revision(self):
+        archive = self._get_cached_archive()
+        try:
+            st = os.stat(archive)
+            stamp = (st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+        except OSError:
+            stamp = None
+        cached = self.digests_.get(archive)
+        if stamp != None and cached != None and cached[0] == stamp:
+            return cached[1]
         try:
-            output = self._cmd_output([self.config.sha1sum, self._get_cached_archive()])
+            output = self._cmd_output([self.config.sha1sum, archive])
         except Exception, e:
             raise Exception("cannot get actual revision: " + str(e))
-        return output.strip().split(" ")[0]
+        revision = output.strip().split(" ")[0]
+        if stamp != None:
+            self.digests_[archive] = (stamp, revision)
+        return revision
 
     def get_head_revision(self):
         return "HEAD"
 
+    def get_status(self):
+        """ Returns the status of the extraction, or None if not
+        extracted. The revision, the digest of the archive, is left to
+        the caller which may get it from the workspace state. """
+        if not os.path.exists(self.basename):
+            return None
+        return { 'revision': None }
+
+    def state_stamp(self):
+        """ Returns the stamp of the cached archive, whose digest is the
+        revision, and of the extracted directory. """
+        return state.stat_stamp([self._get_cached_archive(), self.basename])
+
     def dump_actual(self, args = []):
         if self.config.verbose:
             print "Dump_actual " + self.basename
@@ -433,86 +514,14 @@ class TarManager(SourceManager):
         print self.name_ + "," + self.revision +  "," + self.repos + "," + self.alias
 
 
-class TarManagerCmdLine:
-    """ This is a comand line class proxy for the TarManager class.
-    The principle is to maintain a serial file for the TarManager object
-    and apply internal method to the deserialized file, then serialize
-    the object back to file.
-    The special command new starts a new session by creating an object
-    from a yaml dump of the constructors arguments.
-    There is probably a much better way to implement the exec_cmd function
-    by invoking directly the method name.
-    Also the serialization of the TarManager class may be refactored into
-    a generic support, perhaps in a metaclass.
-    Refer to test_git_01.sh for example of usage.
+class TarManagerCmdLine(SourceManagerCmdLine):
+    """ This is the command line class proxy for the TarManager class.
+    Refer to test_tar_01.sh for example of usage.
     """
-    def __init__(self, args):
-        self._serial = args[0]
-        self._manager = None
-        self._exec_cmd(args[1], args[2:])
-
-    @staticmethod
-    def error(msg):
-        print >>sys.stderr, sys.argv[0] + ": error: "+ msg
-        sys.exit(1)
-
-    def _serialize_manager(self, manager, ostream = sys.stdout):
-        print >> ostream, yaml.dump(manager)
-
-    def _deserialize_manager(self, istream = sys.stdin):
-        return yaml.load(istream)
-
-    def _new_session(self, args_serials):
-        try:
-            params_stream = open(args_serials[0], "r")
-        except IOError, e:
-            self.error("can't open serial: " + str(e))
-        with params_stream:
-            params = yaml.load(params_stream)
-        self._manager = TarManager(params['name'], params['component'])
-
-    def _store_session(self):
-        try:
-            ofile = open(self._serial, "w")
-        except IOError, e:
-            self.error("can't write serial: " + str(e))
-        with ofile:
-            self._serialize_manager(self._manager, ofile)
-
-    def _restore_session(self):
-        try:
-            ifile = open(self._serial, "r")
-        except IOError, e:
-            self.error("can't open serial: " + str(e))
-        with ifile:
-            self._manager = self._deserialize_manager(ifile)
-
-    def _exec_cmd(self, cmd_name, args):
-        if cmd_name == "new":
-            self._new_session(args)
-        else:
-            self._restore_session()
-            dispatch = { 'execute': self._manager.execute,
-                         'extract': self._manager.extract,
-                         'extract_or_updt': self._manager.extract_or_updt,
-                         'update': self._manager.update,
-                         'commit': self._manager.commit,
-                         'rebase': self._manager.rebase,
-                         'deliver': self._manager.deliver,
-                         'dump': self._manager.dump,
-                         'dump_actual': self._manager.dump_actual,
-                         'dump_head': self._manager.dump_head,
-                         'list': self._manager.list }
-            if cmd_name in dispatch:
-                dispatch[cmd_name](args)
-            else:
-                print "unexpected command, ignored: " + cmd_name + " ".join(args)
-        self._store_session()
+    manager_class_ = TarManager
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        TarManagerCmdLine._error("missing arguments. Usage: git.py serial cmd ...")
-    TarManagerCmdLine(sys.argv[1:])
+    TarManagerCmdLine.main(sys.argv[1:])
 else:
     if verbose == 1:
         print "Loading " + __name__         
@@ -0,0 +1,201 @@
+#!/bin/sh
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+set -e
+
+[ "$DEBUG" = "" ] || set -x
+
+error() {
+    echo "error: $*"
+    exit 1
+}
+
+dir=`dirname $0`
+dir=`cd $dir; pwd`
+TEST="env PYTHONPATH=$dir/.. python $dir/git.py"
+
+tmpdir=`mktemp -d -t tmp.XXXXXX`
+tmpbase=`basename $0 .sh`.tmp
+
+cd $tmpdir
+cwd=$tmpdir
+
+# Be sure that git is present
+git --version || error "git: command not found. Git must be installed for the git plugin to work"
+
+# Be sure we are not in a git repository while performing this test
+git rev-parse --git-dir >/dev/null 2>&1 && \
+    echo "error: this script must not run in a git repository" && exit 1
+
+# Clean from previous runs
+rm -rf ${tmpbase}*
+
+# Prepare tree from work dir and push to a new git reference
+mkdir -p ${tmpbase}.1.work
+cd ${tmpbase}.1.work
+git init
+echo "a file" >afile
+git add afile
+git commit -m 'Added afile'
+rev1=`git rev-parse HEAD`
+git clone --bare . $cwd/${tmpbase}.1.git
+git remote add origin $cwd/${tmpbase}.1.git
+cd ..
+
+# Check the shared and worktree clone modes
+for mode in shared worktree; do
+    cat >${tmpbase}.$mode.dep <<EOF2
+name: a_test_dep
+component:
+  alias: ${tmpbase}.$mode
+  format: git
+  label: master
+  repos: $cwd/${tmpbase}.1.git
+  clone_mode: $mode
+EOF2
+    $TEST ${tmpbase}.$mode.ser new ${tmpbase}.$mode.dep
+    $TEST ${tmpbase}.$mode.ser extract
+    $TEST ${tmpbase}.$mode.ser extract # second extract should be ok
+    [ -f ${tmpbase}.$mode/afile ] || error "missing afile in $mode extraction"
+    [ ! -d ${tmpbase}.$mode/.git/objects/pack ] || \
+        [ "`ls ${tmpbase}.$mode/.git/objects/pack`" = "" ] || \
+        error "objects copied in $mode extraction"
+    $TEST ${tmpbase}.$mode.ser execute touch $mode.file
+    $TEST ${tmpbase}.$mode.ser execute git add $mode.file
+    $TEST ${tmpbase}.$mode.ser commit -m "Added empty $mode.file"
+    $TEST ${tmpbase}.$mode.ser rebase
+    $TEST ${tmpbase}.$mode.ser deliver
+    $TEST ${tmpbase}.$mode.ser update
+    $TEST ${tmpbase}.$mode.ser dump_actual
+    $TEST ${tmpbase}.$mode.ser list
+done
+
+# The worktree extraction must follow upstream changes
+[ -f ${tmpbase}.worktree/shared.file ] || error "missing shared.file in worktree extraction"
+
+# Check extraction of a pinned revision, behind the label tip
+for mode in reference shared worktree; do
+    cat >${tmpbase}.pinned-$mode.dep <<EOF2
+name: a_test_dep
+component:
+  alias: ${tmpbase}.pinned-$mode
+  format: git
+  label: master
+  repos: $cwd/${tmpbase}.1.git
+  revision: $rev1
+  clone_mode: $mode
+EOF2
+    $TEST ${tmpbase}.pinned-$mode.ser new ${tmpbase}.pinned-$mode.dep
+    $TEST ${tmpbase}.pinned-$mode.ser extract
+    [ -f ${tmpbase}.pinned-$mode/afile ] || error "missing afile in pinned $mode extraction"
+    [ ! -f ${tmpbase}.pinned-$mode/shared.file ] || error "unexpected shared.file in pinned $mode extraction"
+    [ "`cd ${tmpbase}.pinned-$mode && git rev-parse HEAD`" = "$rev1" ] || error "unexpected revision in pinned $mode extraction"
+    [ "`cd ${tmpbase}.pinned-$mode && git status --porcelain`" = "" ] || error "unclean pinned $mode extraction"
+done
+
+# Unknown revision must be rejected before cloning
+cat >${tmpbase}.unknown.dep <<EOF
+name: a_test_dep
+component:
+  alias: ${tmpbase}.unknown
+  format: git
+  repos: $cwd/${tmpbase}.1.git
+  revision: 0123456789abcdef0123456789abcdef01234567
+EOF
+$TEST ${tmpbase}.unknown.ser new ${tmpbase}.unknown.dep
+$TEST ${tmpbase}.unknown.ser extract && exit 1
+[ ! -d ${tmpbase}.unknown ] || error "unexpected extraction of unknown revision"
+
+# Check pooled cat-file queries
+env PYTHONPATH=$dir/..:$dir python -c "
+import git
+repo = git.GitCatFile.get('${tmpbase}.1.git')
+assert repo.resolve('master') == '`cd ${tmpbase}.1.git && git rev-parse master`'
+assert repo.resolve('$rev1') == '$rev1'
+assert repo.exists('master:afile')
+assert repo.contents('$rev1:afile') == ('blob', 'a file\\n')
+assert repo.info('unknown') == None
+assert not repo.exists('unknown\\nmaster')
+"
+
+# Prepare a repository with subdirectories for sparse extractions
+mkdir -p ${tmpbase}.2.work
+cd ${tmpbase}.2.work
+git init
+mkdir -p sub1 sub2/sub3
+echo "a file" >afile
+echo "b file" >sub1/bfile
+echo "c file" >sub2/cfile
+echo "d file" >sub2/sub3/dfile
+git add afile sub1 sub2
+git commit -m 'Added tree'
+git clone --bare . $cwd/${tmpbase}.2.git
+cd ..
+
+# Check sparse extraction for all clone modes
+for mode in reference shared worktree; do
+    cat >${tmpbase}.sparse-$mode.dep <<EOF2
+name: a_test_dep
+component:
+  alias: ${tmpbase}.sparse-$mode
+  format: git
+  repos: $cwd/${tmpbase}.2.git
+  clone_mode: $mode
+  sparse: [ sub2/sub3 ]
+EOF2
+    $TEST ${tmpbase}.sparse-$mode.ser new ${tmpbase}.sparse-$mode.dep
+    $TEST ${tmpbase}.sparse-$mode.ser extract
+    $TEST ${tmpbase}.sparse-$mode.ser update
+    [ -f ${tmpbase}.sparse-$mode/afile ] || error "missing afile in sparse $mode extraction"
+    [ -f ${tmpbase}.sparse-$mode/sub2/sub3/dfile ] || error "missing dfile in sparse $mode extraction"
+    [ ! -f ${tmpbase}.sparse-$mode/sub1/bfile ] || error "unexpected bfile in sparse $mode extraction"
+    # In cone mode the files of the parent directories are also present
+    [ -f ${tmpbase}.sparse-$mode/sub2/cfile ] || error "missing cfile in sparse $mode extraction"
+done
+
+# Bad clone mode must be rejected
+cat >${tmpbase}.bad.dep <<EOF
+name: a_test_dep
+component:
+  format: git
+  repos: $cwd/${tmpbase}.1.git
+  clone_mode: copy
+EOF
+$TEST ${tmpbase}.bad.ser new ${tmpbase}.bad.dep && exit 1
+
+# Now checks that the repository is ok
+git clone ${tmpbase}.1.git ${tmpbase}.final
+cd ${tmpbase}.final
+[ -f afile -a  "`cat afile`" = "a file" ] || error "missing afile"
+[ -f shared.file -a "`cat shared.file`" = "" ] || error "missing shared.file"
+[ -f worktree.file -a "`cat worktree.file`" = "" ] || error "missing worktree.file"
+
+# Notify success
+echo SUCCESS
+
+rm -rf $tmpdir
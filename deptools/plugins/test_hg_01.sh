@@ -0,0 +1,101 @@
+#!/bin/sh
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Check the hg plugin pooled store in the deptools cache
+#
+set -e
+
+[ "$DEBUG" = "" ] || set -x
+
+error() {
+    echo "error: $*"
+    exit 1
+}
+
+dir=`dirname $0`
+dir=`cd $dir; pwd`
+TEST="env PYTHONPATH=$dir/.. python $dir/hg.py"
+
+tmpdir=`mktemp -d -t tmp.XXXXXX`
+tmpbase=`basename $0 .sh`.tmp
+
+cd $tmpdir
+cwd=$tmpdir
+
+# Be sure that hg is present
+hg --version >/dev/null || error "hg: command not found. Mercurial must be installed for the hg plugin to work"
+hg --version | head -n 1
+
+# Be sure we are not in a hg repository while performing this test
+hg root >/dev/null 2>&1 && \
+    echo "error: this script must not run in a hg repository" && exit 1
+
+# Prepare dependency specs of two components of the same remote
+for alias in a b; do
+    cat >${tmpbase}.$alias.dep <<EOF
+name: $alias
+component:
+  alias: ${tmpbase}.$alias
+  format: hg
+  repos: $cwd/${tmpbase}.repo
+EOF
+    $TEST ${tmpbase}.$alias.ser new ${tmpbase}.$alias.dep
+done
+
+# A failed clone of the remote leaves no store in the cache
+$TEST ${tmpbase}.a.ser extract && error "unexpected extraction of missing remote"
+[ "`find .deptools/cache/plugins/hg -mindepth 3 -maxdepth 3`" = "" ] || error "unexpected store after failed clone"
+
+# Prepare the remote repository
+hg init ${tmpbase}.repo
+(cd ${tmpbase}.repo &&
+    echo "a file" >afile &&
+    hg add afile &&
+    hg commit -u test -m "Added afile")
+
+# The store is cloned once and shared by the components
+$TEST ${tmpbase}.a.ser extract
+$TEST ${tmpbase}.b.ser extract
+[ -f ${tmpbase}.a/afile -a -f ${tmpbase}.b/afile ] || error "missing afile in extractions"
+[ "`find .deptools/cache/plugins/hg -mindepth 3 -maxdepth 3 | wc -l`" = 1 ] || error "unexpected stores in the cache"
+store=`find .deptools/cache/plugins/hg -mindepth 3 -maxdepth 3`
+[ "`cat ${tmpbase}.a/.hg/sharedpath`" = "$cwd/$store/.hg" ] || error "extraction not sharing the cached store"
+
+# Updates pull the new changes through the store
+(cd ${tmpbase}.repo &&
+    echo "b file" >bfile &&
+    hg add bfile &&
+    hg commit -u test -m "Added bfile")
+$TEST ${tmpbase}.b.ser update
+[ -f ${tmpbase}.b/bfile ] || error "missing bfile after update"
+
+# Notify success
+echo SUCCESS
+
+rm -rf $tmpdir
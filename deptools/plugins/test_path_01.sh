@@ -124,6 +124,12 @@ $TEST ${tmpbase}.4.ser commit
 $TEST ${tmpbase}.4.ser rebase
 $TEST ${tmpbase}.4.ser deliver
 
+# Session files are versioned json maps, other contents are rejected
+grep '"format":"deptools-session"' ${tmpbase}.1.ser || error "unexpected session format"
+echo "!!python/object/apply:os.system [ 'touch ${tmpbase}.unsafe' ]" >${tmpbase}.5.ser
+$TEST ${tmpbase}.5.ser list && exit 1
+[ ! -f ${tmpbase}.unsafe ] || error "unsafe session loaded"
+
 # Notify success
 echo SUCCESS
 
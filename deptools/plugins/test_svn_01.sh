@@ -102,11 +102,60 @@ svn update
 svn commit -m 'Added dfile'
 cd ../..
 
+# Actual revision must be read from the working copy, without update
+revision=`svn info --xml ${tmpbase}.dep | sed -n 's/.*revision="\([0-9]*\)".*/\1/p' | head -1`
+$TEST ${tmpbase}.1.ser dump_actual | grep -E "revision: '?$revision'?[,}]" || error "unexpected actual revision"
+[ ! -f ${tmpbase}.dep/dfile ] || error "unexpected update of working copy"
+
 # A second deptools session
 $TEST ${tmpbase}.1.ser update
 $TEST ${tmpbase}.1.ser execute svn add cfile
 $TEST ${tmpbase}.1.ser commit -m 'Added empty cfile'
 
+# A session with a local mirror of the repository
+cat >${tmpbase}.2.dep <<EOF
+name: a_mirror_test_dep
+component:
+  alias: ${tmpbase}.mirror
+  format: svn
+  label: trunk
+  repos: file://$cwd/${tmpbase}.1
+  revision: HEAD
+  mirror: true
+EOF
+$TEST ${tmpbase}.2.ser new ${tmpbase}.2.dep
+$TEST ${tmpbase}.2.ser extract
+[ -d .deptools/cache/plugins/svn ] || error "missing svn mirror"
+[ -f ${tmpbase}.mirror/cfile ] || error "missing cfile in mirror extraction"
+svn info ${tmpbase}.mirror | grep "^URL: file://$cwd/${tmpbase}.1/trunk$" || error "mirror extraction not relocated"
+$TEST ${tmpbase}.2.ser update
+
+# The head revisions of the svn components are queried in a single request
+cat >${tmpbase}.deps <<EOF
+configurations:
+  default: [ a, b ]
+repositories:
+  a:
+    format: svn
+    label: trunk
+    repos: file://$cwd/${tmpbase}.1
+    alias: ${tmpbase}.dep
+  b:
+    format: svn
+    label: trunk
+    repos: file://$cwd/${tmpbase}.1
+    alias: ${tmpbase}.mirror
+EOF
+head=`svn info --xml -r HEAD file://$cwd/${tmpbase}.1/trunk | sed -n 's/.*revision="\([0-9]*\)".*/\1/p' | head -1`
+python $dir/../deptool.py -f ${tmpbase}.deps --trace ${tmpbase}.trace.json dump_head >${tmpbase}.head
+[ "`grep -cE "revision: '?$head'?[,}]" ${tmpbase}.head`" = 2 ] || error "unexpected head revisions"
+python -c "
+import json
+events = json.load(open('${tmpbase}.trace.json'))['traceEvents']
+names = [event['name'] for event in events if event['ph'] == 'X']
+assert len([name for name in names if name.startswith('svn info --xml -r HEAD ')]) == 1, names
+"
+
 # Now checks that the repository is ok
 svn co file://$cwd/${tmpbase}.1/trunk ${tmpbase}.final
 cd ${tmpbase}.final
@@ -0,0 +1,68 @@
+#!/bin/sh
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Check the benchmark harness on a small generated workspace
+#
+set -e
+
+[ "$DEBUG" = "" ] || set -x
+
+error() {
+    echo "error: $*"
+    exit 1
+}
+
+dir=`dirname $0`
+dir=`cd $dir; pwd`
+
+tmpdir=`mktemp -d -t tmp.XXXXXX`
+tmpbase=`basename $0 .sh`.tmp
+
+cd $tmpdir
+
+python $dir/benchmark.py --git 2 --git-files 4 --archives 2 --archive-files 4 \
+    --paths 1 --path-files 4 --file-size 100 --iterations 2 \
+    --workdir ${tmpbase}.work --output ${tmpbase}.json
+[ ! -d ${tmpbase}.work ] || error "unexpected remaining benchmark files"
+python -c "
+import json
+results = json.load(open('${tmpbase}.json'))
+assert results['format'] == 'deptools-benchmark'
+phases = [result['phase'] for result in results['results']]
+assert phases == ['extract', 'update', 'dump_actual', 'dump_actual_state', 'digest'], phases
+for result in results['results']:
+    assert len(result['times']) == 2
+    assert 0 < result['min'] <= result['median'] <= max(result['times'])
+"
+python $dir/benchmark.py --archive-formats rar && exit 1
+
+# Notify success
+echo SUCCESS
+
+rm -rf $tmpdir
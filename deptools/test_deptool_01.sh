@@ -0,0 +1,364 @@
+#!/bin/sh
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Check deptool commands on a workspace of local git repositories
+#
+set -e
+
+[ "$DEBUG" = "" ] || set -x
+
+error() {
+    echo "error: $*"
+    exit 1
+}
+
+dir=`dirname $0`
+dir=`cd $dir; pwd`
+DEPTOOL="python $dir/deptool.py"
+
+tmpdir=`mktemp -d -t tmp.XXXXXX`
+tmpbase=`basename $0 .sh`.tmp
+
+cd $tmpdir
+cwd=$tmpdir
+
+# Be sure we are not in a git repository while performing this test
+git rev-parse --git-dir >/dev/null 2>&1 && \
+    echo "error: this script must not run in a git repository" && exit 1
+
+# Prepare repositories
+for repo in a b c; do
+    mkdir -p ${tmpbase}.$repo.work
+    (cd ${tmpbase}.$repo.work &&
+        git init &&
+        echo "$repo file" >$repo.file &&
+        git add $repo.file &&
+        git commit -m "Added $repo.file" &&
+        git clone --bare . $cwd/${tmpbase}.$repo.git)
+done
+
+# Prepare dependency file
+cat >DEPENDENCIES <<EOF
+configurations:
+  default: [ a, b ]
+  other: [ c ]
+repositories:
+  a:
+    format: git
+    repos: $cwd/${tmpbase}.a.git
+  b:
+    format: git
+    repos: $cwd/${tmpbase}.b.git
+    clone_mode: worktree
+  c:
+    format: git
+    repos: $cwd/${tmpbase}.c.git
+    clone_mode: shared
+EOF
+
+$DEPTOOL extract
+[ -f ${tmpbase}.a/a.file ] || error "missing a.file"
+[ -f ${tmpbase}.b/b.file ] || error "missing b.file"
+$DEPTOOL -c other extract
+[ -f ${tmpbase}.c/c.file ] || error "missing c.file"
+$DEPTOOL list
+$DEPTOOL dump_actual
+
+# Concurrent revisions collection must give the sequential result
+$DEPTOOL --jobs 1 dump_actual >${tmpbase}.actual.1
+$DEPTOOL --jobs 4 dump_actual >${tmpbase}.actual.4
+cmp ${tmpbase}.actual.1 ${tmpbase}.actual.4 || error "unexpected concurrent dump_actual"
+$DEPTOOL --jobs 0 dump_actual && exit 1
+mv ${tmpbase}.b ${tmpbase}.b.saved
+$DEPTOOL --jobs 4 dump_actual 2>${tmpbase}.actual.err && exit 1
+mv ${tmpbase}.b.saved ${tmpbase}.b
+
+# Cache maintenance
+cachedir=.deptools/cache/plugins/git
+[ `ls -d $cachedir/*/*/*.git | wc -l` = 3 ] || error "unexpected cache content"
+$DEPTOOL cache maintain
+$DEPTOOL cache gc
+$DEPTOOL cache evict --max-size 0
+[ `ls -d $cachedir/*/*/*.git | wc -l` = 3 ] || error "unexpected eviction of used repositories"
+$DEPTOOL cache unknown && exit 1
+# Invalid repository entries are reported and skipped
+cp DEPENDENCIES ${tmpbase}.cache
+printf "  e:\n    format: git\n    repos: $cwd/${tmpbase}.e.git\n    clone_mode: unknown\n" >>${tmpbase}.cache
+$DEPTOOL -f ${tmpbase}.cache cache evict --max-size 0 2>${tmpbase}.cache.err
+grep -q "error: skipping invalid repository e: " ${tmpbase}.cache.err || error "missing invalid repository error"
+[ `ls -d $cachedir/*/*/*.git | wc -l` = 3 ] || error "unexpected eviction with invalid repository"
+
+# Repository c is no more referenced, it is evicted when not accessed recently
+sed -i -e '/^  c:/,$d' -e 's/^  other:.*$//' DEPENDENCIES
+$DEPTOOL cache evict --max-age 1
+[ `ls -d $cachedir/*/*/*.git | wc -l` = 3 ] || error "unexpected eviction of recent repository"
+$DEPTOOL cache evict --max-size 1K
+[ `ls -d $cachedir/*/*/*.git | wc -l` = 2 ] || error "missing eviction of unused repository"
+# The checkout of c borrowed objects from the evicted repository
+(cd ${tmpbase}.c && git fsck --no-dangling && git status >/dev/null) || error "broken checkout after eviction"
+$DEPTOOL update
+$DEPTOOL dump_actual
+
+# Trace export
+$DEPTOOL --trace ${tmpbase}.trace.json update 2>${tmpbase}.summary
+python -c "
+import json
+events = json.load(open('${tmpbase}.trace.json'))['traceEvents']
+names = [event['name'] for event in events if event['ph'] == 'X']
+assert 'update a' in names and 'update b' in names, names
+assert [name for name in names if name.startswith('git ')], names
+for event in events:
+    if event['ph'] == 'X':
+        assert event['dur'] >= 0 and 'io_read_bytes' in event['args']
+"
+grep -q "component: update a" ${tmpbase}.summary || error "missing component in trace summary"
+$DEPTOOL --trace ${tmpbase}.trace.json unknown && exit 1
+[ -f ${tmpbase}.trace.json ] || error "missing trace of failed command"
+
+# Validation reports all the errors at once
+$DEPTOOL check
+cat >${tmpbase}.invalid <<EOF
+configurations:
+  default: [ a, b, 1 ]
+  other: [ d ]
+repositories:
+  a:
+    format: git
+    clone_mode: copy
+  b:
+    format: tar
+    repos: b.tar
+    skip_dirs: -1
+EOF
+$DEPTOOL -f ${tmpbase}.invalid list 2>${tmpbase}.errors && exit 1
+grep -q "configurations.default\[2\]: value is not a string" ${tmpbase}.errors || error "missing configuration error"
+grep -q "repositories.a.repos: missing mandatory field" ${tmpbase}.errors || error "missing field error"
+grep -q "repositories.a.clone_mode: value must be one of" ${tmpbase}.errors || error "missing choice error"
+grep -q "repositories.b.skip_dirs: value must be an integer" ${tmpbase}.errors || error "missing integer error"
+grep -q "configurations.other" ${tmpbase}.errors && error "unexpected error for unused configuration"
+$DEPTOOL -f ${tmpbase}.invalid check 2>${tmpbase}.errors && exit 1
+grep -q "configurations.other: missing repository for component: d" ${tmpbase}.errors || error "missing repository error"
+# Valid components with optional fields omitted or null are accepted by the plugins
+cat >${tmpbase}.optional <<EOF
+configurations:
+  default: [ a, b, c ]
+repositories:
+  a:
+    format: hg
+    repos: $cwd/${tmpbase}.a.hg
+  b:
+    format: path
+    repos: $cwd
+    digest_content: null
+    ignore_status: null
+  c:
+    format: tar
+    repos: $cwd/c.tar
+    alias: null
+    skip_dirs: null
+EOF
+$DEPTOOL -f ${tmpbase}.optional check
+$DEPTOOL -f ${tmpbase}.optional list >${tmpbase}.list || error "list fails on checked dependencies"
+grep -q "^a,default@HEAD,$cwd/${tmpbase}.a.hg$" ${tmpbase}.list || error "unexpected list of hg component"
+
+# Queries on the dependencies index
+[ "`$DEPTOOL query components | tr '\n' ' '`" = "a b " ] || error "unexpected components query"
+[ "`$DEPTOOL query configurations b`" = "default" ] || error "unexpected configurations query"
+[ "`$DEPTOOL query repositories --revision HEAD | tr '\n' ' '`" = "a b " ] || error "unexpected repositories query"
+[ -f .deptools/index.db ] || error "missing index"
+$DEPTOOL dump_actual >${tmpbase}.pinned
+sed -i 's/^  default: .*/  default: [ a ]\n  other: [ b ]/' ${tmpbase}.pinned
+$DEPTOOL -f ${tmpbase}.pinned query repositories --revision HEAD >${tmpbase}.head
+[ ! -s ${tmpbase}.head ] || error "unexpected HEAD revisions in pinned dependencies"
+[ "`$DEPTOOL -f ${tmpbase}.pinned query configurations b`" = "other" ] || error "unexpected configurations query"
+sed -i 's/^  other: \[ b \]/  other: [ a, b ]/' ${tmpbase}.pinned
+[ "`$DEPTOOL -f ${tmpbase}.pinned query configurations a | tr '\n' ' '`" = "default other " ] || error "index not refreshed"
+[ "`$DEPTOOL query sql 'SELECT count(*) FROM files'`" = "2" ] || error "unexpected sql query"
+$DEPTOOL query sql 'SELECT unknown FROM files' && exit 1
+$DEPTOOL query sql 'DROP TABLE files' 2>${tmpbase}.sql.err && exit 1
+grep -q "readonly database" ${tmpbase}.sql.err || error "missing read-only error"
+[ "`$DEPTOOL query sql 'SELECT count(*) FROM files'`" = "2" ] || error "index modified by sql query"
+
+# Components selection
+[ "`$DEPTOOL --select a list | cut -d, -f1`" = "a" ] || error "unexpected selection by name"
+[ "`$DEPTOOL --select 'x*' --select '[ab]' list | wc -l`" = 2 ] || error "unexpected selection by pattern"
+[ "`$DEPTOOL --select-format tar list | wc -l`" = 0 ] || error "unexpected selection by format"
+[ "`$DEPTOOL --select-label 'mas*' list | wc -l`" = 0 ] || error "unexpected selection by label"
+cp DEPENDENCIES ${tmpbase}.previous
+[ "`$DEPTOOL --changed-since ${tmpbase}.previous list | wc -l`" = 0 ] || error "unexpected changed components"
+sed -i 's/^    clone_mode: worktree$/    clone_mode: shared/' ${tmpbase}.previous
+[ "`$DEPTOOL --changed-since ${tmpbase}.previous list | cut -d, -f1`" = "b" ] || error "missing changed component"
+$DEPTOOL --changed-since ${tmpbase}.previous update
+$DEPTOOL --changed-since ${tmpbase}.missing list && exit 1
+
+# Concurrent execution of a command in all the components
+$DEPTOOL execute -j 2 -- sh -c 'echo out; echo err >&2' >${tmpbase}.exec.out 2>${tmpbase}.exec.err
+grep -q "^a: out$" ${tmpbase}.exec.out && grep -q "^b: out$" ${tmpbase}.exec.out || error "missing prefixed output"
+grep -q "^a: err$" ${tmpbase}.exec.err && grep -q "^b: err$" ${tmpbase}.exec.err || error "missing prefixed error output"
+grep -q "^  b: exit 0, " ${tmpbase}.exec.err || error "missing execution summary"
+$DEPTOOL execute -- sh -c '[ ! -f a.file ]' 2>${tmpbase}.exec.err && exit 1
+grep -q "^  a: exit 1, " ${tmpbase}.exec.err || error "missing failure exit status"
+grep -q "^  b: skipped$" ${tmpbase}.exec.err || error "unexpected execution after failure"
+$DEPTOOL execute -j 2 --keep-going --output group -- sh -c 'ls; [ ! -f a.file ]' >${tmpbase}.exec.out 2>${tmpbase}.exec.err && exit 1
+grep -q "^==> b <==$" ${tmpbase}.exec.out || error "missing grouped output"
+grep -q "^  b: exit 0, " ${tmpbase}.exec.err || error "missing execution with --keep-going"
+$DEPTOOL execute -j 0 true && exit 1
+
+# Incremental move of the workspace between two manifests
+(cd ${tmpbase}.a.work &&
+    echo "a file v2" >a.file &&
+    git commit -a -m "Modified a.file" &&
+    git push $cwd/${tmpbase}.a.git HEAD:master)
+$DEPTOOL dump_actual >${tmpbase}.old
+a_revision=`git --git-dir=${tmpbase}.a.git rev-parse master`
+cat >${tmpbase}.new <<EOF
+configurations:
+  default: [ a, c ]
+repositories:
+  a:
+    format: git
+    repos: $cwd/${tmpbase}.a.git
+    revision: $a_revision
+  b:
+    format: git
+    repos: $cwd/${tmpbase}.b.git
+    clone_mode: worktree
+  c:
+    format: git
+    repos: $cwd/${tmpbase}.c.git
+EOF
+rm -rf ${tmpbase}.c
+$DEPTOOL sync --from ${tmpbase}.old --to ${tmpbase}.new --dry-run >${tmpbase}.changes
+grep -q "^revision: a (revision: .* -> $a_revision)" ${tmpbase}.changes || error "missing revision change"
+grep -q "^added: c$" ${tmpbase}.changes || error "missing added component"
+grep -q "^removed: b$" ${tmpbase}.changes || error "missing removed component"
+[ ! -d ${tmpbase}.c ] || error "unexpected extraction in dry run"
+$DEPTOOL --jobs 4 sync --from ${tmpbase}.old --to ${tmpbase}.new
+[ "`cat ${tmpbase}.a/a.file`" = "a file v2" ] || error "component not switched"
+[ -f ${tmpbase}.c/c.file ] || error "missing added component"
+[ -d ${tmpbase}.b ] || error "unexpected removal of component"
+[ "`$DEPTOOL -f ${tmpbase}.new sync --from ${tmpbase}.new`" = "" ] || error "unexpected changes"
+$DEPTOOL sync --from ${tmpbase}.missing && exit 1
+# The selection applies to the components of both dependency files
+[ "`$DEPTOOL -f ${tmpbase}.new --select-format tar sync --from ${tmpbase}.new`" = "" ] || error "unexpected changes of unselected components"
+# The components changing of alias are moved, clones and worktrees
+echo "c untracked" >${tmpbase}.c/c.untracked
+sed -e 's/^  default: .*$/  default: [ a, b, c ]/' ${tmpbase}.new >${tmpbase}.unmoved
+sed -e "s|^    repos: \(.*\.\([bc]\)\.git\)$|    repos: \1\n    alias: ${tmpbase}.\2.moved|" ${tmpbase}.unmoved >${tmpbase}.moved
+$DEPTOOL sync --from ${tmpbase}.unmoved --to ${tmpbase}.moved >${tmpbase}.changes
+grep -q "^alias: c " ${tmpbase}.changes || error "missing alias change"
+[ ! -d ${tmpbase}.b -a ! -d ${tmpbase}.c ] || error "unexpected components left behind"
+[ -f ${tmpbase}.c.moved/c.untracked ] || error "component not moved"
+$DEPTOOL cache gc
+(cd ${tmpbase}.b.moved && git status >/dev/null) || error "broken worktree after move"
+$DEPTOOL sync --from ${tmpbase}.moved --to ${tmpbase}.unmoved
+[ -f ${tmpbase}.b/b.file -a -f ${tmpbase}.c/c.untracked ] || error "component not moved back"
+rm ${tmpbase}.c/c.untracked
+
+# A component changing of format is extracted again in place
+mkdir -p ${tmpbase}.d.src/d && echo "d archive file" >${tmpbase}.d.src/d/d.file
+tar cf ${tmpbase}.d.tar -C ${tmpbase}.d.src d
+for format in git tar; do
+    cat >${tmpbase}.$format <<EOF
+configurations:
+  default: [ d ]
+repositories:
+  d:
+    format: $format
+    alias: ${tmpbase}.d
+EOF
+done
+echo "    repos: $cwd/${tmpbase}.c.git" >>${tmpbase}.git
+printf "    repos: $cwd/${tmpbase}.d.tar\n    skip_dirs: 1\n" >>${tmpbase}.tar
+$DEPTOOL -f ${tmpbase}.git extract
+[ -f ${tmpbase}.d/c.file ] || error "missing git component"
+$DEPTOOL sync --from ${tmpbase}.git --to ${tmpbase}.tar >${tmpbase}.changes
+grep -q "^format: d " ${tmpbase}.changes || error "missing format change"
+[ -f ${tmpbase}.d/d.file -a ! -d ${tmpbase}.d/.git ] || error "component not replaced"
+# The exit status of the commands does not depend on the output mode
+for output in direct prefix group; do
+    $DEPTOOL -f ${tmpbase}.tar execute --output $output false 2>${tmpbase}.exec.err && exit 1
+    grep -q "^  d: exit 1, " ${tmpbase}.exec.err || error "unexpected exit status with $output output"
+done
+
+# Workspace state skips the components known to be unchanged
+[ -f .deptools/state ] || error "missing workspace state"
+mv .deptools/state ${tmpbase}.state.saved
+$DEPTOOL -f ${tmpbase}.new dump_actual >${tmpbase}.actual.0
+$DEPTOOL -f ${tmpbase}.new dump_actual >${tmpbase}.actual.1
+cmp ${tmpbase}.actual.0 ${tmpbase}.actual.1 || error "unexpected dump_actual from state"
+grep -q '!!python' ${tmpbase}.actual.1 && error "unexpected python tags in dump_actual from state"
+$DEPTOOL -f ${tmpbase}.new --trace ${tmpbase}.state.json dump_actual >${tmpbase}.actual.2 2>/dev/null
+cmp ${tmpbase}.actual.1 ${tmpbase}.actual.2 || error "unexpected dump_actual from state"
+python -c "
+import json
+events = json.load(open('${tmpbase}.state.json'))['traceEvents']
+names = [event['name'] for event in events if event['ph'] == 'X']
+assert not [name for name in names if name.startswith('get_actual_revision ')], names
+"
+$DEPTOOL -f ${tmpbase}.new extract_or_updt >${tmpbase}.updt
+grep -q "^Skipping up to date component a$" ${tmpbase}.updt || error "missing skip of up to date component"
+(cd ${tmpbase}.a && echo "a file v3" >a.file && git commit -a -m "Modified a.file")
+a_head=`cd ${tmpbase}.a && git rev-parse HEAD`
+$DEPTOOL -f ${tmpbase}.new dump_actual | grep -q "revision: $a_head" || error "stale revision from state"
+echo "garbage" >.deptools/state
+$DEPTOOL -f ${tmpbase}.new dump_actual | grep -q "revision: $a_head" || error "unexpected revision with invalid state"
+
+# Status of all the components
+echo "c file modified" >${tmpbase}.c/c.file
+$DEPTOOL -f ${tmpbase}.new status >${tmpbase}.status
+[ "`awk '$1 == "a" { print $3, $4, $5, $6, $7 }' ${tmpbase}.status`" = "`echo $a_head | cut -c1-12` mismatch clean +1 -0" ] || error "unexpected status of a"
+[ "`awk '$1 == "c" { print $4, $5, $6, $7 }' ${tmpbase}.status`" = "- dirty +0 -0" ] || error "unexpected status of c"
+mv ${tmpbase}.c ${tmpbase}.c.saved
+[ "`$DEPTOOL -f ${tmpbase}.new status | awk '$1 == "c" { print $3 }'`" = "missing" ] || error "unexpected status of missing c"
+mv ${tmpbase}.c.saved ${tmpbase}.c
+git --git-dir=${tmpbase}.c.git tag -a -m "Tagged v1" v1 master
+sed 's/^    repos: \(.*c.git\)$/    repos: \1\n    revision: v1/' ${tmpbase}.new >${tmpbase}.tagged
+$DEPTOOL -f ${tmpbase}.tagged --select c update
+[ "`$DEPTOOL -f ${tmpbase}.tagged status | awk '$1 == "c" { print $4 }'`" = "ok" ] || error "unexpected status of c pinned to a tag"
+# Plugins without status report it unless their directory is missing
+cat >${tmpbase}.hg <<EOF
+configurations:
+  default: [ e ]
+repositories:
+  e:
+    format: hg
+    repos: $cwd/${tmpbase}.e.hg
+    label: default
+    revision: HEAD
+    alias: ${tmpbase}.e
+EOF
+[ "`$DEPTOOL -f ${tmpbase}.hg status | awk '$1 == "e" { print $3 }'`" = "missing" ] || error "unexpected status of missing e"
+mkdir ${tmpbase}.e
+[ "`$DEPTOOL -f ${tmpbase}.hg status | awk '$1 == "e" { print $3 }'`" = "unsupported" ] || error "unexpected status of e"
+
+# Notify success
+echo SUCCESS
+
+rm -rf $tmpdir
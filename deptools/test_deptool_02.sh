@@ -0,0 +1,148 @@
+#!/bin/sh
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Check the daemon mode of deptool
+#
+set -e
+
+[ "$DEBUG" = "" ] || set -x
+
+error() {
+    echo "error: $*"
+    exit 1
+}
+
+dir=`dirname $0`
+dir=`cd $dir; pwd`
+DEPTOOL="python $dir/deptool.py"
+CLIENT="python $dir/daemon.py"
+
+tmpdir=`mktemp -d -t tmp.XXXXXX`
+tmpbase=`basename $0 .sh`.tmp
+
+cd $tmpdir
+cwd=$tmpdir
+
+# Be sure we are not in a git repository while performing this test
+git rev-parse --git-dir >/dev/null 2>&1 && \
+    echo "error: this script must not run in a git repository" && exit 1
+
+# Prepare repositories
+for repo in a b; do
+    mkdir -p ${tmpbase}.$repo.work
+    (cd ${tmpbase}.$repo.work &&
+        git init &&
+        echo "$repo file" >$repo.file &&
+        git add $repo.file &&
+        git commit -m "Added $repo.file" &&
+        git clone --bare . $cwd/${tmpbase}.$repo.git)
+done
+
+cat >DEPENDENCIES <<EOF
+configurations:
+  default: [ a, b ]
+repositories:
+  a:
+    format: git
+    repos: $cwd/${tmpbase}.a.git
+  b:
+    format: git
+    repos: $cwd/${tmpbase}.b.git
+EOF
+
+# Without daemon, the client runs the command directly
+$CLIENT list >${tmpbase}.list.direct
+$DEPTOOL list >${tmpbase}.list.ref
+cmp ${tmpbase}.list.direct ${tmpbase}.list.ref || error "unexpected direct client output"
+
+# Start the daemon and wait for the socket
+$DEPTOOL --daemon --socket ${tmpbase}.sock >${tmpbase}.daemon.log 2>&1 &
+daemon_pid=$!
+trap "kill $daemon_pid 2>/dev/null || true" 0
+i=0
+while [ ! -S ${tmpbase}.sock ]; do
+    i=`expr $i + 1`
+    [ $i -lt 100 ] || error "daemon not started"
+    sleep 0.1
+done
+export DEPTOOLS_SOCKET=$cwd/${tmpbase}.sock
+
+$CLIENT extract
+[ -f ${tmpbase}.a/a.file ] || error "missing a.file"
+[ -f ${tmpbase}.b/b.file ] || error "missing b.file"
+$CLIENT list >${tmpbase}.list.daemon
+cmp ${tmpbase}.list.daemon ${tmpbase}.list.ref || error "unexpected daemon list output"
+$CLIENT dump_actual >${tmpbase}.actual.daemon
+$DEPTOOL dump_actual >${tmpbase}.actual.ref
+cmp ${tmpbase}.actual.daemon ${tmpbase}.actual.ref || error "unexpected daemon dump_actual output"
+# The parsed dependencies kept by the daemon are not modified by dump_actual
+$CLIENT dump | grep revision && error "unexpected revision in dependencies"
+
+# Dependency file changes are taken into account
+sed -i 's/default: \[ a, b \]/default: [ a ]/' DEPENDENCIES
+$CLIENT list >${tmpbase}.list.daemon
+[ `wc -l <${tmpbase}.list.daemon` = 1 ] || error "dependency file change not reloaded"
+
+# Errors status and output are forwarded, the daemon keeps running
+$CLIENT unknown_command 2>${tmpbase}.err && exit 1
+grep "unexpected command" ${tmpbase}.err || error "missing error output"
+$CLIENT -f ${tmpbase}.missing list 2>/dev/null && exit 1
+(cd ${tmpbase}.a && $CLIENT -f ../DEPENDENCIES list) | grep "^a," || error "unexpected output in subdirectory"
+printf 'echo out\necho err >&2\n' >${tmpbase}.script.sh
+$CLIENT execute sh $cwd/${tmpbase}.script.sh >${tmpbase}.out 2>${tmpbase}.err
+grep "^out$" ${tmpbase}.out || error "missing subprocess output"
+grep "^err$" ${tmpbase}.err || error "missing subprocess error output"
+
+# The commands reading the dependencies from the input run directly
+$CLIENT -f - list <DEPENDENCIES >${tmpbase}.list.stdin
+$DEPTOOL -f - list <DEPENDENCIES >${tmpbase}.list.ref
+cmp ${tmpbase}.list.stdin ${tmpbase}.list.ref || error "unexpected output with dependencies from input"
+
+$CLIENT --stop
+wait $daemon_pid
+[ ! -S ${tmpbase}.sock ] || error "socket not removed"
+
+[ -x $dir/daemon.py ] || error "daemon.py is not executable"
+
+# The plugins caches valid during a single run are reset for each request
+env PYTHONPATH=$dir python -c "
+import sys
+sys.argv = ['$dir/deptool.py']
+from plugins import SourceManager, PluginLoader
+PluginLoader()
+hg = SourceManager.get_plugin('hg')
+hg.pulled_.add('repository')
+SourceManager.new_run()
+assert not hg.pulled_
+"
+
+# Notify success
+echo SUCCESS
+
+rm -rf $tmpdir
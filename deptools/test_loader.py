@@ -0,0 +1,199 @@
+#
+# This software is delivered under the terms of the MIT License
+#
+# Copyright (c) 2009 Christophe Guillon <christophe.guillon.perso@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without
+# restriction, including without limitation the rights to use,
+# copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following
+# conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+
+#
+# Fuzz test of the dependency files fast loader against the yaml loader.
+# usage: test_loader.py [iterations] [seed]
+#
+
+import sys, random
+import yaml
+from core import loader
+
+# Mostly valid scalars and keys, and some unsupported or invalid ones
+scalars = [ "a", "git", "master", "HEAD", "foo bar", "a#b", "'http://host/x.git'",
+            "-1", "1", "0x1f", "017", "1_000", "1.5", "-.inf", ".nan", "1e3",
+            "true", "False", "yes", "off", "~", "null", "Null", "2001-12-14",
+            "2001-12-14t21:59:43.10-05:00", "a b c", "x-y", "0", "-a",
+            "'q'", "'it''s'", "\"dq\"", "'a: b'", "\"[x]\"", "''",
+            "!!null", "!!null ''", "\xc3\xa9t\xc3\xa9" ]
+exotic_scalars = [ "a:b", "http://host/x.git", "=", "<<", "\"a\\tb\"", "!!str x",
+                   "&a x", "*a", "a [1]", "a{b}", "?a", ":a", "%a", "@a", "|", ">",
+                   "a ?b", "!!null,", "[a]b" ]
+keys = [ "a", "b", "default", "repos", "format", "'q k'", "\"d k\"", "1", "true",
+         "null", "x y", "-k" ]
+exotic_keys = [ "<<", "a:b", "? c", "[k]", "&a k" ]
+spaces = [ "", " ", "  " ]
+comments = [ "", "", "", " # comment", "#c", " #", "  # x: [y" ]
+
+def choice(items):
+    return random.choice(items)
+
+def random_scalar():
+    if random.random() < 0.05:
+        return choice(exotic_scalars)
+    return choice(scalars)
+
+def random_key():
+    if random.random() < 0.05:
+        return choice(exotic_keys)
+    return choice(keys)
+
+def flow(depth):
+    if depth > 2 or random.random() < 0.5:
+        return random_scalar()
+    sep = choice([", ", ",", " , ", ",\n  ", ",\n"])
+    if random.random() < 0.5:
+        items = [flow(depth + 1) for i in range(random.randint(0, 4))]
+        return "[" + choice(spaces) + sep.join(items) + choice(spaces) + \
+            choice(["", "", ","]) + "]"
+    items = []
+    for i in range(random.randint(0, 4)):
+        if random.random() < 0.1:
+            items.append(random_key())
+        else:
+            items.append(random_key() + ":" + choice([" ", " ", " ", "", "  "]) + flow(depth + 1))
+    return "{" + choice(spaces) + sep.join(items) + choice(spaces) + "}"
+
+def block(indent, depth, lines):
+    prefix = " " * indent
+    for i in range(random.randint(1, 4)):
+        key = random_key()
+        if depth == 0 and random.random() < 0.3:
+            key = "repositories"
+        kind = random.random()
+        if depth < 3 and kind < 0.3:
+            lines.append("%s%s:%s" % (prefix, key, choice(comments)))
+            if random.random() < 0.2:
+                lines.append(choice(["", "  ", "# between"]))
+            block(indent + choice([1, 2, 4]), depth + 1, lines)
+        elif kind < 0.5:
+            lines.append("%s%s:%s" % (prefix, key, choice(comments)))
+            sub = indent + choice([0, 2, 2, 4])
+            for j in range(random.randint(1, 3)):
+                lines.append("%s-%s%s%s" % (" " * sub, choice([" ", "  "]), flow(2),
+                                            choice(comments)))
+        elif kind < 0.55:
+            lines.append("%s%s:%s" % (prefix, key, choice(comments)))
+        else:
+            lines.append("%s%s:%s%s%s" % (prefix, key, choice([" ", "  "]), flow(0),
+                                          choice(comments)))
+
+def document():
+    lines = []
+    if random.random() < 0.2:
+        lines.append("# header")
+    block(0, 0, lines)
+    text = "\n".join(lines) + choice(["", "\n", "\n\n", "\n# end\n"])
+    if random.random() < 0.1:
+        text = text.replace("\n", "\r\n")
+    return text
+
+def mutate(text):
+    for i in range(random.randint(1, 3)):
+        pos = random.randint(0, len(text))
+        op = random.random()
+        if op < 0.4:
+            text = text[:pos] + choice(list(" \n-:#,[]{}'\"!&*|>?%\t\r")) + text[pos:]
+        elif op < 0.8:
+            text = text[:pos] + text[pos + 1:]
+        else:
+            text = text[:pos] + text[pos:pos + 5] + text[pos:]
+    return text
+
+def materialize(data):
+    """ Constructs the lazy values, as dicts for the comparison. """
+    if isinstance(data, (dict, loader.LazyDict)):
+        return dict([(k, materialize(v)) for k, v in data.items()])
+    if isinstance(data, list):
+        return [materialize(v) for v in data]
+    return data
+
+def same(a, b):
+    if type(a) != type(b):
+        return False
+    if isinstance(a, dict):
+        return set(a.keys()) == set(b.keys()) and \
+            len([k for k in a if not same(a[k], b[k])]) == 0
+    if isinstance(a, list):
+        return len(a) == len(b) and \
+            len([i for i in range(len(a)) if not same(a[i], b[i])]) == 0
+    if isinstance(a, float) and a != a:
+        return b != b
+    return a == b
+
+# The yaml scanner may also fail on an assertion for some invalid documents
+errors = (yaml.YAMLError, AssertionError)
+
+def reference(text):
+    try:
+        return ("ok", yaml.load(text))
+    except errors:
+        return ("error", None)
+
+def check(text):
+    expected = reference(text)
+    try:
+        general = ("ok", materialize(loader.load_general(text)))
+    except errors:
+        general = ("error", None)
+    if general[0] != expected[0] or not same(general[1], expected[1]):
+        print >>sys.stderr, "mismatch for document:\n%r\ngeneral: %r\nyaml: %r" % \
+            (text, general, expected)
+        return False
+    try:
+        result = ("ok", materialize(loader.load(text)))
+    except errors:
+        result = ("error", None)
+    if result[0] != expected[0] or not same(result[1], expected[1]):
+        print >>sys.stderr, "mismatch for document:\n%r\nfast: %r\nyaml: %r" % \
+            (text, result, expected)
+        return False
+    try:
+        materialize(loader.FastLoader(text).load())
+        return "fast"
+    except (loader.Unsupported,) + errors:
+        return "fallback"
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    random.seed(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    stats = { "fast": 0, "fallback": 0, False: 0 }
+    for i in range(iterations):
+        text = document()
+        stats[check(text)] += 1
+        stats[check(mutate(text))] += 1
+    print "fast: %d, fallback: %d, mismatch: %d" % \
+        (stats["fast"], stats["fallback"], stats[False])
+    if stats[False] != 0:
+        sys.exit(1)
+    if stats["fast"] < iterations / 4:
+        print >>sys.stderr, "too few documents handled by the fast loader"
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
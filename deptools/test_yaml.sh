@@ -37,3 +37,26 @@ $PYTHON --version
 
 $PYTHON $dir/test_yaml.py
 
+
+# Check that regular files and streams are read identically
+tmpfile=`mktemp -t tmp.XXXXXX`
+printf 'a: [1, 2]\r\nb:\r\n  - "x\r\n  y"\r\n  - z\n\xc3\xa9: |\n  lit\n  eral\nc: {d: e}\n' >$tmpfile
+printf 'a: b\n  c: d\n' >$tmpfile.bad
+env PYTHONPATH=$dir $PYTHON -c "
+import yaml
+from StringIO import StringIO
+def tokens(stream):
+    return [(type(t), getattr(t, 'value', None),
+             t.start_mark.index, t.start_mark.line, t.start_mark.column,
+             t.end_mark.index, t.end_mark.line, t.end_mark.column)
+            for t in yaml.scan(stream)]
+data = open('$tmpfile').read()
+assert tokens(open('$tmpfile')) == tokens(StringIO(data)) == tokens(data)
+assert yaml.load(open('$tmpfile')) == yaml.load(StringIO(data))
+try:
+    yaml.load(open('$tmpfile.bad'))
+    assert False
+except yaml.YAMLError, e:
+    assert (e.problem_mark.line, e.problem_mark.column) == (1, 3), str(e)
+"
+rm -f $tmpfile $tmpfile.bad
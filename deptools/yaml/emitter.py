@@ -41,6 +41,10 @@ class Emitter(object):
         # The stream should have the methods `write` and possibly `flush`.
         self.stream = stream
 
+        # Output buffer, written to the stream by chunks.
+        self.buffer = []
+        self.buffer_size = 0
+
         # Encoding can be overriden by STREAM-START.
         self.encoding = None
 
@@ -782,14 +786,34 @@ class Emitter(object):
 
     # Writers.
 
+    BUFFER_SIZE = 65536
+
+    def write_data(self, data):
+        if self.encoding:
+            data = data.encode(self.encoding)
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+        if self.buffer_size >= self.BUFFER_SIZE:
+            self.write_buffer()
+
+    def write_buffer(self):
+        if self.buffer:
+            if self.encoding:
+                self.stream.write(''.join(self.buffer))
+            else:
+                self.stream.write(u''.join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
+
     def flush_stream(self):
+        self.write_buffer()
         if hasattr(self.stream, 'flush'):
             self.stream.flush()
 
     def write_stream_start(self):
         # Write BOM if needed.
         if self.encoding and self.encoding.startswith('utf-16'):
-            self.stream.write(u'\uFEFF'.encode(self.encoding))
+            self.write_data(u'\uFEFF')
 
     def write_stream_end(self):
         self.flush_stream()
@@ -804,9 +828,7 @@ class Emitter(object):
         self.indention = self.indention and indention
         self.column += len(data)
         self.open_ended = False
-        if self.encoding:
-            data = data.encode(self.encoding)
-        self.stream.write(data)
+        self.write_data(data)
 
     def write_indent(self):
         indent = self.indent or 0
@@ -817,9 +839,7 @@ class Emitter(object):
             self.whitespace = True
             data = u' '*(indent-self.column)
             self.column = indent
-            if self.encoding:
-                data = data.encode(self.encoding)
-            self.stream.write(data)
+            self.write_data(data)
 
     def write_line_break(self, data=None):
         if data is None:
@@ -828,22 +848,16 @@ class Emitter(object):
         self.indention = True
         self.line += 1
         self.column = 0
-        if self.encoding:
-            data = data.encode(self.encoding)
-        self.stream.write(data)
+        self.write_data(data)
 
     def write_version_directive(self, version_text):
         data = u'%%YAML %s' % version_text
-        if self.encoding:
-            data = data.encode(self.encoding)
-        self.stream.write(data)
+        self.write_data(data)
         self.write_line_break()
 
     def write_tag_directive(self, handle_text, prefix_text):
         data = u'%%TAG %s %s' % (handle_text, prefix_text)
-        if self.encoding:
-            data = data.encode(self.encoding)
-        self.stream.write(data)
+        self.write_data(data)
         self.write_line_break()
 
     # Scalar streams.
@@ -865,9 +879,7 @@ class Emitter(object):
                     else:
                         data = text[start:end]
                         self.column += len(data)
-                        if self.encoding:
-                            data = data.encode(self.encoding)
-                        self.stream.write(data)
+                        self.write_data(data)
                     start = end
             elif breaks:
                 if ch is None or ch not in u'\n\x85\u2028\u2029':
@@ -885,16 +897,12 @@ class Emitter(object):
                     if start < end:
                         data = text[start:end]
                         self.column += len(data)
-                        if self.encoding:
-                            data = data.encode(self.encoding)
-                        self.stream.write(data)
+                        self.write_data(data)
                         start = end
             if ch == u'\'':
                 data = u'\'\''
                 self.column += 2
-                if self.encoding:
-                    data = data.encode(self.encoding)
-                self.stream.write(data)
+                self.write_data(data)
                 start = end + 1
             if ch is not None:
                 spaces = (ch == u' ')
@@ -935,9 +943,7 @@ class Emitter(object):
                 if start < end:
                     data = text[start:end]
                     self.column += len(data)
-                    if self.encoding:
-                        data = data.encode(self.encoding)
-                    self.stream.write(data)
+                    self.write_data(data)
                     start = end
                 if ch is not None:
                     if ch in self.ESCAPE_REPLACEMENTS:
@@ -949,9 +955,7 @@ class Emitter(object):
                     else:
                         data = u'\\U%08X' % ord(ch)
                     self.column += len(data)
-                    if self.encoding:
-                        data = data.encode(self.encoding)
-                    self.stream.write(data)
+                    self.write_data(data)
                     start = end+1
             if 0 < end < len(text)-1 and (ch == u' ' or start >= end)   \
                     and self.column+(end-start) > self.best_width and split:
@@ -959,18 +963,14 @@ class Emitter(object):
                 if start < end:
                     start = end
                 self.column += len(data)
-                if self.encoding:
-                    data = data.encode(self.encoding)
-                self.stream.write(data)
+                self.write_data(data)
                 self.write_indent()
                 self.whitespace = False
                 self.indention = False
                 if text[start] == u' ':
                     data = u'\\'
                     self.column += len(data)
-                    if self.encoding:
-                        data = data.encode(self.encoding)
-                    self.stream.write(data)
+                    self.write_data(data)
             end += 1
         self.write_indicator(u'"', False)
 
@@ -1020,17 +1020,13 @@ class Emitter(object):
                     else:
                         data = text[start:end]
                         self.column += len(data)
-                        if self.encoding:
-                            data = data.encode(self.encoding)
-                        self.stream.write(data)
+                        self.write_data(data)
                     start = end
             else:
                 if ch is None or ch in u' \n\x85\u2028\u2029':
                     data = text[start:end]
                     self.column += len(data)
-                    if self.encoding:
-                        data = data.encode(self.encoding)
-                    self.stream.write(data)
+                    self.write_data(data)
                     if ch is None:
                         self.write_line_break()
                     start = end
@@ -1064,9 +1060,7 @@ class Emitter(object):
             else:
                 if ch is None or ch in u'\n\x85\u2028\u2029':
                     data = text[start:end]
-                    if self.encoding:
-                        data = data.encode(self.encoding)
-                    self.stream.write(data)
+                    self.write_data(data)
                     if ch is None:
                         self.write_line_break()
                     start = end
@@ -1082,9 +1076,7 @@ class Emitter(object):
         if not self.whitespace:
             data = u' '
             self.column += len(data)
-            if self.encoding:
-                data = data.encode(self.encoding)
-            self.stream.write(data)
+            self.write_data(data)
         self.whitespace = False
         self.indention = False
         spaces = False
@@ -1103,9 +1095,7 @@ class Emitter(object):
                     else:
                         data = text[start:end]
                         self.column += len(data)
-                        if self.encoding:
-                            data = data.encode(self.encoding)
-                        self.stream.write(data)
+                        self.write_data(data)
                     start = end
             elif breaks:
                 if ch not in u'\n\x85\u2028\u2029':
@@ -1124,9 +1114,7 @@ class Emitter(object):
                 if ch is None or ch in u' \n\x85\u2028\u2029':
                     data = text[start:end]
                     self.column += len(data)
-                    if self.encoding:
-                        data = data.encode(self.encoding)
-                    self.stream.write(data)
+                    self.write_data(data)
                     start = end
             if ch is not None:
                 spaces = (ch == u' ')
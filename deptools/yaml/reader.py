@@ -19,7 +19,7 @@ __all__ = ['Reader', 'ReaderError']
 
 from error import YAMLError, Mark
 
-import codecs, re
+import codecs, re, os, stat
 
 # Unfortunately, codec functions in Python 2.3 does not support the `finish`
 # arguments, so we have to write our own wrappers.
@@ -88,6 +88,7 @@ class Reader(object):
     #  - a `unicode` object,
     #  - a file-like object with its `read` method returning `str`,
     #  - a file-like object with its `read` method returning `unicode`.
+    # Regular files are read and decoded at once, as a string.
 
     # Yeah, it's ugly and slow.
 
@@ -112,6 +113,10 @@ class Reader(object):
             self.name = "<string>"
             self.raw_buffer = stream
             self.determine_encoding()
+        elif self.is_regular_file(stream):
+            self.name = getattr(stream, 'name', "<file>")
+            self.raw_buffer = stream.read()
+            self.determine_encoding()
         else:
             self.stream = stream
             self.name = getattr(stream, 'name', "<file>")
@@ -131,10 +136,11 @@ class Reader(object):
             self.update(length)
         return self.buffer[self.pointer:self.pointer+length]
 
+    LINE_BREAK = re.compile(u'[\n\x85\u2028\u2029]|\r(?!\n)')
     def forward(self, length=1):
         if self.pointer+length+1 >= len(self.buffer):
             self.update(length+1)
-        while length:
+        if length == 1:
             ch = self.buffer[self.pointer]
             self.pointer += 1
             self.index += 1
@@ -144,7 +150,21 @@ class Reader(object):
                 self.column = 0
             elif ch != u'\uFEFF':
                 self.column += 1
-            length -= 1
+            return
+        # Advance over the characters in bulk, from the last line break
+        start = self.pointer
+        end = start+length
+        line_start = start
+        for match in self.LINE_BREAK.finditer(self.buffer, start, end):
+            if match.end() == end and self.buffer[end-1:end+1] == u'\r\n':
+                continue
+            self.line += 1
+            line_start = match.end()
+        if line_start != start:
+            self.column = 0
+        self.column += end-line_start-self.buffer.count(u'\uFEFF', line_start, end)
+        self.pointer = end
+        self.index += length
 
     def get_mark(self):
         if self.stream is None:
@@ -154,6 +174,12 @@ class Reader(object):
             return Mark(self.name, self.index, self.line, self.column,
                     None, None)
 
+    def is_regular_file(self, stream):
+        try:
+            return stat.S_ISREG(os.fstat(stream.fileno()).st_mode)
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
+
     def determine_encoding(self):
         while not self.eof and len(self.raw_buffer) < 2:
             self.update_raw()